@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Thread scaling of the binning kernel in plots/ash_plot/ASH/binning.py
+against NumPy: one histogram (as in kde.kde and the rug) and the 50 shifted
+histograms of an ASH (calc_ash_den, shift_hists).
+
+    python benchmarks/bench_binning.py
+    python benchmarks/bench_binning.py --sizes 10000000 100000000 \
+        --threads 1 2 4 8 16 32 --json binning.json
+
+Threads default to powers of two up to the CPU count. Each row gives the
+best time, the speedup over NumPy and over the kernel on one thread.
+"""
+from __future__ import division, print_function
+
+import argparse
+import json
+import os
+import sys
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+import numpy as np
+
+from bench_numeric import environment, measure
+from plots.ash_plot.ASH import binning
+
+SIZES = [100000, 1000000, 10000000]
+BINS = 2**14
+SHIFT_NUM = 50
+ASH_BINS = 100
+
+
+def histogram_case(data):
+    lo, hi = data.min(), data.max()
+    return ((lambda: np.histogram(data, BINS, range=(lo, hi))),
+            (lambda threads: binning.histogram(data, BINS, (lo, hi),
+                                               threads=threads)))
+
+
+def shifted_case(data):
+    lo, hi = data.min(), data.max()
+    width = (hi - lo)/ASH_BINS
+    MIN, MAX = lo - width, hi + width
+    shift = width/SHIFT_NUM
+
+    def numpy_loop():
+        return [np.histogram(data, ASH_BINS + 1,
+                             range=(MIN + i*shift, MAX + i*shift - width))
+                for i in range(SHIFT_NUM)]
+    return (numpy_loop,
+            (lambda threads: binning.shifted(data, MIN, MAX, shift, width,
+                                             ASH_BINS + 1, SHIFT_NUM,
+                                             threads=threads)))
+
+
+CASES = {'histogram': histogram_case, 'shifted': shifted_case}
+
+
+def default_threads():
+    cpus = os.cpu_count() or 1
+    threads = [1]
+    while threads[-1]*2 <= cpus:
+        threads.append(threads[-1]*2)
+    if threads[-1] != cpus:
+        threads.append(cpus)
+    return threads
+
+
+def run(args):
+    results = []
+    for name in sorted(args.only or CASES):
+        for n in args.sizes:
+            data = np.random.RandomState(0).normal(10, 2, n)
+            numpy_func, kernel = CASES[name](data)
+            base = measure(numpy_func, (), args.min_time, args.repeat)
+            print('%-10s %10i  numpy      %10.2f ms' %
+                  (name, n, base['min_s']*1e3))
+            results.append(dict(base, case=name, n=n, threads=0))
+            single = None
+            for threads in args.threads:
+                timing = measure(kernel, (threads,), args.min_time,
+                                 args.repeat)
+                single = single or timing['min_s']
+                timing.update(case=name, n=n, threads=threads,
+                              vs_numpy=base['min_s']/timing['min_s'],
+                              vs_one=single/timing['min_s'])
+                results.append(timing)
+                print('%-10s %10i  %2i threads %10.2f ms  x%.2f numpy  '
+                      'x%.2f one thread' %
+                      (name, n, threads, timing['min_s']*1e3,
+                       timing['vs_numpy'], timing['vs_one']))
+                sys.stdout.flush()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--only', nargs='+', choices=sorted(CASES))
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--threads', type=int, nargs='+',
+                        default=default_threads())
+    parser.add_argument('--min-time', type=float, default=0.5)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args()
+
+    report = {'environment': environment(), 'results': run(args)}
+    if args.json:
+        with open(args.json, 'w') as fp:
+            json.dump(report, fp, indent=1)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Time the multi-cell CE plot (/ce_multi) against its render budget: parsing
+the long-format table and drawing every output type for a seeded lab of
+cells x cycles, 500 x 2000 by default.
+
+    python benchmarks/bench_ce_multi.py
+    python benchmarks/bench_ce_multi.py --cells 1000 --cycles 2000 --json ce.json
+
+Exits non-zero when parsing plus any one render takes longer than the
+budget of the ce_multi jobs, jobs.BUDGETS['ce_multi'] seconds.
+"""
+from __future__ import division, print_function
+
+import argparse
+import json
+import os
+import sys
+import time
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+import numpy as np
+
+from bench_numeric import environment
+from plots import jobs
+from plots.ce_plot import ce_multi
+
+CHART_TYPES = ['png', 'webp', 'pngat', 'svg']
+
+
+def table(cells, cycles, seed=0):
+    'Text of a long-format table of cells fading at random rates'
+    rng = np.random.RandomState(seed)
+    cycle = np.arange(1, cycles + 1)
+    fade = rng.uniform(0.01, 0.1, (cells, 1))
+    ce = 100 - 12*np.exp(-cycle/3.) - fade*np.log(cycle) - \
+        0.02*rng.rand(cells, cycles)
+    return '\n'.join('cell%i,%i,%.4f' % (i, j + 1, ce[i, j])
+                     for i in range(cells) for j in range(cycles))
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cells', type=int, default=500)
+    parser.add_argument('--cycles', type=int, default=2000)
+    parser.add_argument('--types', nargs='+', default=CHART_TYPES)
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args()
+
+    budget = jobs.BUDGETS['ce_multi']
+    text = table(args.cells, args.cycles)
+    parse, arrays = timed(ce_multi.parse_table, text)
+    print('%i cells x %i cycles, %.1f MB of text' %
+          (args.cells, args.cycles, len(text)/1e6))
+    print('%-8s %8.2f s' % ('parse', parse))
+    results = [{'stage': 'parse', 'seconds': parse}]
+    over = False
+    for chart_type in args.types:
+        secs, out = timed(ce_multi.ce_multi_png, *arrays, x_label='Cycle',
+                          y_label='CE', chart_type=chart_type)
+        size = out.getbuffer().nbytes
+        over = over or parse + secs > budget
+        results.append({'stage': chart_type, 'seconds': secs, 'bytes': size})
+        print('%-8s %8.2f s %10i bytes%s' %
+              (chart_type, secs, size,
+               '  over the %i s budget' % budget
+               if parse + secs > budget else ''))
+        sys.stdout.flush()
+
+    if args.json:
+        with open(args.json, 'w') as fp:
+            json.dump({'environment': environment(), 'cells': args.cells,
+                       'cycles': args.cycles, 'budget_s': budget,
+                       'results': results}, fp, indent=1)
+    return 1 if over else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Time the output encoders for each chart_type preset, and a few PNG
+compression levels for comparison, on ASH figures of increasing size.
+
+    python benchmarks/bench_encode.py --sizes 20 10000 100000 --json out.json
+
+Drawing is timed once per figure and reported separately, the encode column
+is savefig alone.
+"""
+from __future__ import division, print_function
+
+import argparse
+import json
+import os
+import sys
+import time
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np
+
+from plots import render
+from plots.ash_plot.ASH.ash import ash
+
+# name: (format, dpi, savefig options)
+VARIANTS = dict(render.OUTPUTS)
+VARIANTS.update({'png-z6': ('png', 100, {}),
+                 'png300-z1': ('png', 300, {'pil_kwargs':
+                                            {'compress_level': 1}}),
+                 'png300-z6': ('png', 300, {}),
+                 'webp300': ('webp', 300, {'pil_kwargs': {'lossless': True,
+                                                          'method': 0}})})
+
+
+def ash_figure(n, seed=0):
+    data = np.random.RandomState(seed).standard_normal(n)
+    fig = render.new_figure(figsize=(6, 6))
+    ash_obj = ash(data, force_scott=True)
+    ax = fig.add_subplot(111)
+    ax.plot(ash_obj.ash_mesh, ash_obj.ash_den, lw=2)
+    ash_obj.plot_ash_infill(ax, alpha=1)
+    ash_obj.plot_rug(ax, alpha=1)
+    ash_obj.plot_stats(ax)
+    fig.tight_layout()
+    return fig
+
+
+def best_of(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[20, 10000, 100000])
+    parser.add_argument('--variants', nargs='+', default=sorted(VARIANTS))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args()
+
+    results = []
+    print('%8s %-10s %4s %10s %10s %10s' %
+          ('N', 'variant', 'dpi', 'draw ms', 'encode ms', 'bytes'))
+    with render.style_context():
+        for n in args.sizes:
+            fig = ash_figure(n)
+            draw, _ = best_of(fig.canvas.draw, args.repeat)
+            for name in args.variants:
+                type_form, dpi, options = VARIANTS[name]
+
+                def encode():
+                    outs = BytesIO()
+                    fig.savefig(outs, dpi=dpi, format=type_form, **options)
+                    return outs.getbuffer().nbytes
+
+                secs, size = best_of(encode, args.repeat)
+                results.append({'n': n, 'variant': name, 'format': type_form,
+                                'dpi': dpi, 'draw_s': draw,
+                                'encode_s': secs, 'bytes': size})
+                print('%8i %-10s %4i %10.1f %10.1f %10i' %
+                      (n, name, dpi, draw*1e3, secs*1e3, size))
+
+    if args.json:
+        with open(args.json, 'w') as fp:
+            json.dump(results, fp, indent=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cold start cost of the app, measured with python -X importtime in a fresh
+interpreter for each run.
+
+    python benchmarks/bench_import.py --runs 5 --json import.json
+    python benchmarks/bench_import.py --module plots.ash_plot.ash_plot
+
+Reports the median cumulative import time of the module and the slowest
+imports under it, so a heavy import creeping back into bottle_plot shows up.
+"""
+from __future__ import division, print_function
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def importtime(module):
+    'Cumulative import time in microseconds of every module imported'
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                           'import ' + module],
+                          cwd=root, stderr=subprocess.PIPE,
+                          universal_newlines=True, check=True)
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values)//2]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--module', default='bottle_plot')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args()
+
+    runs = [importtime(args.module) for _ in range(args.runs)]
+    names = set().union(*runs)
+    result = dict((name, median([run.get(name, 0) for run in runs]))
+                  for name in names)
+    total = result[args.module]
+
+    print('%s: %.1f ms cumulative (median of %i)' %
+          (args.module, total/1e3, args.runs))
+    slowest = sorted(result.items(), key=lambda item: -item[1])
+    for name, usec in slowest[1:args.top + 1]:
+        print('%10.1f ms  %s' % (usec/1e3, name))
+
+    if args.json:
+        with open(args.json, 'w') as fp:
+            json.dump({'module': args.module, 'runs': args.runs,
+                       'total_us': total, 'modules_us': result}, fp, indent=1)
+
+
+if __name__ == '__main__':
+    main()
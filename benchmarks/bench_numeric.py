@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmarks for the numerical code behind the plots: every branch of
+ash(), kde.kde, kde.fixed_point, ash.calc_ash_unc, PeirceCriteria and the
+form parsing in form_valid.
+
+    python benchmarks/bench_numeric.py --json before.json
+    python benchmarks/bench_numeric.py --full --only ash_scott kde --json after.json
+    python benchmarks/bench_numeric.py --compare before.json after.json
+
+Inputs are seeded synthetic samples: normal, wide (a tight cluster with a
+few far outliers) and heavy tailed (Student t, 1.5 degrees of freedom), with
+N from 10 up to 1e5, or 1e7 with --full. Each case has a largest N it is
+run at so the slow paths finish; --max-n overrides it. Results are stored
+as JSON with the commit and library versions, and --compare prints the
+ratio of two runs.
+"""
+from __future__ import division, print_function
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+import numpy as np
+import scipy.fftpack
+
+from plots import form_valid as fv
+from plots.ash_plot.ASH import kde as kde_mod
+from plots.ash_plot.ASH.ash import ash
+from plots.ash_plot.ASH.peirce import PeirceCriteria
+
+SIZES = [10, 100, 1000, 10000, 100000]
+FULL_SIZES = SIZES + [1000000, 10000000]
+
+
+def sample(dist, n, seed=0):
+    rng = np.random.RandomState(seed)
+    if dist == 'normal':
+        return rng.normal(10, 2, n)
+    elif dist == 'wide':
+        data = rng.normal(0, 0.01, n)
+        data[:max(1, n//1000)] = rng.uniform(-1000, 1000, max(1, n//1000))
+        return data
+    elif dist == 'heavy':
+        return rng.standard_t(1.5, n)
+    raise ValueError(dist)
+
+
+class Field(object):
+    'Just enough of a wtforms field for the validators'
+    def __init__(self, data):
+        self.data = data
+
+
+class Form(object):
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+def fixed_point_args(data):
+    'The arguments kde.kde hands to brentq, for timing fixed_point alone'
+    n = 2**14
+    lo, hi = data.min(), data.max()
+    span = hi - lo
+    hist, _ = np.histogram(data, n, range=(lo - span/10, hi + span/10))
+    dct = scipy.fftpack.dct(hist/len(data), norm=None)
+    return (len(data), [i*i for i in range(1, n)], (dct[1:]/2)**2)
+
+
+def calc_ash_unc_setup(data):
+    obj = ash(data, force_scott=True)
+    return obj.calc_ash_unc
+
+
+def as_text(data):
+    'Data as pasted into the form, one value per line'
+    return '\n'.join(map(repr, data.tolist()))
+
+
+def quiet(func):
+    'PeirceCriteria prints every iteration'
+    def wrapper(*args):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return func(*args)
+    return wrapper
+
+
+# name: (largest N, setup(data) -> args, function)
+CASES = {
+    'ash_botev': (10000, lambda d: (d,),
+                  lambda d: ash(d)),
+    'ash_scott': (10000, lambda d: (d,),
+                  lambda d: ash(d, force_scott=True)),
+    'ash_fd': (10000, lambda d: (d,),
+               lambda d: ash(d, force_scott=True, rule='fd')),
+    'ash_bins': (10000, lambda d: (d,),
+                 lambda d: ash(d, bin_num=50)),
+    'kde': (10000000, lambda d: (d,), kde_mod.kde),
+    'kde_fixed_point': (10000000, fixed_point_args,
+                        lambda m, i, a2: kde_mod.fixed_point(0.01, m, i, a2)),
+    'calc_ash_unc': (10000, lambda d: (calc_ash_unc_setup(d),),
+                     lambda unc: unc()),
+    'peirce': (10000, lambda d: (d,), quiet(lambda d: PeirceCriteria(d, 1))),
+    'data_split': (10000000, lambda d: (as_text(d),),
+                   fv.data_split),
+    'validators': (1000000,
+                   lambda d: (Form(x=Field(as_text(d)),
+                                   y=Field(as_text(d))),),
+                   lambda form: [v(form, form.y) for v in
+                                 (fv.DataLength(min=2, max=10**8),
+                                  fv.DataLengthEqual('x'), fv.DataFloat())]),
+}
+DISTS = ['normal', 'wide', 'heavy']
+
+
+def measure(func, args, min_time, max_repeat):
+    times = []
+    start = time.perf_counter()
+    while len(times) < max_repeat and (not times or
+                                       time.perf_counter() - start < min_time):
+        t = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - t)
+    times.sort()
+    return {'min_s': times[0], 'median_s': times[len(times)//2],
+            'repeat': len(times)}
+
+
+def environment():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                         cwd=root, universal_newlines=True)
+    except (OSError, subprocess.CalledProcessError):
+        commit = ''
+    return {'commit': commit.strip(), 'python': platform.python_version(),
+            'numpy': np.__version__, 'scipy': scipy.__version__,
+            'machine': platform.machine(), 'cpus': os.cpu_count()}
+
+
+def run(args):
+    sizes = FULL_SIZES if args.full else SIZES
+    if args.sizes:
+        sizes = args.sizes
+    results = []
+    for name in sorted(args.only or CASES):
+        max_n, setup, func = CASES[name]
+        max_n = args.max_n or max_n
+        for dist in args.dists:
+            for n in sizes:
+                if n > max_n:
+                    continue
+                data = sample(dist, n)
+                try:
+                    timing = measure(func, setup(data), args.min_time,
+                                     args.repeat)
+                except (MemoryError, ValueError) as err:
+                    timing = {'error': '%s: %s' % (type(err).__name__, err)}
+                timing.update({'case': name, 'dist': dist, 'n': n})
+                results.append(timing)
+                if 'error' in timing:
+                    print('%-16s %-7s %9i  %s' % (name, dist, n,
+                                                  timing['error']))
+                else:
+                    print('%-16s %-7s %9i %12.3f ms  (x%i)' %
+                          (name, dist, n, timing['min_s']*1e3,
+                           timing['repeat']))
+                sys.stdout.flush()
+    return results
+
+
+def compare(old_path, new_path, threshold):
+    def load(path):
+        with open(path) as fp:
+            report = json.load(fp)
+        return report['environment'], dict(
+            ((r['case'], r['dist'], r['n']), r) for r in report['results'])
+    old_env, old = load(old_path)
+    new_env, new = load(new_path)
+    print('%s (%s) -> %s (%s)' % (old_path, old_env['commit'][:8],
+                                  new_path, new_env['commit'][:8]))
+    regressions = 0
+    for key in sorted(set(old) & set(new)):
+        if 'min_s' not in old[key] or 'min_s' not in new[key]:
+            continue
+        ratio = new[key]['min_s'] / old[key]['min_s']
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = '  slower'
+            regressions += 1
+        elif ratio < 1 - threshold:
+            flag = '  faster'
+        print('%-16s %-7s %9i %10.3f -> %10.3f ms  x%.2f%s' %
+              (key + (old[key]['min_s']*1e3, new[key]['min_s']*1e3, ratio,
+                      flag)))
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--only', nargs='+', choices=sorted(CASES))
+    parser.add_argument('--dists', nargs='+', choices=DISTS, default=DISTS)
+    parser.add_argument('--sizes', type=int, nargs='+')
+    parser.add_argument('--full', action='store_true',
+                        help='go up to 1e7 points')
+    parser.add_argument('--max-n', type=int,
+                        help='override the largest N of every case')
+    parser.add_argument('--min-time', type=float, default=0.2)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--json', help='write results to this file')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'))
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='relative change reported by --compare')
+    args = parser.parse_args()
+
+    if args.compare:
+        return compare(args.compare[0], args.compare[1], args.threshold)
+
+    report = {'environment': environment(), 'results': run(args)}
+    if args.json:
+        with open(args.json, 'w') as fp:
+            json.dump(report, fp, indent=1)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
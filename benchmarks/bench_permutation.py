@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Permutation KS and Anderson-Darling tests of plots/ash_plot/ASH/permutation.py
+on two samples of a size, by thread count, against the same tests done the
+usual way: shuffle the pooled data and call scipy's ks_2samp and
+anderson_ksamp for each permutation, timed on --naive of them and scaled up.
+
+    python benchmarks/bench_permutation.py
+    python benchmarks/bench_permutation.py --sizes 10000 100000 \
+        --permutations 10000 --threads 1 2 4 --json permutation.json
+
+Exits non-zero when a fine-grid run takes longer than --budget seconds.
+"""
+from __future__ import division, print_function
+
+import argparse
+import json
+import os
+import sys
+import warnings
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+import numpy as np
+from scipy import stats
+
+from bench_binning import default_threads
+from bench_numeric import environment, measure
+from plots.ash_plot.ASH import permutation
+
+SIZES = [1000, 10000, 100000]
+PERMUTATIONS = 10000
+NAIVE = 20
+BUDGET = 5.
+
+
+def naive(a, b, permutations, seed=0):
+    'The tests on permutations shuffles of the raw samples'
+    rng = np.random.default_rng(seed)
+    pooled = np.r_[a, b]
+    for _ in range(permutations):
+        rng.shuffle(pooled)
+        stats.ks_2samp(pooled[:len(a)], pooled[len(a):])
+        with warnings.catch_warnings():
+            # the p-value is capped, the statistic is what is wanted
+            warnings.simplefilter('ignore')
+            stats.anderson_ksamp([pooled[:len(a)], pooled[len(a):]])
+
+
+def run(args):
+    results = []
+    slow = False
+    for n in args.sizes:
+        rng = np.random.default_rng(0)
+        a, b = rng.normal(0, 1, n), rng.normal(0.01, 1, n)
+        base = measure(naive, (a, b, args.naive), 0, 1)
+        base_s = base['min_s']*args.permutations/args.naive
+        print('%10i x2  naive      %10.2f s (from %i permutations)' %
+              (n, base_s, args.naive))
+        results.append({'n': n, 'threads': 0, 'min_s': base_s})
+        for threads in args.threads:
+            timing = measure(permutation.compare,
+                             ([a, b], args.permutations, permutation.FINE_BINS,
+                              0, threads), args.min_time, args.repeat)
+            timing.update(n=n, threads=threads, vs_naive=base_s/timing['min_s'])
+            results.append(timing)
+            slow = slow or timing['min_s'] > args.budget
+            print('%10i x2  %2i threads %10.2f s  x%.0f naive' %
+                  (n, threads, timing['min_s'], timing['vs_naive']))
+            sys.stdout.flush()
+    return results, slow
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--permutations', type=int, default=PERMUTATIONS)
+    parser.add_argument('--threads', type=int, nargs='+',
+                        default=default_threads())
+    parser.add_argument('--naive', type=int, default=NAIVE,
+                        help='permutations the naive time is scaled from')
+    parser.add_argument('--min-time', type=float, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--budget', type=float, default=BUDGET)
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args()
+
+    results, slow = run(args)
+    if args.json:
+        with open(args.json, 'w') as fp:
+            json.dump({'environment': environment(), 'results': results}, fp,
+                      indent=1)
+    return 1 if slow else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Render every plot from many threads at once and check the images match a
+serial render byte for byte.
+
+    python benchmarks/concurrent_render.py --threads 8 --repeat 4
+
+Exits non-zero if any threaded render differs.
+"""
+from __future__ import division, print_function
+
+import argparse
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import matplotlib
+matplotlib.use('Agg')
+
+from plots import form_valid as fv
+from plots.ash_plot.ash_plot import ash_png, paper_data
+from plots.ce_plot.ce_plot import ce_png, battery_data, cycle_data
+from plots.example_plot.example_plot import make_plot, example_data
+
+
+def jobs():
+    ash_data = fv.data_split(paper_data)
+    ce_x, ce_y = fv.data_split(cycle_data), fv.data_split(battery_data)
+    ex_data = fv.data_split(example_data)
+    for chart_type in ('png', 'pngat'):
+        for color in ('#4C72B0', '#D95319'):
+            yield ('ash', chart_type, color), ash_png, \
+                (ash_data, 'x', chart_type, color, '#92B2E7')
+            yield ('ce', chart_type, color), ce_png, \
+                (ce_x, ce_y, 'Cycle', 'CE', chart_type, color)
+            yield ('example', chart_type, color), make_plot, \
+                (ex_data, ex_data, 'x', 'y', chart_type, color)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--repeat', type=int, default=4)
+    args = parser.parse_args()
+
+    work = list(jobs())
+    expected = dict((key, func(*fargs).getvalue())
+                    for key, func, fargs in work)
+
+    with ThreadPoolExecutor(args.threads) as pool:
+        futures = [(key, pool.submit(func, *fargs))
+                   for _ in range(args.repeat) for key, func, fargs in work]
+        bad = [key for key, fut in futures
+               if fut.result().getvalue() != expected[key]]
+
+    print('%i renders on %i threads, %i differ from serial' %
+          (len(futures), args.threads, len(bad)))
+    for key in sorted(set(bad)):
+        print('  mismatch:', *key)
+    return 1 if bad else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Replay a mix of plot form posts against the app and report throughput,
+latency percentiles and peak RSS.
+
+    python benchmarks/loadtest.py --json before.json
+    python benchmarks/loadtest.py --routes ash --outputs png svg \\
+        --sizes 1000 10000 --concurrency 1 4 16 --requests 40
+    python benchmarks/loadtest.py --url http://localhost:8080 --pid 1234
+
+Without --url the app is loaded in-process from bottle_plot, the way
+adapter.wsgi does, and called through WSGI directly, so RSS is that of the
+app. With --url the posts go over HTTP to a running server and --pid names
+the server process whose peak RSS is read from /proc.
+
+Each concurrency level replays the same seeded sequence of requests drawn
+from routes x outputs x sizes, so two runs with the same options send the
+same bodies in the same order. The JSON report holds the options, the PLOT_*
+environment and the commit next to the results, sorted, for diffing.
+"""
+from __future__ import division, print_function
+
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from urllib.request import Request, urlopen
+    from urllib.error import HTTPError
+except ImportError:
+    from urllib2 import Request, urlopen, HTTPError
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+import numpy as np
+
+ROUTES = ['ash', 'ce', 'example']
+# output: the submit button the form posts
+OUTPUTS = {'preview': {}, 'png': {'png_download': 'PNG'},
+           'svg': {'svg_download': 'SVG'}}
+BOUNDARY = 'plotloadtestboundary'
+
+
+def fields(route, n, rng):
+    'Form fields of a filled in plot form with n generated values'
+    def text(values):
+        return '\n'.join('%.6g' % v for v in values)
+    if route == 'ash':
+        return {'data': text(rng.normal(10, 2, n)), 'xlabel': 'Size (nm)',
+                'color': '#4C72B0', 'fill_color': '#92B2E7'}
+    cycles = np.arange(1, n + 1)
+    if route == 'ce':
+        return {'x_data': text(cycles),
+                'y_data': text(100 - 10*np.exp(-cycles/3.) -
+                               np.abs(rng.normal(0, 0.05, n))),
+                'x_label': 'Cycle Number',
+                'y_label': 'Coulombic Efficiency (%)', 'color': '#4C72B0'}
+    return {'x_data': text(cycles), 'y_data': text(rng.normal(0, 1, n)),
+            'x_label': 'x', 'y_label': 'y', 'color': '#4C72B0'}
+
+
+def multipart(form):
+    'multipart/form-data body, as the browser posts the form'
+    body = io.BytesIO()
+    for name, value in sorted(form.items()):
+        body.write(('--%s\r\nContent-Disposition: form-data; name="%s"'
+                    '\r\n\r\n%s\r\n' % (BOUNDARY, name, value))
+                   .encode('utf-8'))
+    body.write(('--%s--\r\n' % BOUNDARY).encode('utf-8'))
+    return body.getvalue()
+
+
+def scenarios(args):
+    rng = np.random.RandomState(args.seed)
+    bodies = {}
+    for route in args.routes:
+        for size in args.sizes:
+            form = fields(route, size, rng)
+            form['filled'] = 'true'
+            for output in args.outputs:
+                form_output = dict(form, **OUTPUTS[output])
+                bodies[(route, output, size)] = multipart(form_output)
+    return bodies
+
+
+class InProcess(object):
+    'Calls the WSGI app in this process'
+    def __init__(self):
+        import bottle
+        import bottle_plot  # noqa: F401, registers the routes
+        self.app = bottle.default_app()
+
+    def __call__(self, route, body):
+        environ = {'REQUEST_METHOD': 'POST', 'PATH_INFO': '/' + route,
+                   'SCRIPT_NAME': '', 'QUERY_STRING': '',
+                   'CONTENT_TYPE': 'multipart/form-data; boundary=' +
+                   BOUNDARY,
+                   'CONTENT_LENGTH': str(len(body)),
+                   'SERVER_NAME': 'localhost', 'SERVER_PORT': '80',
+                   'SERVER_PROTOCOL': 'HTTP/1.1',
+                   'wsgi.input': io.BytesIO(body), 'wsgi.errors': sys.stderr,
+                   'wsgi.url_scheme': 'http', 'wsgi.version': (1, 0),
+                   'wsgi.multithread': True, 'wsgi.multiprocess': False,
+                   'wsgi.run_once': False}
+        status = []
+
+        def start_response(line, headers, exc_info=None):
+            status.append(int(line.split()[0]))
+        chunks = self.app(environ, start_response)
+        try:
+            size = sum(len(chunk) for chunk in chunks)
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()
+        return status[0], size
+
+    def max_rss(self):
+        from plots.memory import max_rss
+        return max_rss()
+
+
+class OverHTTP(object):
+    'Posts to a running server'
+    def __init__(self, url, pid=None):
+        self.url = url.rstrip('/')
+        self.pid = pid
+
+    def __call__(self, route, body):
+        req = Request(self.url + '/' + route, data=body, headers={
+            'Content-Type': 'multipart/form-data; boundary=' + BOUNDARY})
+        try:
+            resp = urlopen(req)
+        except HTTPError as err:
+            resp = err
+        try:
+            return resp.getcode(), len(resp.read())
+        finally:
+            resp.close()
+
+    def max_rss(self):
+        if not self.pid:
+            return None
+        with open('/proc/%i/status' % self.pid) as fp:
+            for line in fp:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+        return None
+
+
+def percentiles(latencies):
+    if not latencies:
+        return {}
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {'p50_ms': round(p50*1e3, 2), 'p95_ms': round(p95*1e3, 2),
+            'p99_ms': round(p99*1e3, 2),
+            'max_ms': round(max(latencies)*1e3, 2)}
+
+
+def replay(target, bodies, concurrency, count, seed):
+    'Send count requests drawn from bodies on concurrency threads'
+    keys = sorted(bodies)
+    plan = [random.Random(seed + i).choice(keys) for i in range(count)]
+    samples = []
+    lock = threading.Lock()
+
+    def send(key):
+        start = time.perf_counter()
+        try:
+            status, size = target(key[0], bodies[key])
+        except Exception as err:
+            status, size = type(err).__name__, 0
+        elapsed = time.perf_counter() - start
+        with lock:
+            samples.append((key, status, elapsed, size))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(send, plan))
+    wall = time.perf_counter() - start
+
+    by_key = {}
+    for key, status, elapsed, size in samples:
+        by_key.setdefault(key, []).append((status, elapsed, size))
+    results = []
+    for key in sorted(by_key):
+        rows = by_key[key]
+        statuses = {}
+        for status, _, _ in rows:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        ok = [elapsed for status, elapsed, _ in rows if status == 200]
+        result = {'route': key[0], 'output': key[1], 'size': key[2],
+                  'requests': len(rows), 'status': statuses,
+                  'bytes': max(size for _, _, size in rows)}
+        result.update(percentiles(ok))
+        results.append(result)
+    ok = [elapsed for _, status, elapsed, _ in samples if status == 200]
+    summary = {'concurrency': concurrency, 'requests': len(samples),
+               'ok': len(ok), 'seconds': round(wall, 3),
+               'throughput_rps': round(len(samples)/wall, 2)}
+    summary.update(percentiles(ok))
+    return summary, results
+
+
+def environment():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                         cwd=root, universal_newlines=True)
+    except (OSError, subprocess.CalledProcessError):
+        commit = ''
+    return {'commit': commit.strip(), 'python': platform.python_version(),
+            'machine': platform.machine(), 'cpus': os.cpu_count(),
+            'plot_env': dict((k, v) for k, v in os.environ.items()
+                             if k.startswith('PLOT_'))}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', help='server to post to, default in-process')
+    parser.add_argument('--pid', type=int,
+                        help='server process to read the peak RSS of')
+    parser.add_argument('--routes', nargs='+', choices=ROUTES, default=ROUTES)
+    parser.add_argument('--outputs', nargs='+', choices=sorted(OUTPUTS),
+                        default=['preview', 'png', 'svg'])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--requests', type=int, default=30,
+                        help='requests per concurrency level')
+    parser.add_argument('--warmup', type=int, default=1,
+                        help='unmeasured requests per scenario first')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='write the report to this file')
+    args = parser.parse_args()
+
+    target = OverHTTP(args.url, args.pid) if args.url else InProcess()
+    bodies = scenarios(args)
+    for key in sorted(bodies):
+        for _ in range(args.warmup):
+            target(key[0], bodies[key])
+
+    runs = []
+    for concurrency in args.concurrency:
+        summary, results = replay(target, bodies, concurrency, args.requests,
+                                  args.seed)
+        print('concurrency %(concurrency)i: %(requests)i requests, '
+              '%(ok)i ok, %(throughput_rps).2f req/s' % summary)
+        for r in results:
+            print('  %-8s %-8s %7i  n=%-3i p50 %8s  p95 %8s  p99 %8s ms  %s' %
+                  (r['route'], r['output'], r['size'], r['requests'],
+                   r.get('p50_ms', '-'), r.get('p95_ms', '-'),
+                   r.get('p99_ms', '-'),
+                   ' '.join('%s:%i' % s for s in sorted(r['status'].items()))))
+        runs.append({'summary': summary, 'results': results})
+        sys.stdout.flush()
+
+    rss = target.max_rss()
+    if rss:
+        print('peak RSS %.1f MB' % (rss/2**20))
+    options = dict((k, v) for k, v in vars(args).items()
+                   if k not in ('json', 'pid'))
+    report = {'environment': environment(), 'options': options,
+              'max_rss_bytes': rss, 'runs': runs}
+    if args.json:
+        with open(args.json, 'w') as fp:
+            json.dump(report, fp, indent=1, sort_keys=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
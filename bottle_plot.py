@@ -7,14 +7,18 @@ Created on Fri Aug  5 11:34:19 2016
 """
 from __future__ import division, print_function
 
-from bottle import route, run, template, static_file
-
-import matplotlib
-matplotlib.use('Agg')
-
-import plots.ash_plot
-import plots.ce_plot
-import plots.example_plot
+from bottle import install, route, run, template, static_file
+
+import plots
+import plots.jobs
+import plots.memory
+import plots.metrics
+import plots.profiling
+
+plots.register()
+install(plots.metrics.plugin)
+install(plots.profiling.plugin)
+install(plots.memory.plugin)
 
 """
 Plotting form data in bottle
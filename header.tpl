@@ -18,6 +18,7 @@
             <ul id="navlist">
                 <li><a href="ash">ASH</a></li>
                 <li><a href="ce">Battery CE</a></li>
+                <li><a href="ce_multi">CE Compare</a></li>
                 <li><a href="example">Example</a></li>
             </ul>
         </div>
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Plot plugins.
+
+Every package under plots/ describes its routes in its __init__ as ROUTES,
+a list of (path, methods, 'module:function'). Only that metadata lives in
+the __init__, so the app can register the routes without importing the
+plotting stack.
+register() adds those routes to the bottle app with handlers that import the
+plotting module (numpy, matplotlib, seaborn, scipy, wtforms) the first time
+one of its routes is hit, or all of them up front in a background thread
+with preload().
+
+A plugin may also list in WARMUP the 'module:function's that render its
+plots with their default data as a given chart type. warm_up() calls each
+of them for every output type, so a fresh worker pays for imports, font
+lookup, mathtext and style setup before its first request. GET /ready
+answers 503 until the preload or warm-up set by PLOT_PRELOAD and
+PLOT_WARMUP is done, then 200, for a load balancer to wait on.
+"""
+from __future__ import division, print_function
+
+import importlib
+import json
+import logging
+import os
+import pkgutil
+import threading
+import time
+
+import bottle
+
+# lazy, background or eager
+PRELOAD = os.environ.get('PLOT_PRELOAD', 'lazy')
+# off, background or eager
+WARMUP = os.environ.get('PLOT_WARMUP', 'off')
+
+log = logging.getLogger(__name__)
+
+_plugins = {}
+_lock = threading.Lock()
+_ready = threading.Event()
+_warm = {'seconds': None, 'failed': []}
+
+
+def discover():
+    'Import the light plugin packages under plots/ that declare ROUTES'
+    with _lock:
+        if not _plugins:
+            for _, name, ispkg in pkgutil.iter_modules(__path__):
+                if not ispkg:
+                    continue
+                package = importlib.import_module(__name__ + '.' + name)
+                if getattr(package, 'ROUTES', None):
+                    _plugins[name] = package
+    return _plugins
+
+
+def resolve(plugin, target):
+    'Import the module behind target and return the function it names'
+    module_name, func_name = target.split(':')
+    module = importlib.import_module('%s.%s.%s' %
+                                     (__name__, plugin, module_name))
+    return getattr(module, func_name)
+
+
+def lazy(plugin, target):
+    'Route callback that only imports its plotting module when called'
+    def handler(*args, **kwargs):
+        return resolve(plugin, target)(*args, **kwargs)
+    handler.__name__ = target.split(':')[1]
+    handler.plugin = plugin
+    handler.target = target
+    return handler
+
+
+def register(app=None):
+    'Add the routes of every plugin to app, the default app if None'
+    app = app or bottle.default_app()
+    for name, package in sorted(discover().items()):
+        for path, methods, target in package.ROUTES:
+            app.route(path, method=methods, callback=lazy(name, target))
+    app.route('/ready', method=['GET', 'HEAD'], callback=ready)
+    if WARMUP in ('eager', 'background'):
+        warm_up(background=WARMUP == 'background')
+    elif PRELOAD in ('eager', 'background'):
+        preload(background=PRELOAD == 'background')
+    else:
+        _ready.set()
+    return app
+
+
+def modules():
+    'Names of the plotting modules behind the registered routes'
+    names = set()
+    for name, package in discover().items():
+        for _, _, target in package.ROUTES:
+            names.add('%s.%s.%s' % (__name__, name, target.split(':')[0]))
+    return sorted(names)
+
+
+def preload(background=False):
+    'Import every plotting module now, or in a daemon thread'
+    def load():
+        for name in modules():
+            importlib.import_module(name)
+        _ready.set()
+    return _start(load, 'plot-preload', background)
+
+
+def _start(func, name, background):
+    if not background:
+        func()
+        return None
+    thread = threading.Thread(target=func, name=name)
+    thread.daemon = True
+    thread.start()
+    return thread
+
+
+def warmers():
+    '(plugin, target) of the warm-up functions the plugins list in WARMUP'
+    return [(name, target) for name, package in sorted(discover().items())
+            for target in getattr(package, 'WARMUP', ())]
+
+
+def warm_up(background=False):
+    """
+    Render every plot with its default data as every output type, now or in
+    a daemon thread, then report ready. A render that fails is logged and
+    listed by /ready, the rest still run.
+    """
+    def run():
+        from . import metrics
+        from . import render
+        start = time.time()
+        # timed under the route 'warmup', apart from the requests
+        context = metrics.detached('warmup')
+        for plugin, target in warmers():
+            func = resolve(plugin, target)
+            for chart_type in sorted(render.OUTPUTS):
+                try:
+                    context.run(func, chart_type)
+                except Exception as err:
+                    log.exception('Warm-up of %s as %s failed', target,
+                                  chart_type)
+                    _warm['failed'].append('%s %s: %s' %
+                                           (target, chart_type, err))
+        _warm['seconds'] = time.time() - start
+        # modules without a warm-up are at least imported
+        preload()
+    return _start(run, 'plot-warmup', background)
+
+
+def ready():
+    'GET /ready: 200 once the worker is warm, 503 before'
+    if not _ready.is_set():
+        raise bottle.HTTPResponse(json.dumps({'ready': False}), 503,
+                                  Content_Type='application/json',
+                                  Retry_After='1')
+    return dict(_warm, ready=True)
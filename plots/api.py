@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Request and response encoding of the compute-only /api routes, which return
+the numbers behind a plot instead of an image.
+
+Input is either a JSON object with the arrays as lists and any parameters
+alongside, or a body of raw little-endian floats (Content-Type
+application/octet-stream, float64 unless ?dtype=f4) with the parameters in
+the query string.
+
+Output is JSON unless the request asks for ?format=binary or Accepts
+application/octet-stream only, in which case the body is
+
+    uint32 LE   length of the header
+    header      JSON: {"dtype": "<f4", "scalars": {...},
+                       "arrays": [{"name", "offset", "length"}, ...]},
+                padded with spaces so the arrays start 4-byte aligned
+    arrays      float32 LE, offsets in bytes from the end of the header
+"""
+from __future__ import division, print_function
+
+import json
+import struct
+
+import numpy as np
+from bottle import request, response, HTTPError
+
+from . import metrics
+
+MAX_BODY = 64 * 2**20
+DTYPES = {'f8': '<f8', 'f4': '<f4'}
+
+
+def read_body():
+    'The raw request body, 413 above MAX_BODY'
+    if request.content_length > MAX_BODY:
+        raise HTTPError(413, 'Request body larger than %i bytes.' % MAX_BODY)
+    # request.json stops at bottle's MEMFILE_MAX, far below large datasets
+    return request.body.read()
+
+
+def as_array(values, name, min_len=2, max_len=100000):
+    'values as a float array, 400 unless 1-d, finite and of the given length'
+    try:
+        a = np.asarray(values, dtype=float)
+    except (TypeError, ValueError):
+        raise HTTPError(400, '%s must be a list of numbers.' % name)
+    if a.ndim != 1 or not min_len <= len(a) <= max_len:
+        raise HTTPError(400, '%s must have %i to %i values.' %
+                        (name, min_len, max_len))
+    if not np.isfinite(a).all():
+        raise HTTPError(400, '%s must be finite.' % name)
+    return a
+
+
+def arrays(names, min_len=2, max_len=100000):
+    """
+    The named arrays and the parameters of the request. A binary body is
+    split into len(names) equal parts.
+    """
+    if request.content_type.startswith('application/octet-stream'):
+        dtype = DTYPES.get(request.query.get('dtype', 'f8'))
+        if dtype is None:
+            raise HTTPError(400, 'dtype must be one of %s.' %
+                            ', '.join(sorted(DTYPES)))
+        body = read_body()
+        size = np.dtype(dtype).itemsize * len(names)
+        if len(body) % size:
+            raise HTTPError(400, 'Body must hold %i arrays of equal length '
+                            'of %s.' % (len(names), dtype))
+        parts = np.split(np.frombuffer(body, dtype=dtype), len(names))
+        params = dict(request.query.items())
+    else:
+        try:
+            params = json.loads(read_body().decode('utf-8'))
+        except ValueError:
+            raise HTTPError(400, 'Body must be JSON or '
+                            'application/octet-stream.')
+        if not isinstance(params, dict):
+            raise HTTPError(400, 'Body must be a JSON object.')
+        missing = [name for name in names if name not in params]
+        if missing:
+            raise HTTPError(400, 'Missing %s.' % ', '.join(missing))
+        parts = [params.pop(name) for name in names]
+    result = [as_array(part, name, min_len, max_len)
+              for part, name in zip(parts, names)]
+    if len(set(len(a) for a in result)) > 1:
+        raise HTTPError(400, '%s must be the same length.' %
+                        ', '.join(names))
+    metrics.label(size=len(result[0]))
+    return result, params
+
+
+def param(params, name, kind, default=None):
+    'params[name] converted with kind, 400 if it does not convert'
+    value = params.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        raise HTTPError(400, 'Invalid %s.' % name)
+
+
+def binary_requested():
+    if request.query.get('format') == 'binary':
+        return True
+    accept = request.get_header('Accept', '')
+    return accept.startswith('application/octet-stream') and \
+        'json' not in accept
+
+
+def pack(scalars, arrays):
+    'The binary layout described in the module docstring'
+    layout = []
+    offset = 0
+    for name, a in arrays:
+        layout.append({'name': name, 'offset': offset, 'length': len(a)})
+        offset += 4 * len(a)
+    header = json.dumps({'dtype': '<f4', 'scalars': scalars,
+                         'arrays': layout}).encode('utf-8')
+    header += b' ' * (-(4 + len(header)) % 4)
+    return b''.join([struct.pack('<I', len(header)), header] +
+                    [np.asarray(a, dtype='<f4').tobytes() for _, a in arrays])
+
+
+def plain(scalars):
+    'scalars with numpy numbers turned into python ones'
+    return dict((k, v.item() if isinstance(v, np.generic) else v)
+                for k, v in scalars.items())
+
+
+def dumps(scalars, arrays, digits=None, **extra):
+    '''
+    JSON of scalars, arrays and extra. With digits the arrays are written to
+    that many significant digits, which is plenty for drawing.
+    '''
+    result = plain(scalars)
+    result.update(extra)
+    if digits is None:
+        result.update((name, np.asarray(a, dtype=float).tolist())
+                      for name, a in arrays)
+        return json.dumps(result)
+    fmt = '%%.%ig' % digits
+    head = json.dumps(result)[1:-1]
+    parts = [head] if head else []
+    parts += ['%s: [%s]' % (json.dumps(name), ', '.join(fmt % v for v in a))
+              for name, a in arrays]
+    return '{' + ', '.join(parts) + '}'
+
+
+def respond(scalars, arrays):
+    'JSON or binary response of scalars (a dict) and arrays ((name, a), ...)'
+    if binary_requested():
+        metrics.label(format='binary')
+        response.content_type = 'application/octet-stream'
+        return pack(plain(scalars), arrays)
+    metrics.label(format='json')
+    response.content_type = 'application/json'
+    return dumps(scalars, arrays)
@@ -6,17 +6,29 @@ Created on Mon Aug 17 13:48:58 2015
 """
 from __future__ import division, print_function
 import numpy as np
-import pylab as plt
 from .kde import kde
+from .sparse import SparseBins
+from . import binning
 from scipy import stats
-import sys
-from io import BytesIO
-import tempfile
+
+from ... import metrics
+
+try:
+    trapz = np.trapezoid
+except AttributeError:
+    trapz = np.trapz
 
 #from gradient_bar import gbar
 
+# dense mesh points above which only the occupied fine bins are kept
+MESH_LIMIT = 2**20
+# columns the sparse mesh is drawn on, about a pixel each at 300 dpi
+MESH_COLUMNS = 4000
+# side of the infill opacity mask, a 6 inch axes at 100 dpi
+INFILL_PIXELS = 600
+
 class ash:
-    def __init__(self, data, bin_num=None, shift_num=50, normed=True, force_scott = False, rule = 'scott'):
+    def __init__(self, data, bin_num=None, shift_num=50, normed=True, force_scott = False, rule = 'scott', bin_width=None, origin=None):
         self.data_min = min(data)
         self.data_max = max(data)
         self.shift_num = shift_num
@@ -25,12 +37,17 @@ class ash:
         self.normed=normed
         ##If None use KDE to autobin
         
-        if bin_num == None:
-            kde_result = kde(self.data)
-            if len(self.data) >= 50 and not force_scott and kde_result:
+        if bin_num == None and bin_width == None:
+            kde_result = None
+            if len(self.data) >= 50 and not force_scott:
+                # only the diffusion KDE bandwidth needs it
+                with metrics.stage('kde'):
+                    kde_result = kde(self.data)
+            if kde_result:
                 self.bw,self.kde_mesh,self.kde_den = kde_result
                 self.bins_from_bw()
-                self.bw2,self.kde_mesh,self.kde_den = kde(self.data, None, self.ash_mesh.min(), self.ash_mesh.max())
+                with metrics.stage('kde'):
+                    self.bw2,self.kde_mesh,self.kde_den = kde(self.data, None, self.ash_mesh.min(), self.ash_mesh.max())
             elif rule=='fd':
                 #print("Using FD rule")
                 kernel = stats.gaussian_kde(self.data)
@@ -38,24 +55,30 @@ class ash:
                 self.bw_from_bin_width()
                 kernel.set_bandwidth(self.bw)
                 self.bins_from_bw()
-                self.kde_mesh = self.ash_mesh
-                self.kde_den = kernel(self.kde_mesh)
+                self.kde_mesh = self.kde_grid()
+                with metrics.stage('kde'):
+                    self.kde_den = kernel(self.kde_mesh)
             else:
                 #print("Using Scott's rule")
                 kernel = stats.gaussian_kde(self.data)
                 kernel.set_bandwidth(rule)
                 self.bw = kernel.factor * self.data.std() # kde factor is bandwidth scaled by sigma
                 self.bins_from_bw()
-                self.kde_mesh = self.ash_mesh
-                self.kde_den = kernel(self.kde_mesh)
+                self.kde_mesh = self.kde_grid()
+                with metrics.stage('kde'):
+                    self.kde_den = kernel(self.kde_mesh)
         else:
             #print("Using bin number: ", bin_num)
-            self.set_bins(bin_num)
+            if bin_width == None:
+                self.set_bins(bin_num)
+            else:
+                self.set_bin_width(bin_width, origin)
 
             kernel = stats.gaussian_kde(self.data)
             kernel.set_bandwidth(self.bw)
-            self.kde_mesh = self.ash_mesh
-            self.kde_den = kernel(self.kde_mesh)
+            self.kde_mesh = self.kde_grid()
+            with metrics.stage('kde'):
+                self.kde_den = kernel(self.kde_mesh)
                 
                 #self.kde_mesh,self.kde_den
         
@@ -72,9 +95,23 @@ class ash:
         self.calc_ash_den(self.normed)
         self.calc_ash_unc()
     
+    def set_bin_width(self, bin_width, origin=None):
+        '''bins of bin_width with edges at origin plus whole bin widths, so the
+        ashes of several datasets given the same ones share their bins'''
+        origin = self.data_min if origin is None else origin
+        self.bin_width = bin_width
+        self.MIN = origin + (np.floor((self.data_min-origin)/bin_width) - 1)*bin_width
+        self.bin_num = int(np.ceil((self.data_max-self.MIN)/bin_width)) - 1
+        self.MAX = self.MIN + (self.bin_num+2)*bin_width
+        self.SHIFT = self.bin_width/self.shift_num
+
+        self.bw_from_bin_width()
+        self.calc_ash_den(self.normed)
+        self.calc_ash_unc()
+
     def bins_from_bw(self):
         self.bin_width = self.bw * np.sqrt(2*np.pi) #bin with full width half max of band width
-        self.bin_num = np.ceil(((self.data_max - self.data_min)/self.bin_width))
+        self.bin_num = int(np.ceil(((self.data_max - self.data_min)/self.bin_width)))
         self.MIN = self.data_min - self.bin_width
         self.MAX = self.data_min + self.bin_width*(self.bin_num + 1)
         self.SHIFT = self.bin_width/self.shift_num
@@ -82,15 +119,27 @@ class ash:
         self.calc_ash_den(self.normed)
         self.calc_ash_unc()#window at which 68.2% of the area is covered
         
+    def kde_grid(self):
+        '''ash_mesh, or 2*MESH_COLUMNS points across it, evaluating the KDE costs a
+        pass over the data per point'''
+        if len(self.ash_mesh) <= 2*MESH_COLUMNS:
+            return self.ash_mesh
+        return np.linspace(self.ash_mesh[0], self.ash_mesh[-1], 2*MESH_COLUMNS)
+        
     def bw_from_bin_width(self):
         self.bw = self.bin_width / np.sqrt(2*np.pi)
     
+    @metrics.timed('calc_ash_den')
     def calc_ash_den(self, normed=True):
+        self.sparse = None
+        if (self.bin_num+2)*self.shift_num > MESH_LIMIT:
+            return self.calc_sparse_den(normed)
         self.ash_mesh = np.linspace(self.MIN,self.MAX,(self.bin_num+2)*self.shift_num)
         self.ash_den = np.zeros_like(self.ash_mesh)
-        for i in range(self.shift_num):
+        hists = binning.shifted(self.data, self.MIN, self.MAX, self.SHIFT, self.bin_width, self.bin_num+1, self.shift_num, density=normed)
+        for i, hist in enumerate(hists):
             hist_range = (self.MIN+i*self.SHIFT,self.MAX+i*self.SHIFT- self.bin_width)
-            hist, self.bin_edges = np.histogram(self.data,self.bin_num+1,range=hist_range,normed=normed)
+            self.bin_edges = binning.edges(hist_range[0], hist_range[1], self.bin_num+1)
             #print(self.bin_edges[1]-self.bin_edges[0])
             hist_mesh = np.ravel(np.meshgrid(hist,np.zeros(self.shift_num))[0],order='F')
             self.ash_den = self.ash_den + np.r_[[0]*i,hist_mesh,[0]*(self.shift_num-i)] #pad hist_mesh with zeros and add
@@ -99,89 +148,171 @@ class ash:
         ash_den_index = np.where(self.ash_den > 0)
         self.ash_mesh = self.ash_mesh[ash_den_index]
         self.ash_den = self.ash_den[ash_den_index]
+    def calc_sparse_den(self, normed=True, bins=None):
+        '''calc_ash_den from the occupied fine bins, on at most about
+        4*MESH_COLUMNS points that keep every peak'''
+        if bins is None:
+            bins = SparseBins.from_data(self.data, self.MIN, self.SHIFT, self.shift_num, self.bin_num)
+        self.sparse = bins
+        # the dense mesh spacing
+        self.mesh_step = (self.MAX-self.MIN)/(self.sparse.N-1)
+        mesh_index = self.sparse.mesh(MESH_COLUMNS)
+        den = self.sparse.den(mesh_index)
+        scale = self.shift_num*self.data_len*self.bin_width if normed else self.shift_num
+        ash_den_index = np.where(den > 0)
+        self.ash_mesh = self.MIN + mesh_index[ash_den_index]*self.mesh_step
+        self.ash_den = den[ash_den_index]/scale
+    @metrics.timed('calc_ash_unc')
     def calc_ash_unc(self):
         '''window at which 68.2% of the area is covered'''
-        tot_area = np.trapz(self.ash_den,self.ash_mesh)
+        if self.sparse is not None:
+            return self.calc_sparse_unc()
+        tot_area = trapz(self.ash_den,self.ash_mesh)
         self.mean = np.average(self.ash_mesh, weights = self.ash_den)
         mean_index = (np.abs(self.ash_mesh-self.mean)).argmin()
-        i=1
-        area = 0
-        self.window = 0
-        while area < 0.682:
-            window_index = slice(mean_index-i,mean_index+1+i)
-            self.window = self.ash_mesh[window_index]
-            area = np.trapz(self.ash_den[window_index],self.window)/tot_area
-            i+=1
-            #print(area)
+        # area from mean_index-i to mean_index+i for every i at once
+        cum_area = np.r_[0, np.cumsum(np.diff(self.ash_mesh)*(self.ash_den[1:]+self.ash_den[:-1])/2)]
+        i = np.arange(1, len(self.ash_mesh)+1)
+        lo = np.maximum(mean_index-i, 0)
+        hi = np.minimum(mean_index+i, len(self.ash_mesh)-1)
+        i = np.argmax((cum_area[hi]-cum_area[lo])/tot_area >= 0.682)
+        self.window = self.ash_mesh[lo[i]:hi[i]+1]
         self.unc = self.window.max() - self.mean
         self.sigma = np.sqrt(np.average((self.ash_mesh-self.mean)**2, weights=self.ash_den))
         #print(area, self.unc ,self.sigma)
+    def calc_sparse_unc(self):
+        '''calc_ash_unc from the occupied fine bins, its window over the whole
+        dense mesh, gaps between the data included'''
+        mean, var = self.sparse.moments()
+        self.mean = self.MIN + mean*self.mesh_step
+        self.sigma = np.sqrt(var)*self.mesh_step
+        mean_index = int(round(mean))
+        i = self.sparse.window(mean_index)
+        window_index = np.array([max(mean_index-i, 0), min(mean_index+i, self.sparse.N-1)])
+        self.window = self.MIN + window_index*self.mesh_step
+        self.unc = self.window.max() - self.mean
+    @metrics.timed('plot_ash_infill')
     def plot_ash_infill(self, ax=None, color='#92B2E7', normed=True, alpha=0.75):
-        ax = ax if ax else plt.gca()
-        fig_tmp = plt.figure(figsize = (6,6))
-        ax_tmp = fig_tmp.add_axes([0,0,1,1], axisbg='w', frameon=False)
-        ax_tmp.set_xticks([])
-        ax_tmp.set_yticks([])
-        self.hist_max = 0
-        for i in range(self.shift_num):
-            hist_range = (self.MIN+i*self.SHIFT,self.MAX+i*self.SHIFT- self.bin_width)
-            self.hist_range = hist_range
-            hist, bin_edges = np.histogram(self.data,self.bin_num+1,range=hist_range,normed=normed)
-            self.hist_max = max(hist) if max(hist) > self.hist_max else self.hist_max
-            #gbar(ax, bin_edges[:-1], hist, width=self.bin_width,alpha=0.5/self.shift_num)
-            n, bin_edges, patches = ax_tmp.hist(self.data,self.bin_num+1,range=hist_range,
-                histtype='stepfilled',alpha=alpha/self.shift_num,color = color, linewidth=0,normed=normed, rasterized=True)
-        ymin, ymax = ax.get_ylim()
-        xmin, xmax = ax.get_xlim()
-        self.hist_max += self.hist_max*0.1
-        ymax = ymax if ymax > self.hist_max else self.hist_max
-        ax_tmp.set_ylim(ymin, ymax)
-        ax_tmp.set_xlim(xmin, xmax)
-        fig_tmp.canvas.draw()
-        with tempfile.NamedTemporaryFile() as fp:
-            plt.savefig(fp, transparent=True, type='png')
-            self.hist_img = plt.imread(fp.name)
-            self.hist_img = self.alpha_over(self.hist_img)
-        plt.close(fig_tmp)
-        #self.hist_img = np.array(fig_tmp.canvas.renderer._renderer).reshape((480,480,4))
-        #outs = BytesIO()
-        #plt.savefig(outs, format='png')
-        #plt.close(fig_tmp)
-        #self.hist_img = plt.imread(outs)
-        #print(self.hist_img.shape, file=sys.stderr)
-        ax.imshow(self.hist_img, aspect='auto', extent=(xmin, xmax, ymin, ymax ))
-        ax.set_ylim(ymin, ymax)
-        plt.sca(ax)
+        ax = gca(ax)
+        mask, extent = self.infill_mask(ax.get_xlim(), ax.get_ylim(), normed, alpha)
+        ax.imshow(self.tint(mask, color), aspect='auto', extent=extent)
+        ax.set_ylim(*extent[2:])
+    def infill_top(self, normed=True):
+        '''height the axes need for the stacked shifted histograms'''
+        return self.shift_hists(normed).max()*1.1
+    def infill_mask(self, xlim, ylim, normed=True, alpha=0.75):
+        '''opacity (0 to 255) of the stacked shifted histograms on axes limits
+        xlim, ylim raised to fit them, and the extent it covers, INFILL_PIXELS
+        square: each histogram as if drawn in one color with opacity
+        alpha/shift_num. It is counted in numpy, drawing the histograms as
+        patches takes seconds on the sparse mesh. It only depends on the data
+        and the limits, so callers can keep it for restyling.'''
+        hists = self.shift_hists(normed)
+        start, shift, width, bins = self.hist_layout()
+        xmin, xmax = xlim
+        ymin, ymax = ylim
+        ymax = max(ymax, self.infill_top(normed))
+        P = INFILL_PIXELS
+        # the height of every histogram at every pixel column
+        x = xmin + (np.arange(P)+0.5)*(xmax-xmin)/P
+        rows = np.arange(len(hists))[:, None]
+        k = np.floor((x - start - rows*shift)/width).astype(np.intp)
+        heights = np.where((k >= 0) & (k < bins), hists[rows, np.clip(k, 0, bins-1)], 0)
+        # and bins narrower than a pixel in the column of their centre, so no
+        # peak falls between the columns
+        col = np.floor(((start + rows*shift + (np.arange(bins)+0.5)*width) - xmin)*P/(xmax-xmin))
+        inside = (col >= 0) & (col < P) & (hists > 0)
+        np.maximum.at(heights, (np.broadcast_to(rows, hists.shape)[inside], col[inside].astype(np.intp)), hists[inside])
+        # a histogram covers the pixel rows from its height down to 0, so the
+        # number covering each pixel is a running count of the rows they start at
+        step = (ymax-ymin)/P
+        top = np.clip(np.floor((ymax-heights)/step - 0.5) + 1, 0, P).astype(np.intp)
+        base = int(np.clip(np.floor(ymax/step - 0.5) + 1, 0, P))
+        starts = np.bincount((top*P + np.arange(P)).ravel(), minlength=(P+1)*P)
+        covered = np.cumsum(starts.reshape(P+1, P), axis=0)[:P]
+        covered[base:] = 0
+        # the opacity after each histogram over the last, in 8 bits as Agg blends
+        a = int(round(255*alpha/self.shift_num))
+        opacity = np.zeros(len(hists)+1, dtype=np.int64)
+        for i in range(len(hists)):
+            opacity[i+1] = opacity[i] + a*(255-opacity[i])//255
+        mask = opacity[covered].astype(np.uint8)
+        return mask, (xmin, xmax, ymin, ymax)
+    def tint(self, mask, color):
+        '''opacity mask of color over white, like alpha_over of it drawn in color'''
+        from matplotlib.colors import to_rgb
+        alpha = mask[...,None]/255
+        return np.asarray(to_rgb(color))*alpha+1-alpha
         
-    def plot_rug(self, ax=None, color='#92B2E7', alpha=0.5, lw=2, ms=20, height = 0.07):
-        ax = ax if ax else plt.gca()
+    def plot_rug(self, ax=None, color='#92B2E7', alpha=0.5, lw=2, ms=20, height = 0.07, bins=None):
+        ax = gca(ax)
         ymin, ymax = ax.get_ylim()
         #print(ymin, ymax)
         y_height = ymax - ymin
-        ax.plot(self.data,np.zeros_like(self.data)-y_height*height,'|', alpha=alpha,mew=lw, ms=ms, color=color)
+        rug = self.rug_points(bins)
+        ax.plot(rug,np.zeros_like(rug)-y_height*height,'|', alpha=alpha,mew=lw, ms=ms, color=color)
         ax.set_ylim(-ymax*0.15, ymax)
-    def plot_stats(self, ax=None, label = None, color='#4C72B0', size = 16, side = 'left', short = True):
+    def rug_points(self, bins=None):
+        '''positions of the rug marks, merge_rug of the data'''
+        return merge_rug(self.data, bins, self.data_min, self.data_max)
+    def shift_hists(self, normed=True):
+        '''heights of the shifted histograms, one row per shift laid out as hist_layout says'''
+        if self.sparse is not None:
+            hists = self.sparse.shift_hists(MESH_COLUMNS).astype(float)
+            return hists/(self.data_len*self.bin_width) if normed else hists
+        return binning.shifted(self.data, self.MIN, self.MAX, self.SHIFT, self.bin_width, self.bin_num+1, self.shift_num, density=normed)
+    def hist_layout(self):
+        '''left edge of the first shifted histogram, the shift between them, bin width and bins'''
+        if self.sparse is not None:
+            # the highest bin in each column, all on the same columns
+            return self.MIN, 0, (self.MAX-self.MIN)/MESH_COLUMNS, MESH_COLUMNS
+        return self.MIN, self.SHIFT, self.bin_width, self.bin_num+1
+    def stats_string(self, label=None, short=True, latex=True):
         from uncertainties import ufloat
+        mean = ufloat(self.mean,self.sigma)
+        label_str = str(label)+' = ' if label else ''
+        spec = ".2uS" if short else ".2u"
+        if latex:
+            mean_str = r"$\mathregular{"+format(mean, spec+"L")+"}$"
+        else:
+            mean_str = format(mean, spec)
+        return label_str+mean_str+"\nN = "+str(self.data_len)
+    def plot_stats(self, ax=None, label = None, color='#4C72B0', size = 16, side = 'left', short = True):
         if side == 'right':
             x,y = (0.96, 0.96)
             ha='right'
         else:
             x,y = (0.04, 0.96)
             ha='left'
-        ax = ax if ax else plt.gca()
-        mean = ufloat(self.mean,self.sigma)
-        label_str = str(label)+' = ' if label else ''
-        if short:
-            stat_string = label_str+r"$\mathregular{"+"{:.2uSL}".format(mean)+"}$\nN = "+str(self.data_len)
-        else:
-            stat_string = label_str+r"$\mathregular{"+"{:.2uL}".format(mean)+"}$\nN = "+str(self.data_len)
+        ax = gca(ax)
+        stat_string = self.stats_string(label, short)
         ax.text(x, y, stat_string, color=color, ha=ha, va='top', transform=ax.transAxes, size=size)
     def alpha_over(self, img):
         return (img[...,:3]/255)*(img[...,3:]/255)+1-(img[...,3:]/255)
-    
+
+
+def merge_rug(data, bins=None, lo=None, hi=None):
+    '''positions of the rug marks of data, merged to the centres of bins across
+    lo to hi, the data range by default, when there are more points than that'''
+    if bins is None or len(data) <= bins:
+        return data
+    lo = np.min(data) if lo is None else lo
+    hi = np.max(data) if hi is None else hi
+    counts, edges = binning.histogram(data, bins, range=(lo, hi))
+    return ((edges[:-1] + edges[1:])/2)[counts > 0]
+
+
+def gca(ax=None):
+    '''ax or the pyplot current axes for interactive use'''
+    if ax is None:
+        import matplotlib.pyplot as plt
+        ax = plt.gca()
+    return ax
+
 
 if __name__ == "__main__":
     
+    import pylab as plt
     import seaborn as sns
     
     mu, sigma = 1000, 10
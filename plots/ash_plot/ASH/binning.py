@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Histograms of equal bins counted on a thread pool.
+
+histogram() gives the counts of np.histogram(data, bins, range) for float
+data: the data is split into chunks, each chunk's bin indices are worked
+out the way NumPy does (including its corrections next to the edges) and
+counted with np.bincount, which like the arithmetic releases the GIL, and
+the chunk counts are summed. shifted() counts every shifted histogram of an
+ASH chunk by chunk, so the data is read once while it is in cache instead
+of once per shift. between() counts the data between sorted edges of any
+spacing, by np.searchsorted, the same way. Inputs under two chunks are
+counted inline.
+
+Counts over the occupied fine bins of a sparse ASH (SparseBins.from_data
+and chunked.count above MESH_LIMIT) come from np.unique instead: a count
+of every bin of their mesh is what they are there to avoid.
+
+PLOT_BIN_THREADS sets the pool size, the number of CPUs by default.
+"""
+from __future__ import division, print_function
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+THREADS = int(os.environ.get('PLOT_BIN_THREADS', os.cpu_count() or 1))
+# points per chunk handed to a thread, and per block counted at once
+MIN_CHUNK = 2**16
+MAX_CHUNK = 2**20
+BLOCK = 2**16
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def pool(threads):
+    '''the shared pool of threads workers'''
+    with _pools_lock:
+        if threads not in _pools:
+            _pools[threads] = ThreadPoolExecutor(threads, thread_name_prefix='binning')
+        return _pools[threads]
+
+
+# the pools' threads do not survive a fork
+os.register_at_fork(after_in_child=_pools.clear)
+
+
+def map_sum(func, data, threads=None):
+    '''sum of func over chunks of data, at most 2*threads chunks in flight'''
+    threads = THREADS if threads is None else max(1, threads)
+    size = min(max(-(-len(data)//threads), MIN_CHUNK), MAX_CHUNK)
+    starts = range(0, len(data), size)
+    if threads == 1 or len(starts) < 2:
+        total = None
+        for start in starts:
+            part = func(data[start:start+size])
+            total = part if total is None else total + part
+        return total
+    executor = pool(threads)
+    pending = []
+    total = None
+    for start in starts:
+        pending.append(executor.submit(func, data[start:start+size]))
+        if len(pending) >= 2*threads:
+            part = pending.pop(0).result()
+            total = part if total is None else total + part
+    for future in pending:
+        part = future.result()
+        total = part if total is None else total + part
+    return total
+
+
+def edges(lo, hi, bins):
+    '''np.histogram's bin edges for range (lo, hi)'''
+    if lo == hi:
+        lo, hi = lo - 0.5, hi + 0.5
+    return np.linspace(lo, hi, bins+1)
+
+
+def _count(block, bin_edges):
+    bins = len(bin_edges) - 1
+    lo, hi = bin_edges[0], bin_edges[-1]
+    keep = (block >= lo) & (block <= hi)
+    if not keep.all():
+        block = block[keep]
+    index = ((block - lo)/(hi - lo)*bins).astype(np.intp)
+    index[index == bins] -= 1
+    # within an ULP of an edge the arithmetic can be one bin off
+    index[block < bin_edges[index]] -= 1
+    index[(block >= bin_edges[index+1]) & (index != bins-1)] += 1
+    return np.bincount(index, minlength=bins)
+
+
+def count(chunk, all_edges):
+    '''counts of chunk in each of all_edges, equal bins, as np.histogram'''
+    counts = np.zeros((len(all_edges), len(all_edges[0])-1), dtype=np.intp)
+    # blocks that stay in cache while every histogram counts them
+    for start in range(0, len(chunk), BLOCK):
+        block = chunk[start:start+BLOCK]
+        for row, bin_edges in zip(counts, all_edges):
+            row += _count(block, bin_edges)
+    return counts
+
+
+def between(data, edges, threads=None):
+    '''counts of data below edges[0], between each pair of sorted edges
+    (closed on the left) and from edges[-1] up, len(edges)+1 of them'''
+    data = np.asarray(data, dtype=float)
+    counts = map_sum(lambda chunk: np.bincount(np.searchsorted(edges, chunk, side='right'),
+                                               minlength=len(edges)+1), data, threads)
+    if counts is None:
+        counts = np.zeros(len(edges)+1, dtype=np.intp)
+    return counts
+
+
+def _density(counts, bin_edges):
+    return counts/np.array(np.diff(bin_edges), float)/counts.sum()
+
+
+def histogram(data, bins, range, density=False, threads=None):
+    '''np.histogram(data, bins, range, density) for float data'''
+    data = np.asarray(data, dtype=float)
+    bin_edges = edges(range[0], range[1], bins)
+    counts = map_sum(lambda chunk: count(chunk, [bin_edges])[0], data, threads)
+    if counts is None:
+        counts = np.zeros(bins, dtype=np.intp)
+    if density:
+        return _density(counts, bin_edges), bin_edges
+    return counts, bin_edges
+
+
+def shifted(data, MIN, MAX, SHIFT, bin_width, bins, shift_num, density=False, threads=None):
+    '''the shifted histograms of an ASH, bins from MIN+i*SHIFT to
+    MAX+i*SHIFT-bin_width for each i < shift_num, shape (shift_num, bins)'''
+    data = np.asarray(data, dtype=float)
+    all_edges = [edges(MIN+i*SHIFT, MAX+i*SHIFT-bin_width, bins) for i in range(shift_num)]
+    counts = map_sum(lambda chunk: count(chunk, all_edges), data, threads)
+    if counts is None:
+        counts = np.zeros((shift_num, bins), dtype=np.intp)
+    if density:
+        return np.array([_density(row, bin_edges) for row, bin_edges in zip(counts, all_edges)])
+    return counts
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+The ASH of a dataset too large for memory, from a .npy or raw float file.
+
+    obj = ChunkedAsh('run.npy', memory_mb=256)
+    obj = ChunkedAsh('run.f32', dtype='<f4')
+    python -m plots.ash_plot.ASH.chunked run.npy --memory-mb 256
+
+The file is memory-mapped and read in chunks sized to memory_mb, twice:
+first for the count, range, mean and variance (and from them the Scott or
+Silverman bandwidth), then to count the points in each fine bin. Everything
+after that works on the fine-bin counts, so the result is an ash with the
+same attributes as one made in memory, the KDE binned on the fine bins.
+The chunks, and the counts of the parts of a chunk in flight on the
+binning threads, stay within memory_mb; the total counts take 8 bytes per
+mesh point or, above MESH_LIMIT mesh points, about 16 per occupied fine bin.
+
+The Botev and Freedman-Diaconis rules need the data in order and are not
+offered.
+"""
+from __future__ import division, print_function
+import argparse
+import numpy as np
+
+from .ash import ash, MESH_LIMIT, MESH_COLUMNS
+from .sparse import SparseBins, fine_index
+from . import binning
+
+MEMORY_MB = 256
+# bytes a chunk takes per point, as float64 with its bin index and
+# np.unique's temporaries
+CHUNK_BYTES = 40
+RULES = ('scott', 'silverman')
+
+
+def open_data(path, dtype='<f8'):
+    '''the data of a .npy file or a raw file of dtype, memory-mapped and flat'''
+    if str(path).endswith('.npy'):
+        return np.load(path, mmap_mode='r').reshape(-1)
+    return np.memmap(path, dtype=dtype, mode='r')
+
+
+def chunks(data, memory_mb=MEMORY_MB):
+    '''data as float64 arrays of at most memory_mb worth of points'''
+    size = max(1, int(memory_mb*2**20)//CHUNK_BYTES)
+    for start in range(0, len(data), size):
+        yield np.asarray(data[start:start+size], dtype=float)
+
+
+def scan(data, memory_mb=MEMORY_MB):
+    '''count, min, max, mean and variance of data in one pass'''
+    n, lo, hi, mean, m2 = 0, np.inf, -np.inf, 0.0, 0.0
+    for chunk in chunks(data, memory_mb):
+        # Chan et al. for merging the chunk's moments
+        k = len(chunk)
+        chunk_mean = chunk.mean()
+        chunk_m2 = ((chunk-chunk_mean)**2).sum()
+        delta = chunk_mean - mean
+        mean += delta*k/(n+k)
+        m2 += chunk_m2 + delta**2*n*k/(n+k)
+        n += k
+        lo, hi = min(lo, chunk.min()), max(hi, chunk.max())
+    if n == 0:
+        raise ValueError('No data')
+    return n, lo, hi, mean, m2/n
+
+
+def count(data, MIN, SHIFT, shift_num, bin_num, memory_mb=MEMORY_MB):
+    '''SparseBins of data, counted chunk by chunk'''
+    N = (bin_num+2)*shift_num
+    if N <= MESH_LIMIT:
+        counts = np.zeros(N, dtype=np.int64)
+        # each part in flight counts into all N fine bins of its own, two per
+        # thread, so they share memory_mb with the chunks or the count is serial
+        threads = min(binning.THREADS, int(memory_mb*2**20)//(4*8*N))
+        if threads < 2:
+            for chunk in chunks(data, memory_mb):
+                counts += np.bincount(fine_index(chunk, MIN, SHIFT, shift_num, bin_num), minlength=N)
+        else:
+            for chunk in chunks(data, memory_mb/2):
+                counts += binning.map_sum(lambda part: np.bincount(
+                    fine_index(part, MIN, SHIFT, shift_num, bin_num), minlength=N), chunk, threads)
+        index = np.flatnonzero(counts)
+        return SparseBins(index, counts[index], shift_num, bin_num)
+    index = np.zeros(0, dtype=np.int64)
+    counts = np.zeros(0, dtype=np.int64)
+    for chunk in chunks(data, memory_mb):
+        new_index, new_counts = np.unique(fine_index(chunk, MIN, SHIFT, shift_num, bin_num), return_counts=True)
+        index, where = np.unique(np.r_[index, new_index], return_inverse=True)
+        counts = np.bincount(where, np.r_[counts, new_counts]).astype(np.int64)
+    return SparseBins(index, counts, shift_num, bin_num)
+
+
+class ChunkedAsh(ash):
+    def __init__(self, path, bin_num=None, shift_num=50, normed=True, rule='scott',
+                 dtype='<f8', memory_mb=MEMORY_MB):
+        if bin_num is None and rule not in RULES:
+            raise ValueError('rule must be one of %s' % ', '.join(RULES))
+        self.memory_mb = memory_mb
+        self.data = open_data(path, dtype)
+        self.shift_num = shift_num
+        self.normed = normed
+        self.sparse = None
+        n, self.data_min, self.data_max, self.data_mean, self.data_var = scan(self.data, memory_mb)
+        self.data_len = n
+        # what gaussian_kde's covariance uses
+        std = np.sqrt(self.data_var*n/(n-1)) if n > 1 else 0
+        if bin_num is None:
+            # scipy's factors for one dimension
+            factor = n**(-1/5) if rule == 'scott' else (n*3/4)**(-1/5)
+            self.bw = factor*np.sqrt(self.data_var)
+            self.bins_from_bw()
+            kde_bw = factor*std
+        else:
+            self.set_bins(bin_num)
+            # set_bandwidth takes the scalar as the factor
+            kde_bw = self.bw*std
+        self.kde_mesh = self.kde_grid()
+        self.kde_den = self.binned_kde(self.kde_mesh, kde_bw)
+
+    def calc_ash_den(self, normed=True):
+        bins = count(self.data, self.MIN, self.SHIFT, self.shift_num, self.bin_num, self.memory_mb)
+        self.fine_bins = bins
+        if bins.N > MESH_LIMIT:
+            return self.calc_sparse_den(normed, bins)
+        self.sparse = None
+        self.ash_mesh = np.linspace(self.MIN, self.MAX, bins.N)
+        scale = self.shift_num*self.data_len*self.bin_width if normed else self.shift_num
+        self.ash_den = bins.den(np.arange(bins.N))/scale
+        ash_den_index = np.where(self.ash_den > 0)
+        self.ash_mesh = self.ash_mesh[ash_den_index]
+        self.ash_den = self.ash_den[ash_den_index]
+
+    def binned_kde(self, x, bw):
+        '''Gaussian KDE of bandwidth bw at x from the fine-bin counts, to 5 bw'''
+        bins = self.fine_bins
+        centre = self.MIN + (bins.index+0.5)*self.SHIFT
+        lo = np.searchsorted(centre, x-5*bw)
+        hi = np.searchsorted(centre, x+5*bw)
+        width = max(int((hi-lo).max()), 1)
+        step = max(1, int(self.memory_mb*2**20)//(CHUNK_BYTES*width))
+        den = np.zeros(len(x))
+        for start in range(0, len(x), step):
+            part = slice(start, start+step)
+            near = lo[part, None] + np.arange(width)
+            inside = near < hi[part, None]
+            near = np.minimum(near, len(centre)-1)
+            z = (x[part, None] - centre[near])/bw
+            den[part] = np.where(inside, bins.counts[near]*np.exp(-z*z/2), 0).sum(1)
+        return den/(self.data_len*bw*np.sqrt(2*np.pi))
+
+    def shift_hists(self, normed=True):
+        if self.sparse is not None:
+            return ash.shift_hists(self, normed)
+        hists = self.fine_bins.hists(self.bin_num+1).astype(float)
+        return hists/(self.data_len*self.bin_width) if normed else hists
+
+    def rug_points(self, bins=None):
+        '''rug marks merged to bins (MESH_COLUMNS by default) across the data range'''
+        bins = bins or MESH_COLUMNS
+        counts = np.zeros(bins, dtype=np.int64)
+        for chunk in chunks(self.data, self.memory_mb):
+            counts += binning.histogram(chunk, bins, range=(self.data_min, self.data_max))[0]
+        edges = np.linspace(self.data_min, self.data_max, bins+1)
+        return ((edges[:-1] + edges[1:])/2)[counts > 0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ASH statistics of a .npy or raw float file')
+    parser.add_argument('path')
+    parser.add_argument('--dtype', default='<f8', help='of a raw file, default <f8')
+    parser.add_argument('--rule', default='scott', choices=RULES)
+    parser.add_argument('--bin-num', type=int)
+    parser.add_argument('--memory-mb', type=float, default=MEMORY_MB)
+    args = parser.parse_args()
+    obj = ChunkedAsh(args.path, bin_num=args.bin_num, rule=args.rule,
+                     dtype=args.dtype, memory_mb=args.memory_mb)
+    print(obj.stats_string(latex=False))
+    for name in ('mean', 'sigma', 'unc', 'bw', 'bin_num', 'bin_width'):
+        print('%s = %s' % (name, getattr(obj, name)))
+
+
+if __name__ == '__main__':
+    main()
@@ -18,14 +18,21 @@ try:
 except NameError:
     xrange = range
 
-import scipy as sci
+import numpy as np
+
+try:
+    trapz = np.trapezoid
+except AttributeError:
+    trapz = np.trapz
 import scipy.optimize
 import scipy.fftpack
 
+from . import binning
+
 def kde(data, N=None, MIN=None, MAX=None):
 
     # Parameters to set up the mesh on which to calculate
-    N = 2**14 if N is None else int(2**sci.ceil(sci.log2(N)))
+    N = 2**14 if N is None else int(2**np.ceil(np.log2(N)))
     if MIN is None or MAX is None:
         minimum = min(data)
         maximum = max(data)
@@ -38,7 +45,7 @@ def kde(data, N=None, MIN=None, MAX=None):
 
     # Histogram the data to get a crude first approximation of the density
     M = len(data)
-    DataHist, bins = sci.histogram(data, bins=N, range=(MIN,MAX))
+    DataHist, bins = binning.histogram(data, N, range=(MIN,MAX))
     DataHist = DataHist/M
     DCTData = scipy.fftpack.dct(DataHist, norm=None)
 
@@ -55,24 +62,24 @@ def kde(data, N=None, MIN=None, MAX=None):
         return None
 
     # Smooth the DCTransformed data using t_star
-    SmDCTData = DCTData*sci.exp(-sci.arange(N)**2*sci.pi**2*t_star/2)
+    SmDCTData = DCTData*np.exp(-np.arange(N)**2*np.pi**2*t_star/2)
     # Inverse DCT to get density
     density = scipy.fftpack.idct(SmDCTData, norm=None)*N/R
     mesh = [(bins[i]+bins[i+1])/2 for i in xrange(N)]
-    bandwidth = sci.sqrt(t_star)*R
+    bandwidth = np.sqrt(t_star)*R
     
-    density = density/sci.trapz(density, mesh)
+    density = density/trapz(density, mesh)
     return bandwidth, mesh, density
 
 def fixed_point(t, M, I, a2):
     l=7
-    I = sci.float128(I)
-    M = sci.float128(M)
-    a2 = sci.float128(a2)
-    f = 2*sci.pi**(2*l)*sci.sum(I**l*a2*sci.exp(-I*sci.pi**2*t))
+    I = np.float128(I)
+    M = np.float128(M)
+    a2 = np.float128(a2)
+    f = 2*np.pi**(2*l)*np.sum(I**l*a2*np.exp(-I*np.pi**2*t))
     for s in range(l, 1, -1):
-        K0 = sci.prod(xrange(1, 2*s, 2))/sci.sqrt(2*sci.pi)
+        K0 = np.prod(xrange(1, 2*s, 2))/np.sqrt(2*np.pi)
         const = (1 + (1/2)**(s + 1/2))/3
         time=(2*const*K0/M/f)**(2/(3+2*s))
-        f=2*sci.pi**(2*s)*sci.sum(I**s*a2*sci.exp(-I*sci.pi**2*time))
-    return t-(2*M*sci.sqrt(sci.pi)*f)**(-2/5)
+        f=2*np.pi**(2*s)*np.sum(I**s*a2*np.exp(-I*np.pi**2*time))
+    return t-(2*M*np.sqrt(np.pi)*f)**(-2/5)
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of whether two or more datasets come from one distribution, with
+permutation p-values from counts on a shared fine grid.
+
+The pooled data is sorted once and cut into FINE_BINS cells of about equal
+counts, or into its distinct values when there are no more of them than
+that, which makes the statistics exact. A permutation of the group labels
+then only changes how the count of each cell splits between the groups,
+which is a multivariate hypergeometric draw, so permutations are drawn as
+arrays of counts CHUNK at a time and their statistics come from cumulative
+sums over the cells, never touching the data again. Chunks are drawn on the
+binning thread pool, each from a generator of its own, which NumPy runs
+without the GIL; the result does not depend on the number of threads.
+
+ks is the largest distance between the empirical CDFs of any two groups,
+the two-sample Kolmogorov-Smirnov statistic for two. ad is the k-sample
+Anderson-Darling statistic of Scholz and Stephens with midranks for ties,
+standardized as scipy.stats.anderson_ksamp reports it. Both are computed
+on the distinct values, so they are always exact. Their p-values are the
+share of permutations with a statistic at least as large, counting the
+data itself; when the cells are quantiles rather than the distinct values
+the permutations are compared with the statistics over the cells, reported
+as ks_cells and ad_cells, an approximation of ks and ad.
+
+PLOT_PERMUTATIONS sets the number of permutations, 10000 by default.
+"""
+from __future__ import division, print_function
+import os
+import numpy as np
+
+from . import binning
+
+PERMUTATIONS = int(os.environ.get('PLOT_PERMUTATIONS', 10000))
+FINE_BINS = 1024
+# permutations drawn and reduced at once
+CHUNK = 250
+
+
+def cells(samples, bins=FINE_BINS):
+    '''counts of each sample on the shared cells of the pooled data, shape
+    (len(samples), cells), and whether the cells are its distinct values,
+    always so for bins None'''
+    pooled = np.sort(np.concatenate(samples))
+    distinct = pooled[np.r_[True, pooled[1:] != pooled[:-1]]]
+    exact = bins is None or len(distinct) <= bins
+    if exact:
+        edges = distinct[1:]
+    else:
+        # cuts at pooled quantiles, equal values always in one cell
+        edges = np.unique(pooled[np.linspace(0, len(pooled), bins + 1)[1:-1].astype(np.intp)])
+    counts = np.array([binning.between(s, edges) for s in samples])
+    return counts[:, counts.sum(axis=0) > 0], exact
+
+
+def ks(counts):
+    '''largest distance between the group CDFs over the cells, counts of
+    shape (groups, ..., cells)'''
+    n = counts.sum(axis=-1, keepdims=True)
+    cdf = np.cumsum(counts, axis=-1)/n
+    return (cdf.max(axis=0) - cdf.min(axis=0)).max(axis=-1)
+
+
+def ad(counts):
+    '''Scholz and Stephens' midrank A2akN over the cells, counts of shape
+    (groups, ..., cells)'''
+    n = counts.sum(axis=-1)
+    N = n.sum(axis=0)[..., None]
+    l = counts.sum(axis=0)
+    B = np.cumsum(l, axis=-1) - l/2
+    denominator = B*(N - B) - N*l/4
+    total = 0
+    for f, n_i in zip(counts, n):
+        M = np.cumsum(f, axis=-1) - f/2
+        total = total + (l*(N*M - B*n_i[..., None])**2/denominator).sum(axis=-1)/n_i
+    return total*(N[..., 0] - 1)/N[..., 0]**2
+
+
+def ad_standardize(A2akN, n):
+    '''(A2akN - (k-1))/sigma as scipy.stats.anderson_ksamp, n the group sizes'''
+    n = np.asarray(n, dtype=float)
+    k, N = len(n), n.sum()
+    H = (1/n).sum()
+    hs_cs = (1/np.arange(N - 1, 1, -1)).cumsum()
+    h = hs_cs[-1] + 1
+    g = (hs_cs/np.arange(2, N)).sum()
+    a = (4*g - 6)*(k - 1) + (10 - 6*g)*H
+    b = (2*g - 4)*k**2 + 8*h*k + (2*g - 14*h - 4)*H - 8*h + 4*g - 6
+    c = (6*h + 2*g - 2)*k**2 + (4*h - 4*g + 6)*k + (2*h - 6)*H + 4*h
+    d = (2*h + 6)*k**2 - 4*h*k
+    sigmasq = (a*N**3 + b*N**2 + c*N + d)/((N - 1)*(N - 2)*(N - 3))
+    return (A2akN - (k - 1))/np.sqrt(sigmasq)
+
+
+def draw(counts, size, rng):
+    '''size permutations of the group labels as counts, shape (groups, size,
+    cells): each group takes its size from what the earlier ones left'''
+    n = counts.sum(axis=1)
+    drawn = np.empty((len(counts), size, counts.shape[1]), dtype=np.int64)
+    drawn[0] = rng.multivariate_hypergeometric(counts.sum(axis=0), n[0],
+                                               size=size)
+    rest = counts.sum(axis=0) - drawn[0]
+    for i, n_i in enumerate(n[1:-1], 1):
+        # what is left differs between permutations from here on
+        for j in range(size):
+            drawn[i, j] = rng.multivariate_hypergeometric(rest[j], n_i)
+        rest -= drawn[i]
+    drawn[-1] = rest
+    return drawn
+
+
+def _exceed(counts, size, seed, observed):
+    drawn = draw(counts, size, np.random.default_rng(seed))
+    # a hair below, so permutations that tie the data count
+    return np.array([(ks(drawn) >= observed[0]*(1 - 1e-12)).sum(),
+                     (ad(drawn) >= observed[1]*(1 - 1e-12)).sum()])
+
+
+def compare(samples, permutations=None, bins=FINE_BINS, seed=0, threads=None,
+            check=None):
+    '''ks, ad and their permutation p-values for the samples, a dict. check(),
+    if given, is called before each chunk is taken and may raise to stop'''
+    permutations = PERMUTATIONS if permutations is None else permutations
+    samples = [np.asarray(s, dtype=float) for s in samples]
+    counts, exact = cells(samples, bins)
+    observed = (ks(counts), ad(counts))
+    n = counts.sum(axis=1)
+    result = {'groups': len(samples), 'n': [len(s) for s in samples],
+              'ks': float(observed[0]),
+              'ad': float(ad_standardize(observed[1], n)),
+              'cells': counts.shape[1], 'exact': exact,
+              'permutations': permutations}
+    if not exact:
+        distinct = cells(samples, None)[0]
+        result['ks_cells'], result['ad_cells'] = result['ks'], result['ad']
+        result['ks'] = float(ks(distinct))
+        result['ad'] = float(ad_standardize(ad(distinct), n))
+    sizes = [min(CHUNK, permutations - start) for start in range(0, permutations, CHUNK)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    threads = binning.THREADS if threads is None else max(1, threads)
+    check = check or (lambda: None)
+    parts = []
+    if threads == 1 or len(sizes) < 2:
+        for size, s in zip(sizes, seeds):
+            check()
+            parts.append(_exceed(counts, size, s, observed))
+    else:
+        executor = binning.pool(threads)
+        futures = [executor.submit(_exceed, counts, size, s, observed)
+                   for size, s in zip(sizes, seeds)]
+        try:
+            for f in futures:
+                check()
+                parts.append(f.result())
+        finally:
+            # chunks not yet started are dropped if check() raised
+            for f in futures:
+                f.cancel()
+    exceed = np.sum(parts, axis=0) if parts else np.zeros(2)
+    result['ks_p'] = float((1 + exceed[0])/(1 + permutations))
+    result['ad_p'] = float((1 + exceed[1])/(1 + permutations))
+    return result
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+The average shifted histogram from the occupied fine bins only.
+
+The shift_num histograms of an ASH, each shifted by one fine bin of width
+SHIFT, average to a triangle of half width shift_num fine bins over the
+count of every fine bin. ash keeps a dense mesh of (bin_num+2)*shift_num
+points for it, which a narrow bandwidth over a wide range (an outlier, a
+tight cluster with a long tail) blows up to tens of millions. SparseBins
+holds just the occupied fine bins and their counts, gives the density at
+any mesh index and its running sum from prefix sums, and the mean, sigma
+and 68.2% window from those, so memory follows the occupied bins and the
+mesh drawn is capped at a number of columns.
+"""
+from __future__ import division, print_function
+import numpy as np
+
+
+def fine_index(data, MIN, SHIFT, shift_num, bin_num):
+    '''mesh index of the fine bin of each point'''
+    data = np.asarray(data, dtype=float)
+    index = np.floor((data - MIN)/SHIFT).astype(np.int64)
+    # within an ULP of an edge the division can be one bin off
+    index[data < MIN + index*SHIFT] -= 1
+    index[data >= MIN + (index+1)*SHIFT] += 1
+    # the last histogram edge is closed, like np.histogram's
+    return np.clip(index, 0, (bin_num+1)*shift_num - 1)
+
+
+class SparseBins:
+    def __init__(self, index, counts, shift_num, bin_num):
+        '''index sorted and unique, counts of the points in each'''
+        self.S = shift_num
+        # mesh indices, the dense mesh has N points from MIN to MAX
+        self.N = (bin_num+2)*shift_num
+        self.index = np.asarray(index, dtype=np.int64)
+        self.counts = np.asarray(counts, dtype=np.int64)
+        self.n = int(self.counts.sum())
+        self.pc = np.r_[0, np.cumsum(self.counts)]
+        self.pcm = np.r_[0, np.cumsum(self.counts*self.index)]
+
+    @classmethod
+    def from_data(cls, data, MIN, SHIFT, shift_num, bin_num):
+        index, counts = np.unique(fine_index(data, MIN, SHIFT, shift_num, bin_num), return_counts=True)
+        return cls(index, counts, shift_num, bin_num)
+
+    def den(self, j):
+        '''the ASH density at mesh indices j in counts, shift_num*n*bin_width
+        times the density as exact integers'''
+        j = np.asarray(j, dtype=np.int64)
+        S = self.S
+        lo = np.searchsorted(self.index, j-S+1, 'left')
+        mid = np.searchsorted(self.index, j, 'right')
+        hi = np.searchsorted(self.index, j+S-1, 'right')
+        left = (S-j)*(self.pc[mid]-self.pc[lo]) + (self.pcm[mid]-self.pcm[lo])
+        right = (S+j)*(self.pc[hi]-self.pc[mid]) - (self.pcm[hi]-self.pcm[mid])
+        return left + right
+
+    def cum(self, j):
+        '''den summed over mesh indices up to and including j'''
+        j = np.atleast_1d(np.asarray(j, dtype=np.int64))
+        S = self.S
+        # fine bins S-1 or more below j have their whole triangle in
+        lo = np.searchsorted(self.index, j-S+2, 'left')
+        hi = np.searchsorted(self.index, j+S, 'left')
+        near = lo[:,None] + np.arange(2*S-2)
+        inside = near < hi[:,None]
+        near = np.minimum(near, len(self.index)-1)
+        k = j[:,None] - self.index[near]
+        part = np.where(k < 0, (k+S)*(k+S+1)//2, S*S - (S-1-k)*(S-k)//2)
+        return S*S*self.pc[lo] + np.where(inside, self.counts[near]*part, 0).sum(1)
+
+    def moments(self):
+        '''mean and variance of the ASH in mesh indices'''
+        mean = np.average(self.index, weights=self.counts)
+        var = np.average((self.index-mean)**2, weights=self.counts)
+        # plus that of the triangle, (S**2-1)/6 fine bins squared
+        return mean, var + (self.S**2-1)/6
+
+    def window(self, centre, area=0.682):
+        '''smallest i with the trapezoid area over centre-i to centre+i at least area'''
+        # the whole mesh sums to S**2 counts per point
+        total = self.S**2*self.n
+        def covered(i):
+            a, b = max(centre-i, 0), min(centre+i, self.N-1)
+            inner = self.cum(b)[0] - (self.cum(a-1)[0] if a > 0 else 0)
+            return (inner - (self.den(a)+self.den(b))/2)/total
+        lo, hi = 1, self.N
+        while lo < hi:
+            i = (lo+hi)//2
+            if covered(i) >= area:
+                hi = i
+            else:
+                lo = i+1
+        return lo
+
+    def mesh(self, columns):
+        '''mesh indices to draw at most about 4*columns points with: each column's
+        start and, where it has occupied bins, the highest of them and the ends
+        of their triangles, so narrow peaks keep their shape'''
+        col = self.index*columns//self.N
+        starts = -(-np.arange(columns, dtype=np.int64)*self.N//columns)
+        order = np.lexsort((-self.den(self.index), col))
+        first = np.r_[True, col[order][1:] != col[order][:-1]]
+        # index is sorted, so the first and last of each column
+        edge = np.r_[True, col[1:] != col[:-1]]
+        lows = self.index[edge] - self.S + 1
+        highs = self.index[np.r_[edge[1:], True]] + self.S - 1
+        j = np.concatenate([starts, self.index[order][first], lows, highs])
+        return np.unique(np.clip(j, 0, self.N-1))
+
+    def hists(self, bins):
+        '''counts of each shifted histogram, shape (shift_num, bins)'''
+        rows = np.zeros((self.S, bins), dtype=np.int64)
+        for i in range(self.S):
+            k = (self.index - i)//self.S
+            inside = (k >= 0) & (k < bins)
+            rows[i] = np.bincount(k[inside], self.counts[inside], minlength=bins)
+        return rows
+
+    def shift_hists(self, columns):
+        '''counts of each shifted histogram, the highest bin in each of columns
+        across the mesh, shape (shift_num, columns)'''
+        S = self.S
+        rows = np.zeros((S, columns), dtype=np.int64)
+        for i in range(S):
+            # bin k of histogram i covers fine bins i+k*S to i+k*S+S-1
+            k = (self.index - i)//S
+            first = np.r_[True, k[1:] != k[:-1]]
+            heights = np.add.reduceat(self.counts, np.flatnonzero(first))
+            left = (i + k[first]*S)*columns//self.N
+            right = -(-(i + (k[first]+1)*S)*columns//self.N)
+            # every column a bin touches, once if it is narrower
+            span = np.maximum(right-left, 1)
+            col = np.repeat(left - np.cumsum(span) + span, span) + np.arange(span.sum())
+            np.maximum.at(rows[i], np.clip(col, 0, columns-1), np.repeat(heights, span))
+        return rows
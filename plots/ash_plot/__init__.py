@@ -1 +1,11 @@
-from .ash_plot import *
+"""
+Average shifted histogram plotter.
+"""
+# (path, methods, 'module:function')
+ROUTES = [('/ash', ['POST', 'GET'], 'ash_plot:plot'),
+          ('/api/ash', ['POST'], 'ash_api:api_ash'),
+          ('/api/ash/geometry', ['POST'], 'ash_api:api_ash_geometry'),
+          ('/api/ash/compare', ['POST'], 'ash_api:api_ash_compare'),
+          ('/api/ash/batch', ['POST'], 'ash_batch:api_ash_batch')]
+# renders the default data, see plots.warm_up()
+WARMUP = ['ash_plot:warm_up']
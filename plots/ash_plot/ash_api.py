@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+/api/ash: the average shifted histogram and KDE of a dataset as numbers,
+without matplotlib.
+
+    POST {"data": [...], "bin_num": 20, "rule": "scott"}
+
+rule is scott (the default, as the plot uses), silverman, fd, or botev for
+the diffusion KDE bandwidth on 50 or more points. bin_num overrides it.
+
+/api/ash/geometry: what static/ash_canvas.js needs to draw the preview
+plot, with the density line cut to CANVAS_POINTS, the heights of every
+shifted histogram as infill (shift_num rows of bins, flattened) and
+the rug merged to RUG_BINS positions.
+
+/api/ash/compare: whether two or more datasets come from one distribution,
+the KS and Anderson-Darling statistics with permutation p-values of
+ASH.permutation and the bins the /ash comparison shares between them. The
+tests run on the render queue within the ash time budget, so too many
+permutations of too much data answer 504 rather than hold a thread.
+
+    POST {"datasets": [[...], [...]], "permutations": 10000}
+
+The plots and the geometry use the ash() of a dataset with the default
+bins, which cached_ash() keeps for the last ASH_CACHE datasets so changing
+only colors or labels does not compute it again. cached_infill(),
+cached_rug() and cached_compare() do the same for the infill opacity mask,
+the merged rug and the tests of the datasets compared. Cached values are
+shared between threads, so nothing drawing a plot may change them.
+"""
+from __future__ import division, print_function
+
+import json
+import os
+import threading
+from collections import OrderedDict, defaultdict
+
+import numpy as np
+from bottle import HTTPError
+
+from .ASH.ash import ash, merge_rug
+from .ASH import permutation
+
+from .. import api
+from .. import datastore
+from .. import jobs
+from .. import memory
+from .. import metrics
+
+RULES = ('scott', 'silverman', 'fd', 'botev')
+MAX_BIN_NUM = 10000
+CANVAS_POINTS = 1200
+RUG_BINS = 1200
+MARGIN = 0.05
+ASH_CACHE = int(os.environ.get('PLOT_ASH_CACHE', 8))
+MAX_GROUPS = 5
+MAX_PERMUTATIONS = 100000
+
+_caches = {}
+_cache_lock = threading.Lock()
+_cache_counts = defaultdict(int)
+memory.cache('ash', lambda: list(_caches.values()))
+
+
+def compute(data, bin_num=None, rule='scott'):
+    'Scalars and arrays of the ASH of data'
+    if rule == 'botev':
+        obj = ash(data, bin_num=bin_num)
+    else:
+        obj = ash(data, bin_num=bin_num, force_scott=True, rule=rule)
+    scalars = {'n': obj.data_len, 'mean': obj.mean, 'sigma': obj.sigma,
+               'unc': obj.unc, 'bw': obj.bw, 'bin_num': obj.bin_num,
+               'bin_width': obj.bin_width}
+    arrays = [('ash_mesh', obj.ash_mesh), ('ash_den', obj.ash_den),
+              ('kde_mesh', obj.kde_mesh), ('kde_den', obj.kde_den)]
+    return scalars, arrays
+
+
+def bin_num_param(params):
+    'params bin_num, 400 unless None or 1 to MAX_BIN_NUM'
+    bin_num = api.param(params, 'bin_num', int)
+    if bin_num is not None and not 1 <= bin_num <= MAX_BIN_NUM:
+        raise HTTPError(400, 'bin_num must be 1 to %i.' % MAX_BIN_NUM)
+    return bin_num
+
+
+def api_ash():
+    (data,), params = api.arrays(['data'], min_len=5)
+    bin_num = bin_num_param(params)
+    rule = params.get('rule') or 'scott'
+    if rule not in RULES:
+        raise HTTPError(400, 'rule must be one of %s.' % ', '.join(RULES))
+    return api.respond(*compute(data, bin_num, rule))
+
+
+def _cached(kind, key, make):
+    """
+    The cached value of kind under key, or make()'s. Each kind keeps its
+    last ASH_CACHE values, which are shared between threads and never
+    changed once made.
+    """
+    with _cache_lock:
+        cache = _caches.setdefault(kind, OrderedDict())
+        obj = cache.get(key)
+        _cache_counts[kind, 'miss' if obj is None else 'hit'] += 1
+        if obj is not None:
+            cache.move_to_end(key)
+            return obj
+    obj = make()
+    with _cache_lock:
+        cache[key] = obj
+        while len(cache) > ASH_CACHE:
+            cache.popitem(last=False)
+    return obj
+
+
+def _key(data, bin_width=None, origin=None):
+    if bin_width is None:
+        return datastore.Store.digest((data,))
+    return datastore.Store.digest((data, [bin_width, origin]))
+
+
+def cached_ash(data, bin_width=None, origin=None):
+    """
+    ash(data, force_scott=True), or on the bins of bin_width and origin when
+    given, shared by requests for the same data
+    """
+    data = np.asarray(data, dtype=float)
+    if bin_width is None:
+        return _cached('ash', _key(data), lambda: ash(data, force_scott=True))
+    return _cached('ash', _key(data, bin_width, origin),
+                   lambda: ash(data, bin_width=bin_width, origin=origin))
+
+
+def cached_infill(data, xlim, ylim, alpha=1, bin_width=None, origin=None):
+    'The infill_mask() of cached_ash(data, bin_width, origin), read only'
+    data = np.asarray(data, dtype=float)
+
+    def make():
+        obj = cached_ash(data, bin_width, origin)
+        mask, extent = obj.infill_mask(xlim, ylim, alpha=alpha)
+        mask.flags.writeable = False
+        return mask, extent
+    key = (_key(data, bin_width, origin), tuple(xlim), tuple(ylim), alpha)
+    return _cached('infill', key, make)
+
+
+def cached_infill_top(data, bin_width=None, origin=None):
+    'The infill_top() of cached_ash(data, bin_width, origin)'
+    data = np.asarray(data, dtype=float)
+    return _cached('infill_top', _key(data, bin_width, origin),
+                   lambda: cached_ash(data, bin_width, origin).infill_top())
+
+
+def cached_rug(data, bins):
+    'merge_rug(data, bins), read only'
+    data = np.asarray(data, dtype=float)
+
+    def make():
+        rug = merge_rug(data, bins)
+        rug.flags.writeable = False
+        return rug
+    return _cached('rug', (_key(data), bins), make)
+
+
+def shared_bins(datasets):
+    """
+    (bin_width, origin) for the ashes of datasets to share: the widest of the
+    bins Scott's rule gives each, so the smallest dataset is not all noise,
+    from the lowest point of any
+    """
+    bw = max(np.std(d)*len(d)**(-1/5) for d in datasets)
+    if not bw > 0:
+        bw = 1.
+    return bw*np.sqrt(2*np.pi), min(np.min(d) for d in datasets)
+
+
+def cached_compare(datasets, permutations=None):
+    """
+    permutation.compare(datasets, permutations), kept as cached_ash is and
+    stopped between chunks once the render's budget is spent
+    """
+    datasets = [np.asarray(d, dtype=float) for d in datasets]
+    if permutations is None:
+        permutations = permutation.PERMUTATIONS
+    key = (datastore.Store.digest(datasets), permutations)
+    return _cached('compare', key,
+                   lambda: permutation.compare(datasets, permutations,
+                                               check=jobs.checkpoint))
+
+
+@metrics.collector
+def _cache_metrics():
+    return (['# HELP plot_ash_cache_total Cached ASH, infill, rug and test '
+             'lookups by result.',
+             '# TYPE plot_ash_cache_total counter'] +
+            ['plot_ash_cache_total{kind="%s",result="%s"} %i' % (kind, result,
+                                                                 count)
+             for (kind, result), count in sorted(_cache_counts.items())])
+
+
+def geometry(data):
+    'Scalars and arrays of the preview plot of data, as ash_png draws it'
+    obj = cached_ash(data)
+    mesh, den = obj.ash_mesh, obj.ash_den
+    infill = obj.shift_hists()
+    # the axis limits matplotlib autoscales to
+    xmin, xmax = mesh[0], mesh[-1]
+    xmin, xmax = xmin - (xmax - xmin)*MARGIN, xmax + (xmax - xmin)*MARGIN
+    lo, hi = den.min(), den.max()
+    ymin = lo - (hi - lo)*MARGIN
+    ymax = max(hi + (hi - lo)*MARGIN, infill.max()*1.1)
+    if len(mesh) > CANVAS_POINTS:
+        x = np.linspace(mesh[0], mesh[-1], CANVAS_POINTS)
+        mesh, den = x, np.interp(x, mesh, den)
+    rug = np.unique(cached_rug(data, RUG_BINS))
+    scalars = {'n': obj.data_len, 'stats': obj.stats_string(latex=False),
+               'xmin': xmin, 'xmax': xmax, 'ymin': ymin, 'ymax': ymax,
+               'shift_num': obj.shift_num}
+    scalars.update(zip(('hist_min', 'shift', 'bin_width', 'bins'),
+                       obj.hist_layout()))
+    arrays = [('mesh', mesh), ('den', den), ('infill', infill.ravel()),
+              ('rug', rug)]
+    return scalars, arrays
+
+
+def api_ash_geometry():
+    (data,), params = api.arrays(['data'], min_len=5)
+    return api.respond(*geometry(data))
+
+
+def api_ash_compare():
+    try:
+        params = json.loads(api.read_body().decode('utf-8'))
+    except ValueError:
+        raise HTTPError(400, 'Body must be JSON.')
+    if not isinstance(params, dict):
+        raise HTTPError(400, 'Body must be a JSON object.')
+    datasets = params.get('datasets')
+    if not isinstance(datasets, list) or not 2 <= len(datasets) <= MAX_GROUPS:
+        raise HTTPError(400, 'datasets must be a list of 2 to %i arrays.' %
+                        MAX_GROUPS)
+    datasets = [api.as_array(d, 'datasets[%i]' % i, min_len=5)
+                for i, d in enumerate(datasets)]
+    metrics.label(size=sum(len(d) for d in datasets))
+    permutations = api.param(params, 'permutations', int,
+                             permutation.PERMUTATIONS)
+    if not 0 <= permutations <= MAX_PERMUTATIONS:
+        raise HTTPError(400, 'permutations must be 0 to %i.' %
+                        MAX_PERMUTATIONS)
+    scalars = dict(jobs.run('ash', cached_compare, datasets, permutations))
+    scalars['bin_width'], scalars['origin'] = shared_bins(datasets)
+    return api.respond(scalars, [])
@@ -14,11 +14,22 @@
         </div>
         <div id="rightcolumn">
             %if (filled == 'good'):
-                <img class="plot" src="data:image/png;base64,{{img}}" alt="ASH Plot" width=600 align="center"/>
+                %if geometry:
+                <canvas class="plot" id="ash_canvas" width="600" height="600"></canvas>
+                <script type="text/javascript">var ash_geometry = {{!geometry}};</script>
+                <script type="text/javascript" src="static/ash_canvas.js"></script>
+                %elif poll:
+                <img class="plot" id="progressive" data-poll="{{poll}}" data-form="ashform" src="data:{{img_type}};base64,{{img}}" alt="ASH Plot" width=600 align="center"/>
+                <p id="progressive_note">A sketch from a sample of the data, the full plot follows...</p>
+                <script type="text/javascript" src="static/progressive.js"></script>
+                %else:
+                <img class="plot" src="data:{{img_type}};base64,{{img}}" alt="ASH Plot" width=600 align="center"/>
+                %end
                 <div id="chart_export"><h3>Download Full Resolution Charts...</h3>
                     <a href="#"><label style="cursor:pointer" for="png_download">Download PNG</label></a> (300 dpi ready for publication)<br />
                     <!--<a href="png?type=pdf">Download PDF</a><br />-->
                     <a href="#"><label style="cursor:pointer" for="svg_download">Download SVG</label></a> (Edit this for free in <a href="https://www.inkscape.org/">Inkscape</a>.)<br />
+                    <a href="#"><label style="cursor:pointer" for="svgz_download">Download SVGZ</label></a> (The SVG gzip compressed.)<br />
                 </div>
             %end
         </div>
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+/api/ash/batch: the ASH statistics, and optionally images, of many named
+datasets in one request.
+
+    POST {"datasets": {"name": [...], ...}, "images": ["png", "svg"],
+          "bin_num": 20, "rule": "scott", "arrays": false}
+
+or a CSV (Content-Type text/csv) with a header row of names and one
+dataset per column, blank cells ignored, parameters in the query string
+(images=png,svg). Image types are those of render.OUTPUTS.
+
+Items are computed on the render queue, at most BATCH_WORKERS at a time so
+the interactive routes keep some workers, each within the ash time budget.
+Results stream back as each item finishes, as NDJSON lines
+
+    {"name": ..., "ok": true, "n": ..., "mean": ..., "images": {"png": b64}}
+    {"name": ..., "ok": false, "error": "..."}
+
+or with ?format=zip as a ZIP of <name>.json plus an image file per type
+(<name>.svg, <name>.pngat.png) per item. A failed item is reported on its own and the batch carries on.
+"""
+from __future__ import division, print_function
+
+import base64
+import csv
+import io
+import json
+import os
+import re
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from bottle import request, response, HTTPError
+
+from .. import api
+from .. import jobs
+from .. import metrics
+from . import ash_api
+
+BATCH_WORKERS = int(os.environ.get('PLOT_BATCH_WORKERS',
+                                   max(1, jobs.WORKERS // 2)))
+MAX_ITEMS = 1000
+MIN_LEN = 5
+MAX_LEN = 100000
+
+
+class ItemError(Exception):
+    pass
+
+
+def parse_csv(text):
+    'Columns of a CSV with a header row as [(name, [str, ...]), ...]'
+    rows = list(csv.reader(io.StringIO(text)))
+    if not rows:
+        return []
+    names = []
+    for i, name in enumerate(rows[0]):
+        name = name.strip() or 'column_%i' % (i + 1)
+        while name in names:
+            name += '_%i' % (i + 1)
+        names.append(name)
+    columns = [(name, []) for name in names]
+    for row in rows[1:]:
+        for (_, values), cell in zip(columns, row):
+            if cell.strip():
+                values.append(cell.strip())
+    return columns
+
+
+def datasets():
+    'The named datasets and the parameters of the request'
+    if request.content_type.startswith('text/csv'):
+        items = parse_csv(api.read_body().decode('utf-8-sig'))
+        params = dict(request.query.items())
+        images = params.get('images', '')
+        params['images'] = [i for i in images.split(',') if i]
+    else:
+        try:
+            params = json.loads(api.read_body().decode('utf-8'))
+        except ValueError:
+            raise HTTPError(400, 'Body must be JSON or text/csv.')
+        if not isinstance(params, dict) or \
+                not isinstance(params.get('datasets'), dict):
+            raise HTTPError(400, 'Body must be a JSON object with a '
+                            'datasets map.')
+        items = sorted(params.pop('datasets').items())
+    if not 1 <= len(items) <= MAX_ITEMS:
+        raise HTTPError(400, 'A batch holds 1 to %i datasets.' % MAX_ITEMS)
+    return items, params
+
+
+def _values(values):
+    try:
+        return api.as_array(values, 'Data', MIN_LEN, MAX_LEN)
+    except HTTPError as err:
+        raise ItemError(err.body)
+
+
+def item(name, values, bin_num, rule, images, arrays):
+    'Result of one dataset: a JSON-able dict and {image type: bytes}'
+    data = _values(values)
+    scalars, result_arrays = ash_api.compute(data, bin_num, rule)
+    result = api.plain(scalars)
+    if arrays:
+        result.update((k, a.tolist()) for k, a in result_arrays)
+    rendered = {}
+    if images:
+        from .ash_plot import ash_png
+        for chart_type in images:
+            jobs.checkpoint()
+            rendered[chart_type] = ash_png(data, name, chart_type).getvalue()
+    result.update({'name': name, 'ok': True})
+    return result, rendered
+
+
+def run_item(name, values, options, submitted):
+    'item() on the render queue, waiting for room if it is full'
+    while True:
+        try:
+            job = jobs.submit('ash', item, name, values, *options)
+            break
+        except jobs.QueueFull as err:
+            time.sleep(min(err.retry_after, 5))
+    submitted.append(job)
+    try:
+        return job.wait()
+    except jobs.JobCancelled as err:
+        raise ItemError(str(err))
+
+
+def results(items, options):
+    'Yield (result, images) per item as they finish, failures included'
+    pool = ThreadPoolExecutor(BATCH_WORKERS)
+    submitted = []
+    try:
+        futures = dict((pool.submit(run_item, name, values, options,
+                                    submitted), name)
+                       for name, values in items)
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                yield future.result()
+            except ItemError as err:
+                yield {'name': name, 'ok': False, 'error': str(err)}, {}
+            except Exception as err:
+                yield {'name': name, 'ok': False,
+                       'error': '%s: %s' % (type(err).__name__, err)}, {}
+    finally:
+        # the batch is done or the client went away, stop what is left
+        pool.shutdown(wait=False, cancel_futures=True)
+        for job in submitted:
+            job.cancel()
+
+
+def ndjson(stream):
+    try:
+        for result, images in stream:
+            if images:
+                result['images'] = dict(
+                    (k, base64.b64encode(v).decode('ascii'))
+                    for k, v in images.items())
+            yield (json.dumps(result) + '\n').encode('utf-8')
+    finally:
+        stream.close()
+
+
+class _Pipe(object):
+    'Write-only file the ZIP is streamed through'
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def zipped(stream):
+    from .. import render
+    pipe = _Pipe()
+    used = set()
+    try:
+        with zipfile.ZipFile(pipe, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for result, images in stream:
+                base = re.sub(r'[^\w.-]+', '_', result['name']) or 'dataset'
+                while base in used:
+                    base += '_'
+                used.add(base)
+                archive.writestr(base + '.json', json.dumps(result))
+                for chart_type, data in images.items():
+                    ext = render.OUTPUTS[chart_type][0]
+                    if ext != chart_type:
+                        ext = chart_type + '.' + ext
+                    # images are compressed already
+                    archive.writestr(base + '.' + ext, data,
+                                     zipfile.ZIP_STORED)
+                yield pipe.drain()
+        yield pipe.drain()
+    finally:
+        stream.close()
+
+
+def api_ash_batch():
+    items, params = datasets()
+    bin_num = ash_api.bin_num_param(params)
+    rule = params.get('rule') or 'scott'
+    if rule not in ash_api.RULES:
+        raise HTTPError(400, 'rule must be one of %s.' %
+                        ', '.join(ash_api.RULES))
+    images = params.get('images') or []
+    if not isinstance(images, list):
+        raise HTTPError(400, 'images must be a list of image types.')
+    if images:
+        from .. import render
+        unknown = set(images) - set(render.OUTPUTS)
+        if unknown:
+            raise HTTPError(400, 'Unknown image types %s.' %
+                            ', '.join(sorted(unknown)))
+    arrays = str(params.get('arrays', '')).lower() in ('1', 'true', 'yes')
+    metrics.label(size=sum(len(values) for _, values in items))
+
+    stream = results(items, (bin_num, rule, images, arrays))
+    if request.query.get('format') == 'zip':
+        metrics.label(format='zip')
+        response.content_type = 'application/zip'
+        response.set_header('Content-Disposition',
+                            'attachment; filename=ash_batch.zip')
+        return zipped(stream)
+    metrics.label(format='ndjson')
+    response.content_type = 'application/x-ndjson'
+    return ndjson(stream)
@@ -31,10 +31,15 @@
     <div class="form_row">
 
         <div class="form_property form_required">{{! form.data.label }}:</div> 
-        <div class="form_property form_required">{{! form.data(cols=30, rows=30) }}
+        <div class="form_property form_required">{{! form.data(cols=30, rows=30, placeholder=stored_note or False, required=not stored_note) }}
             %field_errors(form.data.errors)
         </div>
             <div class="clearer">&nbsp;</div>
+        <div class="form_property">{{! form.compare.label }}:</div>
+        <div class="form_property">{{! form.compare(cols=30, rows=10, placeholder=compare_note or False) }}
+            %field_errors(form.compare.errors)
+        </div>
+            <div class="clearer">&nbsp;</div>
         <div class="form_value">{{! form.xlabel.label }}: {{! form.xlabel() }}
             %field_errors(form.xlabel.errors)
         </div>
@@ -52,6 +57,7 @@
         <div class="clearer">&nbsp;</div>
     </div>
     <input type="hidden" name="filled" value="good">
+    <input type="hidden" name="dataset" value="{{dataset}}">
     <div class="form_row form_row_submit">
 
         <div class="form_value">
@@ -61,6 +67,8 @@
             
             <input type="submit" name="svg_download" id="svg_download" class="hidden" />
 
+            <input type="submit" name="svgz_download" id="svgz_download" class="hidden" />
+
 		    <input type="submit" name="clear" class="button" value="Clear the Form"></div>
 
 		    <div class="clearer">&nbsp;</div>
@@ -7,75 +7,202 @@ Created on Fri Aug  5 11:34:19 2016
 """
 from __future__ import division, print_function
 
-import pylab as plt
 import numpy as np
-import seaborn as sns
 
-from io import BytesIO
 import os
+import re
 import base64
 
 import bottle
-from bottle import route, response, template, request
+from bottle import response, template, request
 from wtforms import (Form, StringField, TextAreaField, validators)
 
+from . import ash_api
 from .ASH.ash import ash
 
+from .. import api
+from .. import datastore
+from .. import handlers
 from .. import form_valid as fv
+from .. import render
+from .. import jobs
+from .. import metrics
+from .. import prerender
 
 paper_data = '-0.38763\n0.80928\n1.5736\n-0.19156\n-1.2762\n0.012471\n' + \
              '2.7392\n-0.14373\n1.5309\n-0.71012\n2.6883\n-0.97024\n' + \
              '-0.18379\n0.39052\n0.89383\n-0.28856\n-0.82227\n-1.2461\n' + \
              '2.8595\n0.50082'
 
-plt.rcParams['svg.fonttype'] = 'none'
-
 path = os.path.abspath(__file__)
 dir_path = os.path.dirname(path)
 bottle.TEMPLATE_PATH.insert(0, dir_path)
 
+# posted once, then kept in the datastore as the data and the datasets it
+# is compared with
+DATA_FIELDS = ('data', 'compare')
+
+# draw the preview in the browser from geometry, matplotlib for downloads
+CANVAS = os.environ.get('PLOT_CANVAS', 'off') == 'on'
+
+# rug marks closer than this fraction of the data range overlap at 300 dpi
+RUG_BINS = 4000
+
+# previews of more points than this come as a quick sketch first, 0 for never
+PROGRESSIVE = int(os.environ.get('PLOT_PROGRESSIVE', 20000))
+# points of the sample the sketch's ASH is computed from
+SKETCH_POINTS = 2000
+
+# line and fill colors of the datasets compared with the data
+PALETTE = [('#D95319', '#F2966E'), ('#77AC30', '#B7D98B'),
+           ('#7E2F8E', '#C89BD1'), ('#EDB120', '#F7D98A')]
+
 
-@route("/ash", method=['POST', 'GET'])
 def plot():
     form = DataForm(request.forms)
     filled = request.forms.get('filled', '').strip()
     svg = request.forms.get('svg_download', '').strip()
+    svgz = request.forms.get('svgz_download', '').strip()
     png = request.forms.get('png_download', '').strip()
     clear = request.forms.get('clear', '').strip()
+    # set by progressive.js when the full plot's job is gone
+    full = request.forms.get('full', '').strip()
 
     img = ''
+    poll = ''
+    compare_note = ''
+    geometry = ''
+    dataset = ''
+    stored_note = ''
+    arrays = None
+    valid = False
+    if filled and not clear:
+        fv.large_fields(form, DATA_FIELDS)
+        valid, arrays = datastore.validate(form, DATA_FIELDS)
 
     if clear:
         filled = None
         form.xlabel.data = ''
         form.data.data = ''
+        form.compare.data = ''
         form.color.data = form.color.default
         form.fill_color.data = form.fill_color.default
-    elif filled and form.validate():
-        data_list = fv.data_split(form.data.data)
+    elif valid:
+        if arrays is None:
+            arrays = ([np.array(fv.data_split(form.data.data), dtype=float)] +
+                      form.compare.arrays)
+        dataset, arrays, stored_note = handlers.keep(form, DATA_FIELDS, arrays)
+        compare_note = compared_placeholder(arrays)
+        data_list = arrays[0]
         xlabel = form.xlabel.data
         color = form.color.data
         fill_color = form.fill_color.data
-        if svg:
-            chart_type = 'svg'
-            response.content_type = 'image/svg'
+        if len(arrays) > 1:
+            # a comparison is sketched by ash_compare_png itself
+            plot_png, sketch_png, plot_data = (ash_compare_png, ash_compare_png,
+                                               list(arrays))
+            sketch_args = (fill_color, True)
+        else:
+            plot_png, sketch_png, plot_data = ash_png, ash_sketch_png, data_list
+            sketch_args = ()
+        if svg or svgz:
+            chart_type = 'svgz' if svgz else 'svg'
+            response.content_type = render.mime(chart_type)
             response.set_header("Content-disposition",
-                                "attachment; filename=ash_plot.svg")
-            return ash_png(data_list, xlabel, chart_type, color, fill_color)
+                                "attachment; filename=ash_plot." + chart_type)
+            return prerender.respond('ash', plot_png, plot_data, xlabel,
+                                     chart_type=chart_type, color=color,
+                                     fill_color=fill_color)
         elif png:
             chart_type = 'pngat'
             response.content_type = 'image/png'
             response.set_header("Content-disposition",
                                 "attachment; filename=ash_plot.png")
-            return ash_png(data_list, xlabel, chart_type, color, fill_color)
+            return prerender.respond('ash', plot_png, plot_data, xlabel,
+                                     chart_type=chart_type, color=color,
+                                     fill_color=fill_color)
+        elif CANVAS and len(arrays) == 1:
+            scalars, lines = jobs.run('ash', ash_api.geometry, data_list)
+            # safe inside <script>, xlabel is user text
+            geometry = api.dumps(scalars, lines, digits=5, xlabel=xlabel,
+                                 color=color, fill_color=fill_color)
+            geometry = geometry.replace('<', '\\u003c')
+            handlers.speculate('ash', ash_png, data_list, xlabel,
+                               color=color, fill_color=fill_color)
+        elif PROGRESSIVE and not full and \
+                sum(len(a) for a in arrays) > PROGRESSIVE:
+            chart_type = render.PREVIEW
+            img = base64.b64encode(jobs.run('ash', sketch_png, plot_data,
+                                            xlabel, chart_type, color,
+                                            *sketch_args).getbuffer())
+            try:
+                # the page swaps the sketch for this once it has polled it
+                job = jobs.background('ash', plot_png, plot_data, xlabel,
+                                      chart_type, color, fill_color)
+                job.headers = {'Content-Type': render.mime(chart_type)}
+                poll = jobs.poll_url(job)
+            except jobs.QueueFull:
+                pass
+            handlers.speculate('ash', plot_png, plot_data, xlabel,
+                               color=color, fill_color=fill_color)
         else:
-            chart_type = 'png'
-            img = base64.b64encode(ash_png(data_list, xlabel, chart_type,
-                                           color, fill_color))
+            chart_type = render.PREVIEW
+            img = base64.b64encode(jobs.run('ash', plot_png, plot_data,
+                                            xlabel, chart_type, color,
+                                            fill_color).getbuffer())
+            handlers.speculate('ash', plot_png, plot_data, xlabel,
+                               color=color, fill_color=fill_color)
     else:
         filled = None
+        dataset, stored_note = handlers.kept(arrays)
+        if arrays is not None:
+            compare_note = compared_placeholder(arrays)
 
-    return template('ash_app', filled=filled, form=form, img=img)
+    return template('ash_app', filled=filled, form=form, img=img,
+                    img_type=render.mime(render.PREVIEW), poll=poll,
+                    dataset=dataset,
+                    stored_note=stored_note,
+                    compare_note=compare_note,
+                    geometry=geometry)
+
+
+def compared_placeholder(arrays):
+    if len(arrays) < 2:
+        return ''
+    return ('Comparing with the %i datasets sent before. Paste new data to '
+            'replace them.' % (len(arrays) - 1))
+
+
+class DataGroups():
+    """
+    Splits the field into datasets at blank lines, each of min to max
+    numbers, leaving them as field.arrays. Blank is no datasets.
+    """
+    def __init__(self, min=5, max=100000, groups=len(PALETTE)):
+        self.min = min
+        self.max = max
+        self.groups = groups
+
+    def __call__(self, form, field):
+        field.arrays = []
+        text = (field.data or '').strip()
+        if not text:
+            return
+        blocks = re.split(r'\n\s*\n', text)
+        if len(blocks) > self.groups:
+            raise validators.ValidationError(
+                'At most %i datasets can be compared with the data.' %
+                self.groups)
+        for i, block in enumerate(blocks, 1):
+            data_list = fv.data_split(block)
+            if not data_list or not self.min <= len(data_list) <= self.max:
+                raise validators.ValidationError(
+                    'Dataset %i must have %i to %i values.' %
+                    (i, self.min, self.max))
+            try:
+                field.arrays.append(np.array(data_list, dtype=float))
+            except ValueError as err:
+                raise validators.ValidationError(err)
 
 
 class DataForm(Form):
@@ -87,6 +214,9 @@ class DataForm(Form):
                                     'separated and have 5 to 100000 values'),
                           fv.DataFloat()],
                          default=paper_data)
+    compare = TextAreaField('Datasets to compare with it, separated by ' +
+                            'blank lines (optional, up to %i)' % len(PALETTE),
+                            [DataGroups()], default='')
     xlabel = StringField('X-axis Label',
                          [validators.Optional(),
                           validators.Length(min=0, max=50,
@@ -107,54 +237,204 @@ class DataForm(Form):
 
 def ash_png(data, xlabel=None, chart_type="png",
             color='#4C72B0', fill_color='#92B2E7'):
-    sns.set(style='ticks', font='Arial', context='talk', font_scale=1.2)
-
-    fig = plt.figure(figsize=(6, 6))
-    fig.clf()
-
-    a = np.array(data, dtype=float)
-    bins = None
-
-    ash_obj_a = ash(a, bin_num=bins, force_scott=True)
-
-    ax = plt.subplot(111)
-    ax.plot(ash_obj_a.ash_mesh, ash_obj_a.ash_den, lw=2, color=color)
-
-    # plot the solid ASH
-    ash_obj_a.plot_ash_infill(ax, color=fill_color, alpha=1)
-
-    # barcode like data representation
-    ash_obj_a.plot_rug(ax, alpha=1, color=color)
-
-    # put statistics on the graph
-    ash_obj_a.plot_stats(ax, color=color)
-
-    # Only show ticks on the left and bottom spines
-    ax.yaxis.set_ticks_position('left')
-    ax.xaxis.set_ticks_position('bottom')
-    ax.tick_params(direction='out')
-    ax.set_yticks([])
-
-    if xlabel:
-        plt.xlabel(xlabel)
-    plt.tight_layout()
-    plt.subplots_adjust(top=0.95)
-
-    outs = BytesIO()
-    fig.canvas.draw()
-    if chart_type == 'pdf':
-        type_form = 'pdf'
-        dpi = 300
-    elif chart_type == 'svg':
-        type_form = 'svg'
-        dpi = 300
-    elif chart_type == 'pngat':
-        type_form = 'png'
-        dpi = 300
-    else:
-        type_form = 'png'
-        dpi = 100
-    fig.savefig(outs, dpi=dpi, format=type_form)
-    img = outs.getvalue()
-    outs.close()
-    return img
+    with render.style_context():
+        fig = render.new_figure(figsize=(6, 6))
+
+        a = np.array(data, dtype=float)
+        metrics.label(size=len(a))
+
+        # the same data restyled reuses the ASH, its infill mask and rug
+        ash_obj_a = ash_api.cached_ash(a)
+        jobs.checkpoint()
+
+        ax = fig.add_subplot(111)
+        ax.plot(ash_obj_a.ash_mesh, ash_obj_a.ash_den, lw=2, color=color)
+
+        # plot the solid ASH
+        mask, extent = ash_api.cached_infill(a, ax.get_xlim(), ax.get_ylim())
+        ax.imshow(ash_obj_a.tint(mask, fill_color), aspect='auto',
+                  extent=extent)
+        ax.set_ylim(*extent[2:])
+        jobs.checkpoint()
+
+        # barcode like data representation
+        plot_rug(ax, ash_api.cached_rug(a, RUG_BINS), color)
+
+        # put statistics on the graph
+        ash_obj_a.plot_stats(ax, color=color)
+
+        # Only show ticks on the left and bottom spines
+        ax.yaxis.set_ticks_position('left')
+        ax.xaxis.set_ticks_position('bottom')
+        ax.tick_params(direction='out')
+        ax.set_yticks([])
+
+        if xlabel:
+            ax.set_xlabel(xlabel)
+        fig.tight_layout()
+        fig.subplots_adjust(top=0.95)
+        jobs.checkpoint()
+
+        return render.save_figure(fig, chart_type)
+
+
+def sketch_sample(a):
+    'SKETCH_POINTS of a picked at random, the same every time, or all of a'
+    if len(a) <= SKETCH_POINTS:
+        return a
+    return a[np.random.default_rng(0).choice(len(a), SKETCH_POINTS,
+                                             replace=False)]
+
+
+def ash_sketch_png(data, xlabel=None, chart_type="png", color='#4C72B0'):
+    """
+    A stand-in for the ash_png preview of a large dataset in about the same
+    time whatever its size: the ASH line of SKETCH_POINTS of the data picked
+    at random, and the rug of all of it merged to RUG_BINS marks, without
+    the infill or statistics.
+    """
+    with render.style_context():
+        fig = render.new_figure(figsize=(6, 6))
+
+        a = np.array(data, dtype=float)
+        metrics.label(size=len(a))
+
+        ash_obj_a = ash(sketch_sample(a), force_scott=True)
+        jobs.checkpoint()
+
+        ax = fig.add_subplot(111)
+        ax.plot(ash_obj_a.ash_mesh, ash_obj_a.ash_den, lw=2, color=color)
+
+        plot_rug(ax, ash_api.cached_rug(a, RUG_BINS), color)
+
+        ax.yaxis.set_ticks_position('left')
+        ax.xaxis.set_ticks_position('bottom')
+        ax.tick_params(direction='out')
+        ax.set_yticks([])
+
+        if xlabel:
+            ax.set_xlabel(xlabel)
+        fig.tight_layout()
+        fig.subplots_adjust(top=0.95)
+        jobs.checkpoint()
+
+        return render.save_figure(fig, chart_type)
+
+
+def plot_rug(ax, rug, color, height=0.07, ms=20):
+    'As ash.plot_rug, of the rug positions from ash_api.cached_rug()'
+    ymin, ymax = ax.get_ylim()
+    ax.plot(rug, np.zeros_like(rug) - (ymax - ymin)*height, '|', mew=2,
+            ms=ms, color=color)
+    ax.set_ylim(-ymax*0.15, ymax)
+
+
+def test_string(result):
+    'The KS and AD lines of an ASH.permutation.compare() result'
+    permutations = result['permutations']
+
+    def p(value):
+        if not permutations:
+            return ''
+        if value*(permutations + 1) < 1.5:
+            # no permutation came up as far apart as the data
+            return ', p < %.2g' % (1/permutations)
+        return ', p = %.2g' % value
+    lines = ('KS = %.3g%s\nAD = %.3g%s' %
+             (result['ks'], p(result['ks_p']), result['ad'], p(result['ad_p'])))
+    if permutations and not result['exact']:
+        # the permutations saw the data only through its quantile cells
+        lines += '\np over %i cells' % result['cells']
+    return lines
+
+
+def ash_compare_png(datasets, xlabel=None, chart_type="png",
+                    color='#4C72B0', fill_color='#92B2E7', sketch=False):
+    """
+    The ASHes of two or more datasets on the same bins over each other, the
+    first in color and fill_color and the rest in PALETTE, with their rugs
+    and statistics and the permutation KS and Anderson-Darling tests of
+    whether they come from one distribution. A sketch, like ash_sketch_png,
+    has the ASHes of SKETCH_POINTS of each dataset and the rugs of all of
+    it, without the statistics or tests.
+    """
+    with render.style_context():
+        fig = render.new_figure(figsize=(6, 6))
+
+        datasets = [np.array(d, dtype=float) for d in datasets]
+        metrics.label(size=sum(len(d) for d in datasets))
+        styles = [(color, fill_color)] + PALETTE[:len(datasets) - 1]
+        heights = np.linspace(0.12, 0.04, len(datasets))
+
+        bin_width, origin = ash_api.shared_bins(datasets)
+        if sketch:
+            ash_objs = [ash(sketch_sample(d), bin_width=bin_width,
+                            origin=origin) for d in datasets]
+        else:
+            ash_objs = []
+            for d in datasets:
+                ash_objs.append(ash_api.cached_ash(d, bin_width, origin))
+                jobs.checkpoint()
+
+        ax = fig.add_subplot(111)
+        for ash_obj, (line_color, _) in zip(ash_objs, styles):
+            ax.plot(ash_obj.ash_mesh, ash_obj.ash_den, lw=2, color=line_color)
+
+        # the solid ASHes on one extent, multiplied like inks where they overlap
+        xlim, (ymin, ymax) = ax.get_xlim(), ax.get_ylim()
+        if sketch:
+            tops = [ash_obj.infill_top() for ash_obj in ash_objs]
+        else:
+            tops = [ash_api.cached_infill_top(d, bin_width, origin)
+                    for d in datasets]
+        ylim = (ymin, max([ymax] + tops))
+        hist_img = 1
+        for d, ash_obj, (_, fill) in zip(datasets, ash_objs, styles):
+            if sketch:
+                mask, extent = ash_obj.infill_mask(xlim, ylim, alpha=1)
+            else:
+                mask, extent = ash_api.cached_infill(d, xlim, ylim, 1,
+                                                     bin_width, origin)
+            hist_img = hist_img*ash_obj.tint(mask, fill)
+        ax.imshow(hist_img, aspect='auto', extent=extent)
+        ax.set_ylim(*extent[2:])
+        jobs.checkpoint()
+
+        for d, (line_color, _), height in zip(datasets, styles, heights):
+            plot_rug(ax, ash_api.cached_rug(d, RUG_BINS), line_color,
+                     height=height, ms=8)
+
+        if not sketch:
+            size = 14 if len(ash_objs) == 2 else 11
+            for i, (ash_obj, (line_color, _)) in enumerate(zip(ash_objs,
+                                                               styles)):
+                x, ha = (0.96, 'right') if i % 2 else (0.04, 'left')
+                ax.text(x, 0.96 - (i//2)*0.16, ash_obj.stats_string(),
+                        color=line_color, ha=ha, va='top',
+                        transform=ax.transAxes, size=size)
+            with metrics.stage('permutation'):
+                result = ash_api.cached_compare(datasets)
+            ax.text(0.04, 0.94 - ((len(ash_objs) + 1)//2)*0.16,
+                    test_string(result), color='k', ha='left', va='top',
+                    transform=ax.transAxes, size=11)
+
+        ax.yaxis.set_ticks_position('left')
+        ax.xaxis.set_ticks_position('bottom')
+        ax.tick_params(direction='out')
+        ax.set_yticks([])
+
+        if xlabel:
+            ax.set_xlabel(xlabel)
+        fig.tight_layout()
+        fig.subplots_adjust(top=0.95)
+        jobs.checkpoint()
+
+        return render.save_figure(fig, chart_type)
+
+
+def warm_up(chart_type):
+    'ash_png of the form defaults as chart_type, for plots.warm_up()'
+    form = DataForm()
+    return ash_png(np.array(fv.data_split(form.data.data), dtype=float),
+                   form.xlabel.data, chart_type, form.color.data,
+                   form.fill_color.data)
@@ -1 +1,16 @@
-from .ce_plot import *
+"""
+Battery coulombic efficiency plotter, single and multi-cell, with a live
+series API.
+"""
+# (path, methods, 'module:function')
+ROUTES = [('/ce', ['POST', 'GET'], 'ce_plot:plot_ce'),
+          ('/ce_multi', ['POST', 'GET'], 'ce_multi:plot_ce_multi'),
+          ('/api/ce', ['POST'], 'ce_api:api_ce'),
+          ('/api/ce/series', ['POST'], 'ce_live:api_series_create'),
+          ('/api/ce/series/<handle>', ['POST'], 'ce_live:api_series_append'),
+          ('/api/ce/series/<handle>', ['DELETE'],
+           'ce_live:api_series_delete'),
+          ('/api/ce/series/<handle>/image', ['GET'],
+           'ce_live:api_series_image')]
+# renders the default data, see plots.warm_up()
+WARMUP = ['ce_plot:warm_up', 'ce_multi:warm_up']
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+/api/ce: the coulombic efficiency transform and the symlog axis of the CE
+plot as numbers, without matplotlib.
+
+    POST {"x": [...], "y": [...], "linthresh": 0.1}
+
+y is in percent, or fractions if all below 2. The result holds ce - 100 as
+plotted, the axis limits, the major ticks with their labels and the minor
+ticks, all in plotted coordinates.
+"""
+from __future__ import division, print_function
+
+from bottle import HTTPError
+
+from .. import api
+from . import symlog
+
+
+def compute(x, y, linthresh=0.1):
+    'Scalars and arrays of the CE plot of x and y'
+    ce = symlog.percent(y) - 100
+    (ymin, ymax), majors, minors = symlog.axis(ce, linthresh)
+    scalars = {'n': len(x), 'linthresh': linthresh, 'ymin': ymin,
+               'ymax': ymax}
+    arrays = [('x', x), ('ce', ce), ('major_ticks', majors),
+              ('major_labels', majors + 100), ('minor_ticks', minors)]
+    return scalars, arrays
+
+
+def api_ce():
+    (x, y), params = api.arrays(['x', 'y'])
+    linthresh = api.param(params, 'linthresh', float, 0.1)
+    if not linthresh > 0:
+        raise HTTPError(400, 'linthresh must be positive.')
+    return api.respond(*compute(x, y, linthresh))
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+/api/ce/series: a CE series kept on the server for a live cycler feed, so
+each update posts only the new cycles instead of the whole history.
+
+    POST   /api/ce/series           {"x": [...], "y": [...], "color": "#4C72B0",
+                                     "x_label": ..., "y_label": ...,
+                                     "linthresh": 0.1}
+    POST   /api/ce/series/<handle>  {"x": [new cycles], "y": [new CE]}
+    GET    /api/ce/series/<handle>/image?type=png
+    DELETE /api/ce/series/<handle>
+
+x and y may also be posted as raw floats, as to /api/ce. Creating and
+appending answer the handle, the number of points and the axis of the
+whole series as /api/ce gives it.
+
+The axis follows from the running minimum and maximum alone: the symlog
+limits and ticks of the CE range, and cycle limits whose span doubles when
+the cycles outgrow it. The preview types (LIVE_TYPES) keep their figure
+drawn, and while the axis is unchanged an image only draws the points added
+since onto it, so an update costs in proportion to the new points. A change
+of axis, rare by construction, draws everything again. Other types are
+drawn in full every time.
+
+At most PLOT_CE_SERIES series are kept, least recently used out first, and
+a series unused for PLOT_STORE_TTL seconds is dropped.
+"""
+from __future__ import division, print_function
+
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+from bottle import request, response, HTTPError
+from matplotlib.ticker import MaxNLocator
+
+from .. import api
+from .. import datastore
+from .. import jobs
+from .. import memory
+from .. import metrics
+from .. import render
+from . import symlog
+
+MAX_SERIES = int(os.environ.get('PLOT_CE_SERIES', 64))
+MAX_POINTS = 1000000
+# raster types whose drawn figure is kept for the next update
+LIVE_TYPES = ('png', 'webp')
+COLOR = re.compile('^#([A-Fa-f0-9]{6}|[A-Fa-f0-9]{3})$')
+
+_series = OrderedDict()
+_series_lock = threading.Lock()
+_draw_counts = {'full': 0, 'points': 0}
+memory.cache('ce_series', lambda: list(_series.values()))
+
+
+class Series(object):
+    'Growing cycle and CE arrays with their axis and drawn preview figures'
+    def __init__(self, color='#4C72B0', x_label='Cycle Number',
+                 y_label='Coulombic Efficiency (%)', linthresh=0.1):
+        self.color = color
+        self.x_label = x_label
+        self.y_label = y_label
+        self.linthresh = linthresh
+        self.scale = None
+        self.n = 0
+        self.x = np.empty(0)
+        self.ce = np.empty(0)
+        self.xmin = self.cemin = np.inf
+        self.xmax = self.cemax = -np.inf
+        # chart_type: (fig, line, axis key, points drawn)
+        self.figures = {}
+        self.used = time.time()
+        self.lock = threading.Lock()
+
+    def append(self, x, y):
+        'Add points, y in percent or fractions as the first points were'
+        with self.lock:
+            n = self.n + len(x)
+            if n > MAX_POINTS:
+                raise HTTPError(413, 'A series holds at most %i points.' %
+                                MAX_POINTS)
+            if self.scale is None:
+                # as symlog.percent, decided once for the whole series
+                self.scale = 100 if np.max(y) < 2 else 1
+            if n > len(self.x):
+                # doubling keeps appends amortized to the new points
+                size = max(n, 2*len(self.x))
+                self.x = np.resize(self.x, size)
+                self.ce = np.resize(self.ce, size)
+            self.x[self.n:n] = x
+            self.ce[self.n:n] = np.asarray(y)*self.scale - 100
+            self.n = n
+            self.xmin = min(self.xmin, np.min(x))
+            self.xmax = max(self.xmax, np.max(x))
+            self.cemin = min(self.cemin, self.ce[n-len(x):n].min())
+            self.cemax = max(self.cemax, self.ce[n-len(x):n].max())
+            self.used = time.time()
+            return self.axis()
+
+    def axis(self):
+        'x limits, y limits, major and minor ticks of the series'
+        span = self.xmax - self.xmin
+        # the span rounded up to a power of two leaves room to grow
+        room = 2.**np.ceil(np.log2(span)) if span > 1 else 1.
+        pad = room*symlog.MARGIN
+        xlim = (self.xmin - pad, self.xmin + room + pad)
+        ylim, majors, minors = symlog.axis([self.cemin, self.cemax],
+                                           self.linthresh)
+        return xlim, ylim, majors, minors
+
+    def figure(self):
+        'A figure of the series with its axis set and no points drawn yet'
+        xlim, ylim, majors, minors = self.axis()
+        fig = render.new_figure(figsize=(6, 5.5))
+        ax = fig.add_subplot(111)
+        ax.set_yscale('symlog', linthresh=self.linthresh)
+        ax.set_xlim(xlim)
+        ax.set_ylim(ylim)
+        ax.set_yticks(majors)
+        ax.set_yticklabels(majors + 100)
+        ax.set_yticks(minors, minor=True)
+        ax.grid(True, which='major', axis='y', color=(0.9, 0.9, 0.9),
+                linestyle='-')
+        ax.grid(True, which='minor', color=(0.9, 0.9, 0.9), linestyle='-',
+                linewidth=0.5)
+        ax.get_xaxis().set_major_locator(MaxNLocator(integer=True))
+        ax.yaxis.set_ticks_position('left')
+        ax.xaxis.set_ticks_position('bottom')
+        ax.tick_params(direction='out')
+        if self.y_label:
+            ax.set_ylabel(self.y_label)
+        if self.x_label:
+            ax.set_xlabel(self.x_label)
+        fig.tight_layout()
+        fig.subplots_adjust(top=0.95)
+        # after the layout, which draws the figure to measure it
+        (line,) = ax.plot([], [], marker='o', mfc=self.color, lw=0)
+        return fig, line
+
+    def render(self, chart_type='png'):
+        'The image of the series, drawing only new points where it can'
+        with render.style_context(), self.lock:
+            n = self.n
+            metrics.label(size=n)
+            key = self.axis()[:2]
+            fig, line, drawn_key, drawn = self.figures.get(
+                chart_type, (None, None, None, 0))
+            if fig is None or drawn_key != key:
+                _draw_counts['full'] += 1
+                fig, line = self.figure()
+                line.set_data(self.x[:n], self.ce[:n])
+                image = render.save_figure(fig, chart_type)
+            else:
+                _draw_counts['points'] += 1
+                with metrics.stage('draw'):
+                    line.set_data(self.x[drawn:n], self.ce[drawn:n])
+                    line.axes.draw_artist(line)
+                image = render.encode(fig, chart_type)
+            if chart_type in LIVE_TYPES:
+                self.figures[chart_type] = (fig, line, key, n)
+            return image
+
+
+def _expire(now):
+    while _series:
+        handle, series = next(iter(_series.items()))
+        if now - series.used <= datastore.TTL and len(_series) <= MAX_SERIES:
+            break
+        del _series[handle]
+
+
+def get(handle):
+    'The series under handle, 404 if unknown or expired'
+    with _series_lock:
+        _expire(time.time())
+        series = _series.get(handle)
+        if series is None:
+            raise HTTPError(404, 'Unknown or expired series, create it again.')
+        _series.move_to_end(handle)
+        return series
+
+
+def respond(handle, series):
+    'The handle and size of series with its axis, as api.respond gives it'
+    (xmin, xmax), (ymin, ymax), majors, minors = series.axis()
+    scalars = {'handle': handle, 'n': series.n,
+               'linthresh': series.linthresh, 'xmin': xmin, 'xmax': xmax,
+               'ymin': ymin, 'ymax': ymax}
+    arrays = [('major_ticks', majors), ('major_labels', majors + 100),
+              ('minor_ticks', minors)]
+    return api.respond(scalars, arrays)
+
+
+def api_series_create():
+    (x, y), params = api.arrays(['x', 'y'], min_len=1, max_len=MAX_POINTS)
+    linthresh = api.param(params, 'linthresh', float, 0.1)
+    if not linthresh > 0:
+        raise HTTPError(400, 'linthresh must be positive.')
+    color = api.param(params, 'color', str, '#4C72B0')
+    if not COLOR.match(color):
+        raise HTTPError(400, 'color must be an html rgb hex color.')
+    labels = {}
+    for name, default in (('x_label', 'Cycle Number'),
+                          ('y_label', 'Coulombic Efficiency (%)')):
+        labels[name] = api.param(params, name, str, default)
+        if len(labels[name]) > 50:
+            raise HTTPError(400, '%s is longer than 50 characters.' % name)
+    series = Series(color, linthresh=linthresh, **labels)
+    series.append(x, y)
+    handle = uuid.uuid4().hex
+    with _series_lock:
+        _series[handle] = series
+        _expire(time.time())
+    return respond(handle, series)
+
+
+def api_series_append(handle):
+    series = get(handle)
+    (x, y), _ = api.arrays(['x', 'y'], min_len=1)
+    series.append(x, y)
+    return respond(handle, series)
+
+
+def api_series_image(handle):
+    series = get(handle)
+    chart_type = request.query.get('type', render.PREVIEW)
+    if chart_type not in render.OUTPUTS:
+        raise HTTPError(400, 'type must be one of %s.' %
+                        ', '.join(sorted(render.OUTPUTS)))
+    response.content_type = render.mime(chart_type)
+    return jobs.run('ce', series.render, chart_type)
+
+
+def api_series_delete(handle):
+    with _series_lock:
+        if _series.pop(handle, None) is None:
+            raise HTTPError(404, 'Unknown or expired series.')
+    response.status = 204
+    return ''
+
+
+@metrics.collector
+def _series_metrics():
+    return (['# HELP plot_ce_series Live CE series held.',
+             '# TYPE plot_ce_series gauge',
+             'plot_ce_series %i' % len(_series),
+             '# HELP plot_ce_series_draws_total Live CE images by what was '
+             'drawn.',
+             '# TYPE plot_ce_series_draws_total counter'] +
+            ['plot_ce_series_draws_total{drawn="%s"} %i' % item
+             for item in sorted(_draw_counts.items())])
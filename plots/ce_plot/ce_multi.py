@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+/ce_multi: the coulombic efficiency of many cells on one symlog axis.
+
+The data is a long-format table, one row per cell and cycle,
+
+    cell, cycle, ce
+    A1, 1, 87.3
+    A1, 2, 98.7
+    B7, 1, 86.9
+
+pasted or uploaded as a file, fields separated by commas, tabs or spaces,
+an optional header row. Every cell's series is one segment list of a single
+LineCollection, so hundreds of cells draw in one call, and the symlog ticks
+come from symlog.axis once for all of the data instead of a locator per
+draw. Cells are colored along a colormap in the order they first appear;
+up to LEGEND_MAX of them get a legend.
+"""
+from __future__ import division, print_function
+
+import base64
+import os
+
+import numpy as np
+from matplotlib import colormaps
+from matplotlib.colors import ListedColormap
+from matplotlib.collections import LineCollection
+from matplotlib.lines import Line2D
+from matplotlib.ticker import MaxNLocator
+
+import bottle
+from bottle import response, template, request
+from wtforms import (Form, StringField, TextAreaField, SelectField,
+                     validators)
+
+from .. import datastore
+from .. import handlers
+from .. import render
+from .. import jobs
+from .. import metrics
+from .. import prerender
+from . import symlog
+
+MAX_ROWS = 2000000
+MAX_CELLS = 1000
+LEGEND_MAX = 10
+CMAPS = ['viridis', 'plasma', 'cividis', 'tab10', 'tab20']
+
+table_data = '\n'.join('%s, %i, %.2f' % (cell, cycle, ce)
+                       for cell, base in (('A1', 99.9), ('A2', 99.8))
+                       for cycle, ce in enumerate(
+                           base - 12*np.exp(-np.arange(10)), 1))
+
+path = os.path.abspath(__file__)
+dir_path = os.path.dirname(path)
+bottle.TEMPLATE_PATH.insert(0, dir_path)
+
+# posted once, then kept in the datastore as (cell, cycle, ce, names)
+DATA_FIELDS = ('table',)
+
+
+@metrics.timed('data_split')
+def parse_table(text):
+    """
+    (cell, cycle, ce, names) of a long-format table: cell the index into
+    names, the cell ids in order of first appearance. Raises ValueError.
+    """
+    # str.split is several times faster than re.split on large tables
+    tokens = text.replace(',', ' ').replace(';', ' ').split()
+    if len(tokens) % 3:
+        raise ValueError('Every row must have a cell, a cycle and a CE.')
+    try:
+        float(tokens[1]), float(tokens[2])
+    except (IndexError, ValueError):
+        # a header row
+        tokens = tokens[3:]
+    if len(tokens) < 6:
+        raise ValueError('The table must have at least 2 rows.')
+    try:
+        cycle = np.array(tokens[1::3], dtype=float)
+        ce = np.array(tokens[2::3], dtype=float)
+    except ValueError:
+        raise ValueError('Cycle and CE must be numbers.')
+    if not (np.isfinite(cycle).all() and np.isfinite(ce).all()):
+        raise ValueError('Cycle and CE must be finite.')
+    ids = np.array(tokens[0::3])
+    # rows usually come a cell at a time, so only the first id of each run
+    # of equal ids needs sorting
+    starts = np.r_[0, np.flatnonzero(ids[1:] != ids[:-1]) + 1]
+    names, first, run_cell = np.unique(ids[starts], return_index=True,
+                                       return_inverse=True)
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    cell = np.repeat(rank[run_cell], np.diff(np.r_[starts, len(ids)]))
+    return cell.astype(float), cycle, ce, names[order]
+
+
+class DataTable():
+    'Parses the table once, leaving the arrays on the field as field.arrays'
+    def __init__(self, max_rows=MAX_ROWS, max_cells=MAX_CELLS):
+        self.max_rows = max_rows
+        self.max_cells = max_cells
+
+    def __call__(self, form, field):
+        try:
+            field.arrays = parse_table(field.data)
+        except ValueError as err:
+            raise validators.ValidationError(str(err))
+        if len(field.arrays[0]) > self.max_rows:
+            raise validators.ValidationError(
+                'The table has more than %i rows.' % self.max_rows)
+        if len(field.arrays[3]) > self.max_cells:
+            raise validators.ValidationError(
+                'The table has more than %i cells.' % self.max_cells)
+
+
+def posted_table():
+    '''
+    Text of an uploaded table file, or of a table pasted in above bottle's
+    MEMFILE_MAX, which bottle hands over as a file too. None if neither.
+    '''
+    for name in ('table_file', 'table'):
+        upload = request.files.get(name)
+        if upload is not None:
+            return upload.file.read().decode('utf-8-sig')
+    return None
+
+
+def plot_ce_multi():
+    form = DataForm_CE_Multi(request.forms)
+    filled = request.forms.get('filled', '').strip()
+    svg = request.forms.get('svg_download', '').strip()
+    svgz = request.forms.get('svgz_download', '').strip()
+    png = request.forms.get('png_download', '').strip()
+    clear = request.forms.get('clear', '').strip()
+    text = posted_table()
+    if text is not None and not clear:
+        form.table.data = text
+        form.table.raw_data = [text]
+
+    img = ''
+    dataset = ''
+    stored_note = ''
+    arrays = None
+    valid = False
+    if filled and not clear:
+        valid, arrays = datastore.validate(form, DATA_FIELDS)
+
+    if clear:
+        filled = None
+        form.table.data = ''
+        form.x_label.data = ''
+        form.y_label.data = ''
+        form.cmap.data = form.cmap.default
+    elif valid:
+        dataset, arrays, stored_note = handlers.keep(form, DATA_FIELDS,
+                                                     arrays or
+                                                     form.table.arrays)
+        args = tuple(arrays) + (form.x_label.data, form.y_label.data)
+        if svg or svgz:
+            chart_type = 'svgz' if svgz else 'svg'
+            response.content_type = render.mime(chart_type)
+            response.set_header("Content-disposition",
+                                "attachment; filename=ce_multi_plot." +
+                                chart_type)
+            return prerender.respond('ce_multi', ce_multi_png, *args,
+                                     chart_type=chart_type,
+                                     cmap=form.cmap.data)
+        elif png:
+            response.content_type = 'image/png'
+            response.set_header("Content-disposition",
+                                "attachment; filename=ce_multi_plot.png")
+            return prerender.respond('ce_multi', ce_multi_png, *args,
+                                     chart_type='pngat', cmap=form.cmap.data)
+        else:
+            img = base64.b64encode(jobs.run(
+                'ce_multi', ce_multi_png, *args, chart_type=render.PREVIEW,
+                cmap=form.cmap.data).getbuffer())
+            handlers.speculate('ce_multi', ce_multi_png, *args,
+                               cmap=form.cmap.data)
+    else:
+        filled = None
+        dataset, stored_note = handlers.kept(arrays)
+    return template('ce_multi_app', filled=filled, form=form, img=img,
+                    img_type=render.mime(render.PREVIEW),
+                    dataset=dataset,
+                    stored_note=stored_note)
+
+
+class DataForm_CE_Multi(Form):
+    table = TextAreaField('Cell, Cycle, CE',
+                          [validators.InputRequired(), DataTable()],
+                          default=table_data)
+    x_label = StringField('X-axis Label',
+                          [validators.Optional(),
+                           validators.Length(min=0, max=50,
+                                             message='Longer than 50 ' +
+                                             'characters')],
+                          default='Cycle Number')
+    y_label = StringField('Y-axis Label',
+                          [validators.Optional(),
+                           validators.Length(min=0, max=50,
+                                             message='Longer than 50 ' +
+                                             'characters')],
+                          default='Coulombic Efficiency (%)')
+    cmap = SelectField('Colormap', choices=CMAPS, default='viridis')
+
+
+def series(cell, cycle, ce):
+    'One (n, 2) array of cycle and ce per cell, each in cycle order'
+    order = np.lexsort((cycle, cell))
+    points = np.column_stack([cycle[order], ce[order]])
+    cell = cell[order]
+    return np.split(points, np.flatnonzero(cell[1:] != cell[:-1]) + 1)
+
+
+def colors(cmap, n):
+    'n colors along cmap, repeating the colors of a qualitative one'
+    cmap = colormaps[cmap]
+    if isinstance(cmap, ListedColormap) and cmap.N < 256:
+        return cmap(np.arange(n) % cmap.N)
+    return cmap(np.linspace(0, 1, n))
+
+
+def ce_multi_plot(cell, cycle, ce, ax, linthresh=0.1, cmap='viridis',
+                  names=None, **kwargs):
+    y = symlog.percent(ce) - 100
+    segments = series(cell, cycle, y)
+    line_colors = colors(cmap, len(segments))
+    ax.set_yscale('symlog', linthresh=linthresh)
+    lo, hi = cycle.min(), cycle.max()
+    pad = (hi - lo)*symlog.MARGIN or 0.5
+    ax.set_xlim(lo - pad, hi + pad)
+    (ymin, ymax), majors, minors = symlog.axis(y, linthresh)
+    ax.set_ylim(ymin, ymax)
+    ax.set_yticks(majors)
+    ax.set_yticklabels(majors + 100)
+    ax.set_yticks(minors, minor=True)
+    ax.grid(True, which='major', axis='y', color=(0.9, 0.9, 0.9),
+            linestyle='-')
+    ax.grid(True, which='minor', color=(0.9, 0.9, 0.9), linestyle='-',
+            linewidth=0.5)
+    # as many cycle ticks as fit, runs go to thousands of cycles
+    ax.get_xaxis().set_major_locator(MaxNLocator('auto', integer=True))
+    if names is not None and len(names) <= LEGEND_MAX:
+        ax.legend([Line2D([], [], color=c) for c in line_colors], names,
+                  loc='lower right', fontsize='small')
+    # tight_layout draws the whole figure to measure it, so the lines,
+    # which the layout does not depend on, go in after it
+    ax.figure.tight_layout()
+    return ax.add_collection(LineCollection(segments, colors=line_colors,
+                                            **kwargs), autolim=False)
+
+
+def ce_multi_png(cell, cycle, ce, names, x_label, y_label, chart_type='png',
+                 cmap='viridis'):
+    with render.style_context():
+        fig = render.new_figure(figsize=(6, 5.5))
+        ax = fig.add_subplot(111)
+        metrics.label(size=len(ce))
+        ax.yaxis.set_ticks_position('left')
+        ax.xaxis.set_ticks_position('bottom')
+        ax.tick_params(direction='out')
+        if y_label:
+            ax.set_ylabel(y_label)
+        if x_label:
+            ax.set_xlabel(x_label)
+        with metrics.stage('ce_plot'):
+            ce_multi_plot(cell, cycle, ce, ax, cmap=cmap, names=names,
+                          linewidths=1)
+
+        fig.subplots_adjust(top=0.95)
+        jobs.checkpoint()
+
+        return render.save_figure(fig, chart_type)
+
+
+def warm_up(chart_type):
+    'ce_multi_png of the form defaults as chart_type, for plots.warm_up()'
+    form = DataForm_CE_Multi()
+    return ce_multi_png(*parse_table(form.table.data),
+                        x_label=form.x_label.data, y_label=form.y_label.data,
+                        chart_type=chart_type, cmap=form.cmap.data)
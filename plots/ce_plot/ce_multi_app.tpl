@@ -0,0 +1,25 @@
+%#template for the multi-cell CE plot
+
+%include('header.tpl')
+<h2>Battery CE Compare</h2>
+<h3>Coulombic Efficiency of Many Cells</h3>
+    <div id="colwrapper">
+        <div id="leftcolumn">
+            <h3>Copy in a table of cell, cycle and CE...</h3>
+
+            % include('ce_multi_form.tpl',form=form)
+
+
+        </div>
+        <div id="rightcolumn">
+            %if (filled == 'good'):
+                <img class="plot" src="data:{{img_type}};base64,{{img}}" alt="CE Plot" width=600 align="center"/>
+                <div id="chart_export"><h3>Download Full Resolution Charts...</h3>
+                    <a href="#"><label style="cursor:pointer" for="png_download">Download PNG</label></a> (300 dpi ready for publication)<br />
+                    <a href="#"><label style="cursor:pointer" for="svg_download">Download SVG</label></a> (Edit this for free in <a href="https://www.inkscape.org/">Inkscape</a>.)<br />
+                    <a href="#"><label style="cursor:pointer" for="svgz_download">Download SVGZ</label></a> (The SVG gzip compressed.)<br />
+                </div>
+            %end
+        </div>
+    </div>
+</div>
@@ -0,0 +1,61 @@
+%def field_errors(errors):
+    %if errors:
+        <ul class="errors">
+        %for error in errors:
+            <li>{{ error }}</li>
+        %end
+        </ul>
+    %end
+%end
+
+
+
+<form action="ce_multi" method="post" enctype="multipart/form-data" id="cemultiform">
+
+<fieldset>
+
+    <div class="form_row">
+        <lable>One row per cell and cycle, copied from a table or separated by commas (up to 2000000 rows, 1000 cells):</label>
+        <div class="clearer">&nbsp;</div>
+        <div class="form_property form_required">{{! form.table.label }}</div>
+        <div class="form_property form_required">{{! form.table(cols=36, rows=25, placeholder=stored_note or False, required=not stored_note) }}
+            %field_errors(form.table.errors)
+        </div>
+        <div class="clearer">&nbsp;</div>
+        <div class="form_value">Or upload a CSV file: <input type="file" name="table_file" id="table_file" accept=".csv,.txt,.tsv" /></div>
+        <div class="clearer">&nbsp;</div>
+        <div class="form_value">{{! form.x_label.label }}: {{! form.x_label() }}
+            %field_errors(form.x_label.errors)
+        </div>
+        <div class="clearer">&nbsp;</div>
+        <div class="form_value">{{! form.y_label.label }}: {{! form.y_label() }}
+            %field_errors(form.y_label.errors)
+        </div>
+        <div class="clearer">&nbsp;</div>
+        <div class="form_value">{{! form.cmap.label }}: {{! form.cmap() }}
+            %field_errors(form.cmap.errors)
+        </div>
+        <div class="clearer">&nbsp;</div>
+    </div>
+    <input type="hidden" name="filled" value="good">
+    <input type="hidden" name="dataset" value="{{dataset}}">
+    <div class="form_row form_row_submit">
+
+        <div class="form_value">
+            <input type="submit" name="submit" class="button" value="Plot CE">
+
+            <input type="submit" name="png_download" id="png_download" class="hidden" />
+
+            <input type="submit" name="svg_download" id="svg_download" class="hidden" />
+
+            <input type="submit" name="svgz_download" id="svgz_download" class="hidden" />
+
+		    <input type="submit" name="clear" class="button" value="Clear the Form"></div>
+
+		    <div class="clearer">&nbsp;</div>
+
+	    </div>
+
+    </fieldset>
+
+</form>
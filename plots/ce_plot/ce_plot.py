@@ -7,10 +7,7 @@ Created on Fri Aug  5 11:34:19 2016
 """
 from __future__ import division, print_function
 
-import pylab as plt
 import numpy as np
-import seaborn as sns
-from io import BytesIO
 import base64
 import os
 import sys
@@ -18,35 +15,49 @@ import sys
 from matplotlib.ticker import MaxNLocator, Locator
 
 import bottle
-from bottle import route, response, template, request
+from bottle import response, template, request
 from wtforms import (Form, StringField, TextAreaField, validators)
 
+from .. import datastore
+from .. import handlers
 from .. import form_valid as fv
+from .. import render
+from .. import jobs
+from .. import metrics
+from .. import prerender
+from . import symlog
 
 battery_data = '87.29\n98.65\n99.25\n99.49\n99.63\n99.70\n99.76\n99.81\n' + \
                '99.85\n99.87\n99.89\n99.91\n99.93\n99.94\n99.96'
 cycle_data = '1\n2\n3\n4\n5\n6\n7\n8\n9\n10\n11\n12\n13\n14\n15'
 
-plt.rcParams['svg.fonttype'] = 'none'
-
 path = os.path.abspath(__file__)
 dir_path = os.path.dirname(path)
 bottle.TEMPLATE_PATH.insert(0, dir_path)
 
+# posted once, then kept in the datastore
+DATA_FIELDS = ('x_data', 'y_data')
+
 
 def eprint(*args, **kwargs):
     print(*args, file=sys.stderr, **kwargs)
 
 
-@route("/ce", method=['POST', 'GET'])
 def plot_ce():
     form = DataForm_CE(request.forms)
     filled = request.forms.get('filled', '').strip()
     svg = request.forms.get('svg_download', '').strip()
+    svgz = request.forms.get('svgz_download', '').strip()
     png = request.forms.get('png_download', '').strip()
     clear = request.forms.get('clear', '').strip()
 
     img = ''
+    dataset = ''
+    stored_note = ''
+    arrays = None
+    valid = False
+    if filled and not clear:
+        valid, arrays = datastore.validate(form, DATA_FIELDS)
 
     if clear:
         filled = None
@@ -55,33 +66,42 @@ def plot_ce():
         form.y_label.data = ''
         form.y_data.data = ''
         form.color.data = form.color.default
-    elif filled and form.validate():
-        x_data_list = fv.data_split(form.x_data.data)
-        y_data_list = fv.data_split(form.y_data.data)
+    elif valid:
+        dataset, arrays, stored_note = handlers.keep(form, DATA_FIELDS, arrays)
+        x_data_list, y_data_list = arrays
         x_label = form.x_label.data
         y_label = form.y_label.data
         color = form.color.data
-        if svg:
-            chart_type = 'svg'
-            response.content_type = 'image/svg'
+        if svg or svgz:
+            chart_type = 'svgz' if svgz else 'svg'
+            response.content_type = render.mime(chart_type)
             response.set_header("Content-disposition",
-                                "attachment; filename=ce_plot.svg")
-            return ce_png(x_data_list, y_data_list,
-                          x_label, y_label, chart_type, color)
+                                "attachment; filename=ce_plot." + chart_type)
+            return prerender.respond('ce', ce_png, x_data_list, y_data_list,
+                                     x_label, y_label, chart_type=chart_type,
+                                     fill_color=color)
         elif png:
             chart_type = 'pngat'
             response.content_type = 'image/png'
             response.set_header("Content-disposition",
                                 "attachment; filename=ce_plot.png")
-            return ce_png(x_data_list, y_data_list, x_label,
-                          y_label, chart_type, color)
+            return prerender.respond('ce', ce_png, x_data_list, y_data_list,
+                                     x_label, y_label, chart_type=chart_type,
+                                     fill_color=color)
         else:
-            chart_type = 'png'
-            img = base64.b64encode(ce_png(x_data_list, y_data_list,
-                                          y_label, x_label, chart_type, color))
+            chart_type = render.PREVIEW
+            img = base64.b64encode(jobs.run('ce', ce_png, x_data_list,
+                                            y_data_list, x_label, y_label,
+                                            chart_type, color).getbuffer())
+            handlers.speculate('ce', ce_png, x_data_list, y_data_list,
+                               x_label, y_label, fill_color=color)
     else:
         filled = None
-    return template('ce_app', filled=filled, form=form, img=img)
+        dataset, stored_note = handlers.kept(arrays)
+    return template('ce_app', filled=filled, form=form, img=img,
+                    img_type=render.mime(render.PREVIEW),
+                    dataset=dataset,
+                    stored_note=stored_note)
 
 
 class DataForm_CE(Form):
@@ -141,22 +161,8 @@ class MinorSymLogLocator(Locator):
     def __call__(self):
         'Return the locations of the ticks'
         majorlocs = self.axis.get_majorticklocs()
-
-        # iterate through minor locs
-        minorlocs = []
-
-        # handle the lowest part
-        for i in range(1, len(majorlocs)):
-            majorstep = majorlocs[i] - majorlocs[i-1]
-            if abs(majorlocs[i-1] + majorstep/2) < self.linthresh:
-                ndivs = 10
-            else:
-                ndivs = 9
-            minorstep = majorstep / ndivs
-            locs = np.arange(majorlocs[i-1], majorlocs[i], minorstep)[1:]
-            minorlocs.extend(locs)
-
-        return self.raise_if_exceeds(np.array(minorlocs))
+        return self.raise_if_exceeds(symlog.minor_ticks(majorlocs,
+                                                        self.linthresh))
 
     def tick_values(self, vmin, vmax):
         raise NotImplementedError('Cannot get tick locations for a '
@@ -164,61 +170,53 @@ class MinorSymLogLocator(Locator):
 
 
 def ce_plot(x_data, y_data, ax=None, linthresh=0.1, **kwargs):
-    y_data = np.array(y_data, dtype=float)
-    y_data = y_data*100 if y_data.max() < 2 else y_data
     if ax is None:
-        plt.plot(x_data, y_data-100, **kwargs)
-    else:
-        ax.plot(x_data, y_data-100, **kwargs)
-    plt.yscale('symlog', linthreshy=linthresh)
-    plt.gca().get_yaxis().set_minor_locator(MinorSymLogLocator(linthresh))
-    plt.tick_params(axis='y', which='minor')
-    loc, labels = plt.yticks()
-    plt.yticks(loc, (loc + 100))
-    plt.grid(b=True, which='major', axis='y', color=(0.9, 0.9, 0.9),
-             linestyle='-')
-    plt.grid(b=True, which='minor', color=(0.9, 0.9, 0.9), linestyle='-',
-             linewidth=0.5)
-    plt.gca().get_xaxis().set_major_locator(MaxNLocator(integer=True))
-    plt.tight_layout()
+        import matplotlib.pyplot as plt
+        ax = plt.gca()
+    y_data = symlog.percent(y_data)
+    ax.plot(x_data, y_data-100, **kwargs)
+    ax.set_yscale('symlog', linthresh=linthresh)
+    ax.get_yaxis().set_minor_locator(MinorSymLogLocator(linthresh))
+    ax.tick_params(axis='y', which='minor')
+    loc = np.asarray(ax.get_yticks())
+    ax.set_yticks(loc)
+    ax.set_yticklabels(loc + 100)
+    ax.grid(True, which='major', axis='y', color=(0.9, 0.9, 0.9),
+            linestyle='-')
+    ax.grid(True, which='minor', color=(0.9, 0.9, 0.9), linestyle='-',
+            linewidth=0.5)
+    ax.get_xaxis().set_major_locator(MaxNLocator(integer=True))
+    ax.figure.tight_layout()
 
 
 def ce_png(x_data, y_data, x_label, y_label, chart_type="png",
            fill_color='#4C72B0'):
-    sns.set(style='ticks', font='Arial', context='talk', font_scale=1.2)
-
-    fig = plt.figure(figsize=(6, 5.5))
-    fig.clf()
-    ax = plt.subplot(111)
-    ce_plot(x_data, y_data, ax=ax, marker='o', mfc=fill_color, lw=0)
-
-    ax.yaxis.set_ticks_position('left')
-    ax.xaxis.set_ticks_position('bottom')
-    ax.tick_params(direction='out')
-    if y_label:
-        plt.ylabel(y_label)
-    if x_label:
-        plt.xlabel(x_label)
-
-    plt.tight_layout()
-    plt.subplots_adjust(top=0.95)
-
-    outs = BytesIO()
-    fig.canvas.draw()
-
-    if chart_type == 'pdf':
-        type_form = 'pdf'
-        dpi = 300
-    elif chart_type == 'svg':
-        type_form = 'svg'
-        dpi = 300
-    elif chart_type == 'pngat':
-        type_form = 'png'
-        dpi = 300
-    else:
-        type_form = 'png'
-        dpi = 100
-    fig.savefig(outs, dpi=dpi, format=type_form)
-    img = outs.getvalue()
-    outs.close()
-    return img
+    with render.style_context():
+        fig = render.new_figure(figsize=(6, 5.5))
+        ax = fig.add_subplot(111)
+        metrics.label(size=len(y_data))
+        with metrics.stage('ce_plot'):
+            ce_plot(x_data, y_data, ax=ax, marker='o', mfc=fill_color, lw=0)
+
+        ax.yaxis.set_ticks_position('left')
+        ax.xaxis.set_ticks_position('bottom')
+        ax.tick_params(direction='out')
+        if y_label:
+            ax.set_ylabel(y_label)
+        if x_label:
+            ax.set_xlabel(x_label)
+
+        fig.tight_layout()
+        fig.subplots_adjust(top=0.95)
+        jobs.checkpoint()
+
+        return render.save_figure(fig, chart_type)
+
+
+def warm_up(chart_type):
+    'ce_png of the form defaults as chart_type, for plots.warm_up()'
+    form = DataForm_CE()
+    x_data, y_data = [np.array(fv.data_split(field.data), dtype=float)
+                      for field in (form.x_data, form.y_data)]
+    return ce_png(x_data, y_data, form.x_label.data, form.y_label.data,
+                  chart_type, form.color.data)
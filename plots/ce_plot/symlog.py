@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+The symlog axis of the CE plot in plain numpy, so the tick positions can be
+computed without matplotlib. Follows matplotlib's SymmetricalLogTransform,
+SymmetricalLogLocator and default 5% axis margins for base 10, linscale 1.
+"""
+from __future__ import division, print_function
+
+import numpy as np
+
+BASE = 10.
+LINSCALE = 1.
+MARGIN = 0.05
+NUMTICKS = 15
+
+
+def percent(y):
+    'CE in percent, scaling fractions (all below 2) up'
+    y = np.asarray(y, dtype=float)
+    return y*100 if y.max() < 2 else y
+
+
+def _linscale_adj(base=BASE, linscale=LINSCALE):
+    return linscale / (1.0 - 1.0/base)
+
+
+def transform(a, linthresh, base=BASE, linscale=LINSCALE):
+    'Data to symlog axis coordinates'
+    a = np.asarray(a, dtype=float)
+    adj = _linscale_adj(base, linscale)
+    abs_a = np.abs(a)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out = np.sign(a) * linthresh * (
+            adj + np.log(abs_a/linthresh) / np.log(base))
+    inside = abs_a <= linthresh
+    out[inside] = a[inside] * adj
+    return out
+
+
+def inverted(a, linthresh, base=BASE, linscale=LINSCALE):
+    'Symlog axis coordinates back to data'
+    a = np.asarray(a, dtype=float)
+    adj = _linscale_adj(base, linscale)
+    invlinthresh = linthresh * adj
+    abs_a = np.abs(a)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out = np.sign(a) * linthresh * np.power(
+            base, abs_a/linthresh - adj)
+    inside = abs_a <= invlinthresh
+    out[inside] = a[inside] / adj
+    return out
+
+
+def view_limits(data, linthresh, margin=MARGIN):
+    'Autoscaled axis limits of data, margins added in axis coordinates'
+    lo, hi = transform([np.min(data), np.max(data)], linthresh)
+    if lo == hi:
+        # matplotlib's nonsingular expansion
+        delta = 0.001 * abs(lo) if lo else 0.001
+        lo, hi = lo - delta, hi + delta
+    delta = (hi - lo) * margin
+    return tuple(inverted([lo - delta, hi + delta], linthresh))
+
+
+def major_ticks(vmin, vmax, linthresh, base=BASE, numticks=NUMTICKS):
+    'SymmetricalLogLocator.tick_values with subs=[1]'
+    if vmax < vmin:
+        vmin, vmax = vmax, vmin
+    if -linthresh <= vmin < vmax <= linthresh:
+        return np.array(sorted({vmin, 0, vmax}))
+    has_a = vmin < -linthresh
+    has_c = vmax > linthresh
+    has_b = (has_a and vmax > -linthresh) or (has_c and vmin < linthresh)
+
+    def log_range(lo, hi):
+        return (np.floor(np.log(lo) / np.log(base)),
+                np.ceil(np.log(hi) / np.log(base)))
+
+    a_lo, a_hi = (0, 0)
+    if has_a:
+        a_lo, a_hi = log_range(abs(min(-linthresh, vmax)), abs(vmin) + 1)
+    c_lo, c_hi = (0, 0)
+    if has_c:
+        c_lo, c_hi = log_range(max(linthresh, vmin), vmax + 1)
+    total = (a_hi - a_lo) + (c_hi - c_lo) + (1 if has_b else 0)
+    stride = max(total // (numticks - 1), 1)
+
+    decades = []
+    if has_a:
+        decades.append(-base ** np.arange(a_lo, a_hi, stride)[::-1])
+    if has_b:
+        decades.append([0.0])
+    if has_c:
+        decades.append(base ** np.arange(c_lo, c_hi, stride))
+    return np.concatenate(decades)
+
+
+def minor_ticks(majors, linthresh):
+    """
+    Minor ticks between each pair of major ticks, dividing the pair in ten
+    where its middle is within linthresh and in nine, one per unit of the
+    lower decade, elsewhere.
+    """
+    majors = np.asarray(majors, dtype=float)
+    if len(majors) < 2:
+        return np.array([])
+    lo = majors[:-1]
+    step = np.diff(majors)
+    ndivs = np.where(np.abs(lo + step/2) < linthresh, 10, 9)
+    k = np.arange(1, 10)
+    locs = lo[:, None] + k[None, :] * (step/ndivs)[:, None]
+    return locs[k[None, :] < ndivs[:, None]]
+
+
+def axis(y, linthresh):
+    'Limits, major and minor ticks of the CE axis for transformed data y'
+    vmin, vmax = view_limits(y, linthresh)
+    majors = major_ticks(vmin, vmax, linthresh)
+    # setting the ticks widens the view to include them
+    vmin, vmax = min(vmin, majors.min()), max(vmax, majors.max())
+    return (vmin, vmax), majors, minor_ticks(majors, linthresh)
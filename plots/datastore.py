@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Server-side store of submitted datasets, so a plot form only uploads its
+data once.
+
+The first submission parses the data fields and stores the arrays under
+the sha256 of their contents. The page comes back with that handle in a
+hidden 'dataset' field and the data textareas blank, and later clicks
+(restyle, PNG, SVG) post only the handle while the textareas stay blank.
+Pasting new data replaces the dataset.
+
+The store is bounded to PLOT_STORE_MB of array data, least recently used
+first out, and drops datasets unused for PLOT_STORE_TTL seconds. A handle
+that has expired asks for the data again.
+"""
+from __future__ import division, print_function
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from bottle import request
+
+from . import form_valid as fv
+from . import memory
+from . import metrics
+
+MAX_BYTES = float(os.environ.get('PLOT_STORE_MB', 256)) * 2**20
+TTL = float(os.environ.get('PLOT_STORE_TTL', 3600))
+
+EXPIRED = 'The data sent before has expired, paste it in again.'
+
+
+class Store(object):
+    'LRU and TTL bounded map of content hash to a tuple of float arrays'
+    def __init__(self, max_bytes=MAX_BYTES, ttl=TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _array(a):
+        'a as float64, or as it is if an array of str (names go with data)'
+        if isinstance(a, np.ndarray) and a.dtype.kind == 'U':
+            return a
+        return np.asarray(a, dtype='<f8')
+
+    @classmethod
+    def digest(cls, arrays):
+        sha = hashlib.sha256()
+        for a in arrays:
+            a = np.ascontiguousarray(cls._array(a))
+            sha.update(b'%i:' % len(a))
+            if a.dtype.kind == 'U':
+                sha.update(a.dtype.str.encode())
+            sha.update(a.tobytes())
+        return sha.hexdigest()
+
+    def put(self, arrays):
+        'Store arrays and return their handle'
+        arrays = tuple(np.array(self._array(a)) for a in arrays)
+        for a in arrays:
+            a.flags.writeable = False
+        handle = self.digest(arrays)
+        size = sum(a.nbytes for a in arrays)
+        now = time.time()
+        with self._lock:
+            if handle in self._items:
+                self._items.move_to_end(handle)
+                arrays, _, size = self._items[handle]
+            else:
+                self.bytes += size
+            self._items[handle] = (arrays, now, size)
+            self._evict(now)
+        return handle
+
+    def get(self, handle):
+        'The arrays stored under handle, None if unknown or expired'
+        now = time.time()
+        with self._lock:
+            self._evict(now)
+            item = self._items.get(handle)
+            if item is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._items[handle] = (item[0], now, item[2])
+            self._items.move_to_end(handle)
+            return item[0]
+
+    def _evict(self, now):
+        while self._items:
+            handle, (_, used, size) = next(iter(self._items.items()))
+            # the oldest is first, keep the newest even if it is too big
+            if now - used <= self.ttl and (self.bytes <= self.max_bytes or
+                                           len(self._items) == 1):
+                break
+            del self._items[handle]
+            self.bytes -= size
+            self.evictions += 1
+
+    def __len__(self):
+        return len(self._items)
+
+
+store = Store()
+memory.cache('datastore', lambda: list(store._items.values()))
+
+
+def _blank(form, fields):
+    return not any((getattr(form, name).data or '').strip()
+                   for name in fields)
+
+
+def validate(form, fields):
+    """
+    fv.validate(form), taking the data fields from the store when they were
+    left blank and the hidden dataset field holds a handle. Returns (valid,
+    stored arrays or None); an expired handle fails on the first field.
+    """
+    handle = request.forms.get('dataset', '').strip()
+    arrays = None
+    if handle and _blank(form, fields):
+        arrays = store.get(handle)
+        if arrays is None:
+            getattr(form, fields[0]).process_errors.append(EXPIRED)
+        for name in fields:
+            getattr(form, name).validators = ()
+    return fv.validate(form), arrays
+
+
+def keep(form, fields, arrays=None):
+    """
+    Store the data fields, parsed unless arrays come from the store, and
+    blank them so the page does not carry the data back. Returns the handle
+    and the arrays.
+    """
+    if arrays is None:
+        arrays = [np.array(fv.data_split(getattr(form, name).data),
+                           dtype=float) for name in fields]
+    handle = store.put(arrays)
+    for name in fields:
+        getattr(form, name).data = ''
+    return handle, arrays
+
+
+def placeholder(arrays):
+    return ('Using the %i values sent before. Paste new data to replace '
+            'them.' % len(arrays[0]))
+
+
+@metrics.collector
+def _store_metrics():
+    return ['# HELP plot_datasets Datasets held for reuse.',
+            '# TYPE plot_datasets gauge',
+            'plot_datasets %i' % len(store),
+            '# HELP plot_dataset_bytes Array bytes held for reuse.',
+            '# TYPE plot_dataset_bytes gauge',
+            'plot_dataset_bytes %i' % store.bytes,
+            '# HELP plot_dataset_lookups_total Handle lookups by result.',
+            '# TYPE plot_dataset_lookups_total counter',
+            'plot_dataset_lookups_total{result="hit"} %i' % store.hits,
+            'plot_dataset_lookups_total{result="miss"} %i' % store.misses,
+            '# HELP plot_dataset_evictions_total Datasets dropped for size '
+            'or age.',
+            '# TYPE plot_dataset_evictions_total counter',
+            'plot_dataset_evictions_total %i' % store.evictions]
@@ -1 +1,7 @@
-from .example_plot import *
+"""
+Example x/y line plotter.
+"""
+# (path, methods, 'module:function')
+ROUTES = [('/example', ['POST', 'GET'], 'example_plot:plot_app')]
+# renders the default data, see plots.warm_up()
+WARMUP = ['example_plot:warm_up']
@@ -11,11 +11,12 @@
         </div>
         <div id="rightcolumn">
             %if (filled == 'good'):
-                <img class="plot" src="data:image/png;base64,{{img}}" alt="ASH Plot" width=600 align="center"/>
+                <img class="plot" src="data:{{img_type}};base64,{{img}}" alt="ASH Plot" width=600 align="center"/>
                 <div id="chart_export"><h3>Download Full Resolution Charts...</h3>
                     <a href="#"><label style="cursor:pointer" for="png_download">Download PNG</label></a> (300 dpi ready for publication)<br />
                     <!--<a href="png?type=pdf">Download PDF</a><br />-->
                     <a href="#"><label style="cursor:pointer" for="svg_download">Download SVG</label></a> (Edit this for free in <a href="https://www.inkscape.org/">Inkscape</a>.)<br />
+                    <a href="#"><label style="cursor:pointer" for="svgz_download">Download SVGZ</label></a> (The SVG gzip compressed.)<br />
                 </div>
             %end
         </div>
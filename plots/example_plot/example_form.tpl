@@ -34,13 +34,13 @@
             <div class="clearer">&nbsp;</div>
             <div class="col1">
                 <div class="form_property form_required">{{! form.x_data.label }}</div> 
-                <div class="form_property form_required">{{! form.x_data(cols=17, rows=25) }}
+                <div class="form_property form_required">{{! form.x_data(cols=17, rows=25, placeholder=stored_note or False, required=not stored_note) }}
                     %field_errors(form.x_data.errors)
                 </div>
             </div>
             <div class="col2">
                 <div class="form_property form_required">{{! form.y_data.label }}</div> 
-                <div class="form_property form_required">{{! form.y_data(cols=17, rows=25) }}
+                <div class="form_property form_required">{{! form.y_data(cols=17, rows=25, placeholder=stored_note or False, required=not stored_note) }}
                     %field_errors(form.y_data.errors)
                 </div>
             </div>
@@ -62,6 +62,7 @@
         <div class="clearer">&nbsp;</div>
     </div>
     <input type="hidden" name="filled" value="good">
+    <input type="hidden" name="dataset" value="{{dataset}}">
     <div class="form_row form_row_submit">
 
         <div class="form_value">
@@ -71,6 +72,8 @@
             
             <input type="submit" name="svg_download" id="svg_download" class="hidden" />
 
+            <input type="submit" name="svgz_download" id="svgz_download" class="hidden" />
+
 		    <input type="submit" name="clear" class="button" value="Clear the Form"></div>
 
 		    <div class="clearer">&nbsp;</div>
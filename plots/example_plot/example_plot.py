@@ -7,42 +7,52 @@ Created on Fri Aug  5 11:34:19 2016
 """
 from __future__ import division, print_function
 
-import matplotlib.pyplot as plt
 import numpy as np
-import seaborn as sns
-from io import BytesIO
 import base64
 import os
 import sys
 
 import bottle
-from bottle import route, response, template, request
+from bottle import response, template, request
 from wtforms import (Form, StringField, TextAreaField, validators)
 
+from .. import datastore
+from .. import handlers
 from .. import form_valid as fv
+from .. import render
+from .. import jobs
+from .. import metrics
+from .. import prerender
 
 example_data = '0.0\n1.0\n2.0\n3.0\n4.0\n5.0\n6.0\n7.0\n8.0\n9.0\n10.0'
 
-plt.rcParams['svg.fonttype'] = 'none'
-
 path = os.path.abspath(__file__)
 dir_path = os.path.dirname(path)
 bottle.TEMPLATE_PATH.insert(0, dir_path)
 
+# posted once, then kept in the datastore
+DATA_FIELDS = ('x_data', 'y_data')
+
 
 def eprint(*args, **kwargs):
     print(*args, file=sys.stderr, **kwargs)
 
 
-@route("/example", method=['POST', 'GET'])
 def plot_app():
     form = DataForm(request.forms)
     filled = request.forms.get('filled', '').strip()
     svg = request.forms.get('svg_download', '').strip()
+    svgz = request.forms.get('svgz_download', '').strip()
     png = request.forms.get('png_download', '').strip()
     clear = request.forms.get('clear', '').strip()
 
     img = ''
+    dataset = ''
+    stored_note = ''
+    arrays = None
+    valid = False
+    if filled and not clear:
+        valid, arrays = datastore.validate(form, DATA_FIELDS)
 
     if clear:
         filled = None
@@ -52,33 +62,43 @@ def plot_app():
         form.x_label.data = ''
         form.color.data = form.color.default
         form.color.data = form.color.default
-    elif filled and form.validate():
-        x_data_list = fv.data_split(form.x_data.data)
-        y_data_list = fv.data_split(form.y_data.data)
+    elif valid:
+        dataset, arrays, stored_note = handlers.keep(form, DATA_FIELDS, arrays)
+        x_data_list, y_data_list = arrays
         x_label = form.x_label.data
         y_label = form.y_label.data
         color = form.color.data
-        if svg:
-            chart_type = 'svg'
-            response.content_type = 'image/svg'
+        if svg or svgz:
+            chart_type = 'svgz' if svgz else 'svg'
+            response.content_type = render.mime(chart_type)
             response.set_header("Content-disposition",
-                                "attachment; filename=ce_plot.svg")
-            return make_plot(x_data_list, y_data_list, x_label, y_label,
-                             chart_type, color)
+                                "attachment; filename=ce_plot." + chart_type)
+            return prerender.respond('example', make_plot, x_data_list,
+                                     y_data_list, x_label, y_label,
+                                     chart_type=chart_type, color=color)
         elif png:
             chart_type = 'pngat'
             response.content_type = 'image/png'
             response.set_header("Content-disposition",
                                 "attachment; filename=ce_plot.png")
-            return make_plot(x_data_list, y_data_list, x_label, y_label,
-                             chart_type, color)
+            return prerender.respond('example', make_plot, x_data_list,
+                                     y_data_list, x_label, y_label,
+                                     chart_type=chart_type, color=color)
         else:
-            chart_type = 'png'
-            img = base64.b64encode(make_plot(x_data_list, y_data_list, x_label,
-                                             y_label, chart_type, color))
+            chart_type = render.PREVIEW
+            img = base64.b64encode(jobs.run('example', make_plot,
+                                            x_data_list, y_data_list,
+                                            x_label, y_label, chart_type,
+                                            color).getbuffer())
+            handlers.speculate('example', make_plot, x_data_list,
+                               y_data_list, x_label, y_label, color=color)
     else:
         filled = None
-    return template('example_app', filled=filled, form=form, img=img)
+        dataset, stored_note = handlers.kept(arrays)
+    return template('example_app', filled=filled, form=form, img=img,
+                    img_type=render.mime(render.PREVIEW),
+                    dataset=dataset,
+                    stored_note=stored_note)
 
 
 class DataForm(Form):
@@ -123,43 +143,34 @@ class DataForm(Form):
 
 def make_plot(x_data, y_data, x_label=None, y_label=None,
               chart_type="png", color='#4C72B0'):
-    sns.set(style='ticks', font='Arial', context='talk', font_scale=1.2)
-
-    fig = plt.figure(figsize=(6, 5.5))
-    fig.clf()
-    ax = plt.subplot(111)
-
-    x_data = np.array(x_data, dtype=float)
-    y_data = np.array(y_data, dtype=float)
-    plt.plot(x_data, y_data, color=color)
-
-    ax.yaxis.set_ticks_position('left')
-    ax.xaxis.set_ticks_position('bottom')
-    ax.tick_params(direction='out')
-
-    if y_label:
-        plt.ylabel(y_label)
-    if x_label:
-        plt.xlabel(x_label)
-
-    plt.tight_layout()
-
-    outs = BytesIO()
-    fig.canvas.draw()
-
-    if chart_type == 'pdf':
-        type_form = 'pdf'
-        dpi = 300
-    elif chart_type == 'svg':
-        type_form = 'svg'
-        dpi = 300
-    elif chart_type == 'pngat':
-        type_form = 'png'
-        dpi = 300
-    else:
-        type_form = 'png'
-        dpi = 100
-    fig.savefig(outs, dpi=dpi, format=type_form)
-    img = outs.getvalue()
-    outs.close()
-    return img
+    with render.style_context():
+        fig = render.new_figure(figsize=(6, 5.5))
+        ax = fig.add_subplot(111)
+
+        x_data = np.array(x_data, dtype=float)
+        y_data = np.array(y_data, dtype=float)
+        metrics.label(size=len(y_data))
+        with metrics.stage('plot'):
+            ax.plot(x_data, y_data, color=color)
+
+        ax.yaxis.set_ticks_position('left')
+        ax.xaxis.set_ticks_position('bottom')
+        ax.tick_params(direction='out')
+
+        if y_label:
+            ax.set_ylabel(y_label)
+        if x_label:
+            ax.set_xlabel(x_label)
+
+        fig.tight_layout()
+        jobs.checkpoint()
+
+        return render.save_figure(fig, chart_type)
+
+
+def warm_up(chart_type):
+    'make_plot of the form defaults as chart_type, for plots.warm_up()'
+    form = DataForm()
+    return make_plot(fv.data_split(form.x_data.data),
+                     fv.data_split(form.y_data.data), form.x_label.data,
+                     form.y_label.data, chart_type, form.color.data)
@@ -5,10 +5,13 @@ Created on Fri Aug  5 11:34:19 2016
 
 @author: bcolsen
 """
+from bottle import request
 from wtforms import validators
 import numpy as np
 import re
 
+from . import metrics
+
 
 class DataLength():
     def __init__(self, min=-1, max=-1, message=None):
@@ -55,6 +58,26 @@ class DataFloat():
             raise validators.ValidationError(err)
 
 
+def large_fields(form, names):
+    '''
+    Fill the fields names of form that were posted above bottle's MEMFILE_MAX,
+    which bottle hands over as files
+    '''
+    for name in names:
+        upload = request.files.get(name)
+        if upload is not None:
+            field = getattr(form, name)
+            field.data = upload.file.read().decode('utf-8-sig')
+            field.raw_data = [field.data]
+
+
+def validate(form):
+    'form.validate(), timed as the validate stage'
+    with metrics.stage('validate'):
+        return form.validate()
+
+
+@metrics.timed('data_split')
 def data_split(data):
     data_list = re.split(r'[\s,]+', data.strip())
     try:
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+What the plot form handlers share: keeping the data of a valid submission
+under a handle, handing that handle back with a page that failed
+validation, so the stored data stays in use while other fields are fixed,
+and rendering the downloads of a preview speculatively.
+"""
+from __future__ import division, print_function
+
+from bottle import request
+
+from . import datastore
+from . import prerender
+
+
+def keep(form, fields, arrays=None):
+    '''
+    datastore.keep() the data fields. Returns the handle, the arrays and the
+    note the blanked data field shows instead.
+    '''
+    handle, arrays = datastore.keep(form, fields, arrays)
+    return handle, arrays, datastore.placeholder(arrays)
+
+
+def kept(arrays):
+    '''
+    The handle and note of an invalid submission whose data came from the
+    store (arrays from datastore.validate()), blank if it did not.
+    '''
+    if arrays is None:
+        return '', ''
+    return (request.forms.get('dataset', '').strip(),
+            datastore.placeholder(arrays))
+
+
+def speculate(kind, func, *args, **kwargs):
+    '''
+    prerender.speculate() func(*args, chart_type=chart_type, **kwargs) for
+    each chart type of prerender.TYPES, after its preview. The downloads
+    pass chart_type and what follows it by keyword too, for
+    prerender.respond() to find them.
+    '''
+    for chart_type in prerender.TYPES:
+        prerender.speculate(kind, func, *args, chart_type=chart_type,
+                            **kwargs)
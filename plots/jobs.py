@@ -0,0 +1,438 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Bounded render queue in front of the plotting functions.
+
+Renders run on a fixed pool of worker threads fed by a bounded queue. When
+the queue is full a request is refused with 503 and a Retry-After estimate
+instead of piling up inside the server. Every plot type has a time budget;
+a render still queued when its budget runs out is dropped and a running
+render stops at its next checkpoint().
+
+WSGI gives no notice when a client disconnects, so cancellation follows
+what the client does: a synchronous request that gives up at its budget
+cancels its job, and an async job that is not polled for ABANDON_AFTER
+seconds is treated as abandoned and cancelled.
+
+Async mode (form field 'async' or header 'Prefer: respond-async') answers
+202 with a job id straight away; the result is fetched from /jobs/<id>.
+Async jobs have a queue and ASYNC_WORKERS threads of their own, so a burst
+of them never holds the workers a synchronous request waits for.
+
+Speculative jobs (speculate()) wait in a queue of their own for a single
+thread that only starts one while no interactive render is queued or
+running, and one yields at its next checkpoint as soon as an interactive
+render comes in.
+"""
+from __future__ import division, print_function
+
+import contextlib
+import contextvars
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from math import ceil
+
+from bottle import route, request, response, HTTPError, HTTPResponse
+
+from . import memory
+from . import metrics
+
+QUEUE_SIZE = int(os.environ.get('PLOT_QUEUE_SIZE', 16))
+WORKERS = int(os.environ.get('PLOT_WORKERS', 4))
+ASYNC_QUEUE_SIZE = int(os.environ.get('PLOT_ASYNC_QUEUE_SIZE', QUEUE_SIZE))
+ASYNC_WORKERS = int(os.environ.get('PLOT_ASYNC_WORKERS', max(1, WORKERS // 2)))
+ABANDON_AFTER = float(os.environ.get('PLOT_ABANDON_AFTER', 30))
+RESULT_TTL = float(os.environ.get('PLOT_RESULT_TTL', 300))
+ASYNC_BUDGET_FACTOR = 4
+SPECULATIVE_SIZE = int(os.environ.get('PLOT_SPECULATIVE_QUEUE', 8))
+
+# seconds a render of each plot type may take, queue wait included
+BUDGETS = {'ash': 30, 'ce': 20, 'ce_multi': 20, 'example': 10}
+DEFAULT_BUDGET = 30
+
+
+class QueueFull(Exception):
+    def __init__(self, retry_after):
+        Exception.__init__(self, 'Render queue is full')
+        self.retry_after = retry_after
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job(object):
+    def __init__(self, kind, func, args, kwargs, budget):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.submitted = time.time()
+        self.deadline = self.submitted + budget
+        self.started = None
+        self.finished = None
+        self.last_seen = self.submitted
+        self.headers = {}
+        self.result = None
+        self.error = None
+        self.cancelled = False
+        self.speculative = False
+        self._done = threading.Event()
+        # carries the request's metrics record onto the worker thread
+        self.context = contextvars.copy_context()
+
+    @property
+    def status(self):
+        if self.cancelled:
+            return 'cancelled'
+        elif self.error is not None:
+            return 'failed'
+        elif self._done.is_set():
+            return 'done'
+        elif self.started:
+            return 'running'
+        return 'queued'
+
+    def cancel(self):
+        self.cancelled = True
+        self._done.set()
+
+    def check(self):
+        'Raise JobCancelled if the job should stop now'
+        if self.cancelled:
+            raise JobCancelled('Render cancelled')
+        if time.time() > self.deadline:
+            self.cancel()
+            raise JobCancelled('Render exceeded its %s time budget' %
+                               self.kind)
+        if self.speculative and not _idle():
+            self.cancel()
+            raise JobCancelled('Speculative render yielded')
+
+    def wait(self, timeout=None):
+        if timeout is None:
+            timeout = max(0, self.deadline - time.time())
+        if not self._done.wait(timeout):
+            self.cancel()
+            raise JobCancelled('Render exceeded its %s time budget' %
+                               self.kind)
+        if self.cancelled:
+            raise JobCancelled('Render cancelled')
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def run(self):
+        _local.job = self
+        self.started = time.time()
+        try:
+            self.context.run(metrics.add, 'queue_wait',
+                             self.started - self.submitted)
+            self.check()
+            self.result = self.context.run(self.func, *self.args,
+                                           **self.kwargs)
+        except JobCancelled:
+            self.cancelled = True
+        except Exception as err:
+            self.error = err
+        finally:
+            _local.job = None
+            self.finished = time.time()
+            self._done.set()
+
+
+_local = threading.local()
+# set while a request must render on its own thread, e.g. under a profiler
+inline = contextvars.ContextVar('plot_jobs_inline', default=False)
+_queue = queue.Queue(QUEUE_SIZE)
+_async_queue = queue.Queue(ASYNC_QUEUE_SIZE)
+_speculative = queue.Queue(SPECULATIVE_SIZE)
+_lock = threading.Lock()
+_workers = []
+# interactive renders running, notified when one finishes
+_busy = [0]
+_activity = threading.Condition()
+_async_jobs = {}
+_avg_duration = [1.0]
+memory.cache('async', lambda: [job.result for job in list(_async_jobs.values())])
+
+
+def checkpoint():
+    'Called from render code between stages so cancelled jobs stop early'
+    job = getattr(_local, 'job', None)
+    if job is not None:
+        job.check()
+
+
+@contextlib.contextmanager
+def interactive():
+    'Count the block as an interactive render: speculative ones wait or yield'
+    with _activity:
+        _busy[0] += 1
+    try:
+        yield
+    finally:
+        with _activity:
+            _busy[0] -= 1
+            _activity.notify_all()
+
+
+def _idle():
+    'No interactive render queued or running'
+    return _busy[0] == 0 and _queue.empty() and _async_queue.empty()
+
+
+def _worker(lane):
+    while True:
+        job = lane.get()
+        with _activity:
+            _busy[0] += 1
+        try:
+            if job.cancelled or time.time() > job.deadline:
+                job.cancel()
+                continue
+            job.run()
+            if job.error is None and not job.cancelled:
+                duration = job.finished - job.started
+                _avg_duration[0] = 0.8*_avg_duration[0] + 0.2*duration
+        finally:
+            with _activity:
+                _busy[0] -= 1
+                _activity.notify_all()
+            lane.task_done()
+
+
+def _speculative_worker():
+    while True:
+        job = _speculative.get()
+        with _activity:
+            while not _idle() and not job.cancelled and \
+                    time.time() < job.deadline:
+                _activity.wait(min(1.0, job.deadline - time.time()))
+        if job.cancelled or time.time() > job.deadline:
+            job.cancel()
+            continue
+        job.run()
+
+
+def _start_thread(name, target, *args):
+    worker = threading.Thread(target=target, name=name, args=args)
+    worker.daemon = True
+    worker.start()
+    _workers.append(worker)
+
+
+def _start_workers():
+    with _lock:
+        if _workers:
+            return
+        for i in range(WORKERS):
+            _start_thread('render-%i' % i, _worker, _queue)
+        for i in range(ASYNC_WORKERS):
+            _start_thread('render-async-%i' % i, _worker, _async_queue)
+        _start_thread('render-speculative', _speculative_worker)
+
+
+def _forget_workers():
+    'A forked server worker starts render threads of its own'
+    del _workers[:]
+
+
+os.register_at_fork(after_in_child=_forget_workers)
+
+
+@metrics.collector
+def _queue_metrics():
+    return ['# HELP plot_queue_depth Renders waiting for a worker.',
+            '# TYPE plot_queue_depth gauge',
+            'plot_queue_depth %i' % _queue.qsize(),
+            '# HELP plot_async_queue_depth Async renders waiting for an '
+            'async worker.',
+            '# TYPE plot_async_queue_depth gauge',
+            'plot_async_queue_depth %i' % _async_queue.qsize(),
+            '# HELP plot_speculative_queue_depth Speculative renders '
+            'waiting for the queue to go idle.',
+            '# TYPE plot_speculative_queue_depth gauge',
+            'plot_speculative_queue_depth %i' % _speculative.qsize(),
+            '# HELP plot_async_jobs Async renders held for polling.',
+            '# TYPE plot_async_jobs gauge',
+            'plot_async_jobs %i' % len(_async_jobs)]
+
+
+def retry_after(lane=_queue, workers=WORKERS):
+    'Seconds until the queue has probably drained enough to take a job'
+    return int(ceil(_avg_duration[0] * (lane.qsize() + 1) / workers))
+
+
+def _put(job, lane, workers):
+    _start_workers()
+    _sweep()
+    try:
+        lane.put_nowait(job)
+    except queue.Full:
+        raise QueueFull(retry_after(lane, workers))
+    return job
+
+
+def submit(kind, func, *args, **kwargs):
+    'Queue func(*args, **kwargs), raises QueueFull if there is no room'
+    budget = kwargs.pop('budget', None) or BUDGETS.get(kind, DEFAULT_BUDGET)
+    return _put(Job(kind, func, args, kwargs, budget), _queue, WORKERS)
+
+
+def speculate(kind, func, *args, **kwargs):
+    '''
+    Queue func(*args, **kwargs) to run when the renderer is idle, None if
+    the speculative queue is full. Its stages are observed under the route
+    'speculative <kind>' rather than the request's.
+    '''
+    budget = BUDGETS.get(kind, DEFAULT_BUDGET) * ASYNC_BUDGET_FACTOR
+    job = Job(kind, func, args, kwargs, budget)
+    job.speculative = True
+    job.context = metrics.detached('speculative ' + kind)
+    _start_workers()
+    try:
+        _speculative.put_nowait(job)
+    except queue.Full:
+        return None
+    return job
+
+
+def promote(job):
+    '''
+    Stop a speculative job from yielding because a request now waits for
+    it. False if it has not started or was cancelled, run it afresh then.
+    '''
+    if job.started is None or job.cancelled:
+        job.cancel()
+        return False
+    job.speculative = False
+    return not job.cancelled
+
+
+def _sweep():
+    'Cancel async jobs nobody polls any more and drop stale results'
+    now = time.time()
+    with _lock:
+        for job_id, job in list(_async_jobs.items()):
+            if job.finished is None and now - job.last_seen > ABANDON_AFTER:
+                job.cancel()
+            if job.cancelled or (job.finished and
+                                 now - job.finished > RESULT_TTL):
+                del _async_jobs[job_id]
+
+
+def pending():
+    'Async jobs still held for a client to poll, once the stale are swept'
+    _sweep()
+    with _lock:
+        return len(_async_jobs)
+
+
+def busy(err):
+    return HTTPError(503, 'Too many plots are being made right now, ' +
+                     'try again shortly.', Retry_After=str(err.retry_after))
+
+
+def run(kind, func, *args, **kwargs):
+    'Render through the queue and wait for it within the plot type budget'
+    if inline.get():
+        kwargs.pop('budget', None)
+        return func(*args, **kwargs)
+    try:
+        return submit(kind, func, *args, **kwargs).wait()
+    except QueueFull as err:
+        raise busy(err)
+    except JobCancelled as err:
+        raise HTTPError(504, str(err))
+
+
+def wants_async():
+    return bool(request.forms.get('async', '').strip() or
+                'respond-async' in request.get_header('Prefer', ''))
+
+
+def respond(kind, func, *args, **kwargs):
+    """
+    Render for a download. Synchronous by default, in async mode answer 202
+    with the job id and keep the download headers for when it is polled.
+    """
+    if inline.get() or not wants_async():
+        return run(kind, func, *args, **kwargs)
+    try:
+        job = background(kind, func, *args, **kwargs)
+    except QueueFull as err:
+        raise busy(err)
+    job.headers = dict((name, response.get_header(name))
+                       for name in ('Content-Type', 'Content-Disposition')
+                       if response.get_header(name))
+    return accepted(job)
+
+
+def background(kind, func, *args, **kwargs):
+    '''
+    Queue func(*args, **kwargs) as an async job to poll at /jobs/<id>, with
+    the async budget, on the async workers. Raises QueueFull.
+    '''
+    budget = BUDGETS.get(kind, DEFAULT_BUDGET) * ASYNC_BUDGET_FACTOR
+    job = _put(Job(kind, func, args, kwargs, budget), _async_queue,
+               ASYNC_WORKERS)
+    with _lock:
+        _async_jobs[job.id] = job
+    return job
+
+
+def poll_url(job):
+    return request.script_name + 'jobs/' + job.id
+
+
+def _status(job):
+    return {'id': job.id, 'kind': job.kind, 'status': job.status,
+            'poll': poll_url(job)}
+
+
+def accepted(job):
+    return HTTPResponse(json.dumps(_status(job)), 202,
+                        Content_Type='application/json',
+                        Location=_status(job)['poll'], Retry_After='1')
+
+
+def _get(job_id):
+    _sweep()
+    with _lock:
+        job = _async_jobs.get(job_id)
+    if job is None:
+        raise HTTPError(404, 'No such render job, it may have expired.')
+    job.last_seen = time.time()
+    return job
+
+
+@route('/jobs/<job_id>', method='GET')
+def job_status(job_id):
+    job = _get(job_id)
+    status = job.status
+    if status in ('queued', 'running'):
+        return accepted(job)
+    with _lock:
+        _async_jobs.pop(job_id, None)
+    if status == 'done':
+        for name, value in job.headers.items():
+            response.set_header(name, value)
+        return job.result
+    elif status == 'failed':
+        raise HTTPError(500, 'Render failed: %s' % job.error)
+    raise HTTPError(504, 'Render cancelled or exceeded its time budget.')
+
+
+@route('/jobs/<job_id>', method='DELETE')
+def job_cancel(job_id):
+    job = _get(job_id)
+    job.cancel()
+    with _lock:
+        _async_jobs.pop(job_id, None)
+    return _status(job)
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Per-request memory accounting and a leak detector for figures and arrays.
+
+Off unless PLOT_MEMORY=on, since tracemalloc slows allocation down. When on,
+every plot request records:
+
+    peak     highest traced memory above the start of the request
+    cached   growth of the caches kept by design, registered with cache():
+             stored datasets, speculative downloads, the ASH caches, live
+             CE series and async results waiting to be polled
+    net      traced memory still held when the request ends, less cached
+    figures  live matplotlib Figure objects before and after, pyplot or not,
+             less the figures the caches hold
+    arrays   live NumPy buffers of LARGE_ARRAY bytes or more, less those the
+             caches hold, counted only when net reaches LARGE_ARRAY: one
+             snapshot of every trace takes seconds, and a request that kept
+             less cannot have kept a large array
+
+Both ends are measured after a garbage collection, so figures and arrays
+waiting in reference cycles are not counted as held. A request whose net
+allocation passes PLOT_LEAK_MB, or that leaves figures or large arrays
+behind, is logged as a leak. Totals, and the size of each cache, are
+exported through /metrics.
+
+tracemalloc is process wide, so with requests running concurrently the
+numbers of one request include allocations of the others; run a single
+worker thread when hunting a specific leak. Speculative renders wait for
+an accounted request to finish, or yield to it.
+"""
+from __future__ import division, print_function
+
+import gc
+import io
+import logging
+import os
+import resource
+import sys
+import threading
+import tracemalloc
+
+from bottle import request
+
+from . import metrics
+
+ENABLED = os.environ.get('PLOT_MEMORY', 'off') == 'on'
+LEAK_BYTES = float(os.environ.get('PLOT_LEAK_MB', 5)) * 2**20
+LARGE_ARRAY = 2**20
+
+log = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_totals = {'requests': 0, 'leaks': 0, 'net_bytes': 0, 'cached_bytes': 0,
+           'peak_bytes': 0, 'figures': 0, 'pyplot_figures': 0, 'arrays': 0}
+_leaks_by_route = {}
+# name: function giving the values the cache holds
+_caches = {}
+# large arrays outside the caches at the last count
+_arrays = [None]
+
+
+def cache(name, held):
+    '''
+    Register a cache kept on purpose, held() giving the values in it, so
+    that what it keeps is reported apart from leaks
+    '''
+    _caches[name] = held
+
+
+def cached():
+    '''
+    The traced bytes, figures and large arrays each registered cache holds,
+    anything two of them share counted in the first only
+    '''
+    seen = set()
+    return dict((name, size(held(), seen))
+                for name, held in sorted(_caches.items()))
+
+
+def size(value, seen):
+    '''
+    Bytes of the NumPy arrays, bytes and BytesIO in value, through tuples,
+    lists, dicts and object attributes, the Figures in it, whose attributes
+    are not followed and whose Agg buffers are not traced, and its arrays of
+    LARGE_ARRAY bytes or more
+    '''
+    if id(value) in seen:
+        return 0, 0, 0
+    seen.add(id(value))
+    numpy = sys.modules.get('numpy')
+    figure = sys.modules.get('matplotlib.figure')
+    if numpy is not None and isinstance(value, numpy.ndarray):
+        return value.nbytes, 0, int(value.nbytes >= LARGE_ARRAY)
+    if figure is not None and isinstance(value, figure.Figure):
+        return 0, 1, 0
+    if isinstance(value, (bytes, bytearray)):
+        return len(value), 0, 0
+    if isinstance(value, io.BytesIO):
+        with value.getbuffer() as view:
+            return view.nbytes, 0, 0
+    if isinstance(value, dict):
+        value = list(value.values())
+    elif isinstance(value, (tuple, list)):
+        value = list(value)
+    elif hasattr(value, '__dict__') and not isinstance(value, type):
+        value = list(vars(value).values())
+    else:
+        return 0, 0, 0
+    sizes = [size(item, seen) for item in value]
+    return tuple(sum(column) for column in zip((0, 0, 0), *sizes))
+
+
+def live_figures():
+    'Live Figure objects, and how many of them pyplot is holding'
+    figure_type = sys.modules.get('matplotlib.figure')
+    if figure_type is None:
+        return 0, 0
+    figures = sum(1 for obj in gc.get_objects()
+                  if isinstance(obj, figure_type.Figure))
+    pyplot = sys.modules.get('matplotlib.pyplot')
+    return figures, len(pyplot.get_fignums()) if pyplot else 0
+
+
+def large_arrays():
+    'NumPy data buffers of LARGE_ARRAY bytes or more still allocated'
+    numpy = sys.modules.get('numpy')
+    if numpy is None or not tracemalloc.is_tracing():
+        return 0
+    domain = numpy.lib.tracemalloc_domain
+    snapshot = tracemalloc.take_snapshot().filter_traces(
+        [tracemalloc.DomainFilter(True, domain)])
+    return sum(1 for trace in snapshot.traces if trace.size >= LARGE_ARRAY)
+
+
+def census():
+    '''
+    Traced memory, the caches' bytes and the live figures outside them,
+    after collecting what only cycles keep alive
+    '''
+    gc.collect()
+    caches = list(cached().values())
+    figures, pyplot_figures = live_figures()
+    return {'traced': tracemalloc.get_traced_memory()[0],
+            'cached': sum(size for size, _, _ in caches),
+            'figures': figures - sum(n for _, n, _ in caches),
+            'pyplot_figures': pyplot_figures,
+            'cached_arrays': sum(n for _, _, n in caches)}
+
+
+def account(route, before, callback, *args, **kwargs):
+    tracemalloc.reset_peak()
+    try:
+        return callback(*args, **kwargs)
+    finally:
+        peak = tracemalloc.get_traced_memory()[1] - before['traced']
+        after = census()
+        cached_net = after['cached'] - before['cached']
+        net = after['traced'] - before['traced'] - cached_net
+        grown = dict((k, after[k] - before[k])
+                     for k in ('figures', 'pyplot_figures'))
+        grown['arrays'] = 0
+        if net >= LARGE_ARRAY or _arrays[0] is None:
+            arrays = large_arrays() - after['cached_arrays']
+            with _lock:
+                if _arrays[0] is not None:
+                    grown['arrays'] = arrays - _arrays[0]
+                _arrays[0] = arrays
+        leaked = net > LEAK_BYTES or any(v > 0 for v in grown.values())
+        with _lock:
+            _totals['requests'] += 1
+            _totals['net_bytes'] += net
+            _totals['cached_bytes'] += cached_net
+            _totals['peak_bytes'] = max(_totals['peak_bytes'], peak)
+            _totals.update((k, after[k]) for k in grown if k != 'arrays')
+            _totals['arrays'] = _arrays[0]
+            if leaked:
+                _totals['leaks'] += 1
+                _leaks_by_route[route] = _leaks_by_route.get(route, 0) + 1
+        if leaked:
+            log.warning('%s %s kept %.1f MB (peak %.1f MB, caches %+.1f MB), '
+                        'figures %+i, pyplot figures %+i, large arrays %+i',
+                        request.method, route, net/2**20, peak/2**20,
+                        cached_net/2**20, grown['figures'],
+                        grown['pyplot_figures'], grown['arrays'])
+
+
+class MemoryPlugin(object):
+    'Accounts the memory of every plot request when PLOT_MEMORY=on'
+    name = 'memory'
+    api = 2
+
+    def apply(self, callback, route):
+        if not ENABLED or not getattr(route.callback, 'plugin', None):
+            return callback
+
+        def wrapper(*args, **kwargs):
+            from . import jobs
+            # speculative renders would land in this request's numbers
+            with jobs.interactive():
+                return account(route.rule, census(), callback,
+                               *args, **kwargs)
+        return wrapper
+
+
+plugin = MemoryPlugin()
+
+
+def max_rss():
+    'Peak resident set size of the process in bytes'
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def rss():
+    'Resident set size of the process now in bytes, the peak without /proc'
+    try:
+        with open('/proc/self/statm') as fp:
+            return int(fp.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return max_rss()
+
+
+@metrics.collector
+def _memory_metrics():
+    lines = ['# HELP plot_process_max_rss_bytes Peak resident set size.',
+             '# TYPE plot_process_max_rss_bytes gauge',
+             'plot_process_max_rss_bytes %i' % max_rss()]
+    if not ENABLED:
+        return lines
+    with _lock:
+        totals = dict(_totals)
+        leaks = sorted(_leaks_by_route.items())
+    caches = sorted(cached().items())
+    lines += ['# HELP plot_memory_requests_total Plot requests accounted.',
+              '# TYPE plot_memory_requests_total counter',
+              'plot_memory_requests_total %i' % totals['requests'],
+              '# HELP plot_memory_net_bytes_total Traced memory kept after '
+              'requests.',
+              '# TYPE plot_memory_net_bytes_total counter',
+              'plot_memory_net_bytes_total %i' % totals['net_bytes'],
+              '# HELP plot_memory_cached_bytes_total Traced memory requests '
+              'added to caches kept by design.',
+              '# TYPE plot_memory_cached_bytes_total counter',
+              'plot_memory_cached_bytes_total %i' % totals['cached_bytes'],
+              '# HELP plot_memory_cache_bytes Bytes held by each cache kept '
+              'by design.',
+              '# TYPE plot_memory_cache_bytes gauge']
+    lines += ['plot_memory_cache_bytes{cache="%s"} %i' % (name, size)
+              for name, (size, _, _) in caches]
+    lines += ['# HELP plot_memory_peak_bytes Highest traced peak of a request.',
+              '# TYPE plot_memory_peak_bytes gauge',
+              'plot_memory_peak_bytes %i' % totals['peak_bytes'],
+              '# HELP plot_live_figures Live matplotlib figures.',
+              '# TYPE plot_live_figures gauge',
+              'plot_live_figures{kind="all"} %i' % totals['figures'],
+              'plot_live_figures{kind="pyplot"} %i' %
+              totals['pyplot_figures'],
+              '# HELP plot_live_large_arrays Live NumPy buffers over %i '
+              'bytes.' % LARGE_ARRAY,
+              '# TYPE plot_live_large_arrays gauge',
+              'plot_live_large_arrays %i' % totals['arrays'],
+              '# HELP plot_memory_leaks_total Requests that leaked.',
+              '# TYPE plot_memory_leaks_total counter']
+    lines += ['plot_memory_leaks_total{route="%s"} %i' % item
+              for item in leaks]
+    return lines
+
+
+if ENABLED:
+    tracemalloc.start()
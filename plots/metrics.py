@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Per-stage latency histograms for the plot routes, served on /metrics in
+Prometheus text format.
+
+Code marks its phases with ``with metrics.stage('kde'):``. The bottle
+plugin opens a record for each request and observes every stage when the
+request ends, labelled by route, output format and input size bucket, which
+the renderers fill in with label() as they learn them. Records follow a
+render onto the job queue threads through contextvars.
+
+PLOT_METRICS=auto (the default) only records while someone has scraped
+/metrics in the last ACTIVE_FOR seconds, on records always, off never.
+Outside a request stage() is a no-op.
+"""
+from __future__ import division, print_function
+
+import contextvars
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from bottle import route, request, response
+
+MODE = os.environ.get('PLOT_METRICS', 'auto')
+ACTIVE_FOR = 600
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+           2.5, 5.0, 10.0, 30.0, 60.0)
+SIZES = ((10, '10'), (100, '100'), (1000, '1k'), (10000, '10k'),
+         (100000, '100k'), (1000000, '1M'))
+
+_current = contextvars.ContextVar('plot_metrics', default=None)
+_lock = threading.Lock()
+_histograms = {}
+_collectors = []
+_last_scrape = [0]
+
+
+def size_bucket(n):
+    for limit, name in SIZES:
+        if n <= limit:
+            return name
+    return 'more'
+
+
+class Record(object):
+    'Stages of one request, observed once its labels are known'
+    def __init__(self, route):
+        self.labels = {'route': route, 'format': '', 'size': ''}
+        self.stages = []
+        self.closed = False
+
+    def add(self, name, seconds):
+        if self.closed:
+            # an async render finishing after its request was answered
+            observe(name, seconds, **self.labels)
+        else:
+            self.stages.append((name, seconds))
+
+    def close(self):
+        self.closed = True
+        for name, seconds in self.stages:
+            observe(name, seconds, **self.labels)
+        self.stages = []
+
+
+def active():
+    if MODE == 'on':
+        return True
+    elif MODE == 'auto':
+        return time.time() - _last_scrape[0] < ACTIVE_FOR
+    return False
+
+
+def observe(stage, seconds, route='', format='', size=''):
+    key = (stage, route, format, size)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = [[0]*len(BUCKETS), 0.0, 0]
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                hist[0][i] += 1
+                break
+        hist[1] += seconds
+        hist[2] += 1
+
+
+def detached(route):
+    '''
+    A context to run work outside of any request in, its stages observed
+    under route as they finish while metrics are active, as requests are
+    '''
+    context = contextvars.Context()
+    if active():
+        record = Record(route)
+        record.closed = True
+        context.run(_current.set, record)
+    return context
+
+
+def add(name, seconds):
+    'Record a stage timed elsewhere, e.g. queue wait'
+    record = _current.get()
+    if record is not None:
+        record.add(name, seconds)
+
+
+def label(format=None, size=None):
+    'Fill in the format or input size labels of the current request'
+    record = _current.get()
+    if record is not None:
+        if format is not None:
+            record.labels['format'] = format
+        if size is not None:
+            record.labels['size'] = size_bucket(size)
+
+
+@contextmanager
+def stage(name):
+    record = _current.get()
+    if record is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record.add(name, time.perf_counter() - start)
+
+
+def timed(name):
+    'Decorator form of stage()'
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def plugin(callback):
+    'bottle plugin opening a metrics record around every request'
+    def wrapper(*args, **kwargs):
+        if not active():
+            return callback(*args, **kwargs)
+        record = Record(request.route.rule)
+        token = _current.set(record)
+        start = time.perf_counter()
+        try:
+            return callback(*args, **kwargs)
+        finally:
+            record.add('request', time.perf_counter() - start)
+            record.close()
+            _current.reset(token)
+    return wrapper
+
+
+def collector(func):
+    'Register func() -> lines of extra metrics for /metrics'
+    _collectors.append(func)
+    return func
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"')
+
+
+def exposition():
+    lines = ['# HELP plot_stage_seconds Time spent in each stage of a plot '
+             'request.',
+             '# TYPE plot_stage_seconds histogram']
+    with _lock:
+        histograms = sorted((key, ([c for c in hist[0]], hist[1], hist[2]))
+                            for key, hist in _histograms.items())
+    for (stage_name, route_name, format, size), (counts, total, count) \
+            in histograms:
+        labels = 'stage="%s",route="%s",format="%s",size="%s"' % tuple(
+            _escape(v) for v in (stage_name, route_name, format, size))
+        cumulative = 0
+        for bound, c in zip(BUCKETS, counts):
+            cumulative += c
+            lines.append('plot_stage_seconds_bucket{%s,le="%g"} %i' %
+                         (labels, bound, cumulative))
+        lines.append('plot_stage_seconds_bucket{%s,le="+Inf"} %i' %
+                     (labels, count))
+        lines.append('plot_stage_seconds_sum{%s} %.6f' % (labels, total))
+        lines.append('plot_stage_seconds_count{%s} %i' % (labels, count))
+    for func in _collectors:
+        lines.extend(func())
+    return '\n'.join(lines) + '\n'
+
+
+@route('/metrics')
+def metrics():
+    _last_scrape[0] = time.time()
+    response.content_type = 'text/plain; version=0.0.4; charset=utf-8'
+    return exposition()
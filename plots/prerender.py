@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Speculative renders of the downloads of a plot whose preview was just
+shown, so the Download PNG and SVG clicks that usually follow are served
+from memory.
+
+After a preview the plot handlers call speculate() for each chart type in
+TYPES (PLOT_PRERENDER, default 'pngat,svg', empty to turn it off). Each
+render waits on jobs.speculate()'s queue until the renderer is idle and
+yields to interactive requests, and its result is cached under a hash of
+the render function and all of its arguments. Downloads go through
+respond(): a cached result is sent straight away, a speculative render
+already running is waited for, anything else is rendered as before.
+
+The cache holds at most PLOT_PRERENDER_MB of images, least recently used
+out first, each for PLOT_PRERENDER_TTL seconds.
+"""
+from __future__ import division, print_function
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from io import BytesIO
+
+import numpy as np
+
+from . import jobs
+from . import memory
+from . import metrics
+
+TYPES = [t for t in os.environ.get('PLOT_PRERENDER', 'pngat,svg').split(',')
+         if t]
+MAX_BYTES = float(os.environ.get('PLOT_PRERENDER_MB', 64)) * 2**20
+TTL = float(os.environ.get('PLOT_PRERENDER_TTL', 600))
+
+_cache = OrderedDict()
+_pending = {}
+_lock = threading.Lock()
+_bytes = [0]
+_counts = {'hit': 0, 'wait': 0, 'miss': 0}
+memory.cache('prerender', lambda: list(_cache.values()))
+
+
+def _feed(sha, value):
+    if isinstance(value, np.ndarray):
+        value = np.ascontiguousarray(value)
+        sha.update(('%s%r:' % (value.dtype.str, value.shape)).encode())
+        sha.update(value.tobytes())
+    elif isinstance(value, (list, tuple)):
+        sha.update(b'(%i:' % len(value))
+        for item in value:
+            _feed(sha, item)
+    else:
+        sha.update(('%r;' % (value,)).encode())
+
+
+def call_key(kind, func, args, kwargs):
+    'sha256 of kind, func and its arguments, arrays by content'
+    sha = hashlib.sha256(('%s:%s.%s' % (kind, func.__module__,
+                                        func.__qualname__)).encode())
+    _feed(sha, args)
+    _feed(sha, sorted(kwargs.items()))
+    return sha.hexdigest()
+
+
+def _expire(now):
+    while _cache:
+        key, (data, stored) = next(iter(_cache.items()))
+        if now - stored <= TTL and _bytes[0] <= MAX_BYTES:
+            break
+        del _cache[key]
+        _bytes[0] -= len(data)
+
+
+def _put(key, data):
+    with _lock:
+        if key not in _cache:
+            _bytes[0] += len(data)
+        _cache[key] = (data, time.time())
+        _expire(time.time())
+
+
+def _get(key):
+    with _lock:
+        _expire(time.time())
+        item = _cache.get(key)
+        if item is None:
+            return None
+        _cache.move_to_end(key)
+        return item[0]
+
+
+def speculate(kind, func, *args, **kwargs):
+    'Render func(*args, **kwargs) in the background if not cached already'
+    key = call_key(kind, func, args, kwargs)
+
+    def render():
+        try:
+            out = func(*args, **kwargs)
+            _put(key, out.getvalue())
+            return out
+        finally:
+            with _lock:
+                if _pending.get(key) is job:
+                    del _pending[key]
+
+    with _lock:
+        for other, pending in list(_pending.items()):
+            if pending.cancelled:
+                del _pending[other]
+        if key in _cache or key in _pending:
+            return
+        job = jobs.speculate(kind, render)
+        if job is not None:
+            _pending[key] = job
+
+
+def respond(kind, func, *args, **kwargs):
+    'jobs.respond(kind, func, *args, **kwargs), from the cache when there'
+    key = call_key(kind, func, args, kwargs)
+    data = _get(key)
+    if data is not None:
+        _counts['hit'] += 1
+        return BytesIO(data)
+    with _lock:
+        job = _pending.get(key)
+    if job is not None and jobs.promote(job):
+        try:
+            out = job.wait()
+            _counts['wait'] += 1
+            return BytesIO(out.getvalue())
+        except jobs.JobCancelled:
+            pass
+    _counts['miss'] += 1
+    return jobs.respond(kind, func, *args, **kwargs)
+
+
+@metrics.collector
+def _prerender_metrics():
+    return (['# HELP plot_prerender_bytes Speculative download renders held.',
+             '# TYPE plot_prerender_bytes gauge',
+             'plot_prerender_bytes %i' % _bytes[0],
+             '# HELP plot_prerender_downloads_total Downloads by whether a '
+             'speculative render was ready, still running or missing.',
+             '# TYPE plot_prerender_downloads_total counter'] +
+            ['plot_prerender_downloads_total{result="%s"} %i' % item
+             for item in sorted(_counts.items())])
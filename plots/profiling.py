@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Opt-in profiling of single plot requests.
+
+Profiling only exists when PLOT_PROFILE_TOKEN is set; without it the plugin
+hands every route back untouched and the admin routes answer 404. With it,
+a plot request carrying the token in an X-Plot-Profile header or a
+profile=<token> query parameter is run under a profiler:
+
+    profile_mode=calls   cProfile, stored as pstats (the default)
+    profile_mode=sample  stack sampler, stored as collapsed stacks for
+                         flamegraph.pl / speedscope
+
+The render runs on the request thread while profiled so the profiler sees
+it. The response carries X-Plot-Profile-Id; the result is fetched with the
+same token from /admin/profiles/<id>.pstats, .txt or .collapsed.
+"""
+from __future__ import division, print_function
+
+import cProfile
+import hmac
+import io
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from bottle import route, request, response, HTTPError
+
+from . import jobs
+
+TOKEN = os.environ.get('PLOT_PROFILE_TOKEN', '')
+MAX_PROFILES = 20
+SAMPLE_INTERVAL = 0.005
+
+_profiles = OrderedDict()
+_lock = threading.Lock()
+# cProfile allows one active profiler per interpreter on newer Pythons
+_running = threading.Lock()
+
+
+def authorized(token):
+    return bool(TOKEN) and hmac.compare_digest(token.encode('utf-8'),
+                                               TOKEN.encode('utf-8'))
+
+
+def requested():
+    return authorized(request.get_header('X-Plot-Profile', '') or
+                      request.query.get('profile', ''))
+
+
+class Sampler(object):
+    'Samples the stack of one thread into collapsed stack counts'
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run,
+                                        name='plot-sampler')
+        self._thread.daemon = True
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('%s:%s' % (os.path.basename(code.co_filename),
+                                        code.co_name))
+                frame = frame.f_back
+            if stack:
+                key = ';'.join(reversed(stack))
+                self.counts[key] = self.counts.get(key, 0) + 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self):
+        return ''.join('%s %i\n' % item
+                       for item in sorted(self.counts.items()))
+
+
+def _store(profile):
+    with _lock:
+        _profiles[profile['id']] = profile
+        while len(_profiles) > MAX_PROFILES:
+            _profiles.popitem(last=False)
+
+
+def profiled(callback, *args, **kwargs):
+    'Run callback under the requested profiler and store the result'
+    mode = request.query.get('profile_mode', 'calls')
+    profile = {'id': uuid.uuid4().hex, 'route': request.route.rule,
+               'mode': mode, 'created': time.time()}
+    token = jobs.inline.set(True)
+    with _running:
+        start = time.perf_counter()
+        try:
+            if mode == 'sample':
+                sampler = Sampler(threading.get_ident())
+                sampler.start()
+                try:
+                    result = callback(*args, **kwargs)
+                finally:
+                    sampler.stop()
+                profile['collapsed'] = sampler.collapsed()
+            else:
+                prof = cProfile.Profile()
+                try:
+                    result = prof.runcall(callback, *args, **kwargs)
+                finally:
+                    stats = pstats.Stats(prof)
+                profile['pstats'] = marshal.dumps(stats.stats)
+        finally:
+            jobs.inline.reset(token)
+            profile['seconds'] = time.perf_counter() - start
+            _store(profile)
+            response.set_header('X-Plot-Profile-Id', profile['id'])
+    return result
+
+
+class ProfilePlugin(object):
+    'Wraps the plot handlers so a request with the token can be profiled'
+    name = 'profile'
+    api = 2
+
+    def apply(self, callback, route):
+        if not TOKEN or not getattr(route.callback, 'plugin', None):
+            return callback
+
+        def wrapper(*args, **kwargs):
+            if requested():
+                return profiled(callback, *args, **kwargs)
+            return callback(*args, **kwargs)
+        return wrapper
+
+
+plugin = ProfilePlugin()
+
+
+def _admin():
+    if not TOKEN:
+        raise HTTPError(404)
+    if not requested():
+        raise HTTPError(403, 'Profiling token required.')
+
+
+def _profile(profile_id):
+    _admin()
+    with _lock:
+        profile = _profiles.get(profile_id)
+    if profile is None:
+        raise HTTPError(404, 'No such profile.')
+    return profile
+
+
+@route('/admin/profiles')
+def profiles():
+    _admin()
+    with _lock:
+        items = list(_profiles.values())
+    return {'profiles': [dict((k, p[k]) for k in
+                              ('id', 'route', 'mode', 'created', 'seconds'))
+                         for p in items]}
+
+
+@route('/admin/profiles/<profile_id>.pstats')
+def profile_pstats(profile_id):
+    profile = _profile(profile_id)
+    if 'pstats' not in profile:
+        raise HTTPError(404, 'Profile was sampled, fetch .collapsed.')
+    response.content_type = 'application/octet-stream'
+    response.set_header('Content-Disposition',
+                        'attachment; filename=%s.pstats' % profile_id)
+    return profile['pstats']
+
+
+@route('/admin/profiles/<profile_id>.txt')
+def profile_text(profile_id):
+    profile = _profile(profile_id)
+    if 'pstats' not in profile:
+        raise HTTPError(404, 'Profile was sampled, fetch .collapsed.')
+    out = io.StringIO()
+    stats = pstats.Stats(stream=out)
+    stats.stats = marshal.loads(profile['pstats'])
+    stats.get_top_level_stats()
+    stats.sort_stats('cumulative').print_stats(60)
+    response.content_type = 'text/plain; charset=utf-8'
+    return out.getvalue()
+
+
+@route('/admin/profiles/<profile_id>.collapsed')
+def profile_collapsed(profile_id):
+    profile = _profile(profile_id)
+    if 'collapsed' not in profile:
+        raise HTTPError(404, 'Profile was deterministic, fetch .pstats.')
+    response.content_type = 'text/plain; charset=utf-8'
+    return profile['collapsed']
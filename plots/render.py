@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Thread-safe figure creation and output for the plot packages.
+
+Figures are built on matplotlib.figure.Figure with their own Agg canvas so a
+render never touches the pyplot figure manager. The seaborn style is
+installed once at import; renders that use it only read rcParams and can run
+concurrently. A render asking for a different style gets it through an
+rc_context and runs alone while it holds it. Mathtext parsing, which keeps
+its state on a shared parser, is serialized.
+"""
+from __future__ import division, print_function
+
+import os
+import threading
+from contextlib import contextmanager
+from io import BytesIO
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.image
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import Collection
+from matplotlib.figure import Figure
+from matplotlib.lines import Line2D
+from matplotlib.patches import Patch
+from matplotlib import mathtext
+from cycler import cycler
+import seaborn as sns
+from bottle import HTTPError
+
+from . import metrics
+
+STYLE = dict(style='ticks', font='Arial', context='talk', font_scale=1.2)
+
+# chart_type: (format, dpi, savefig options)
+# previews favour encode speed, the 300 dpi download favours size
+OUTPUTS = {'pdf': ('pdf', 300, {}),
+           'svg': ('svg', 300, {}),
+           'svgz': ('svgz', 300, {}),
+           'pngat': ('png', 300, {'pil_kwargs': {'compress_level': 9}}),
+           'png': ('png', 100, {'pil_kwargs': {'compress_level': 1}}),
+           'webp': ('webp', 100, {'pil_kwargs': {'lossless': True,
+                                                 'method': 0}})}
+
+# formats save_figure encodes from the Agg buffer
+RASTER = ('png', 'webp')
+
+# in vector formats artists with more points, markers or vertices than
+# RASTER_ELEMENTS are drawn as an image at the output dpi, and a file over
+# VECTOR_MAX_MB is drawn again with all of its data rasterized
+RASTER_ELEMENTS = int(os.environ.get('PLOT_RASTER_ELEMENTS', 20000))
+VECTOR_MAX_MB = float(os.environ.get('PLOT_VECTOR_MAX_MB', 10))
+
+MIME = {'pdf': 'application/pdf',
+        'svg': 'image/svg+xml',
+        # a gzip file to save, not an svg for the browser to decompress
+        'svgz': 'application/gzip',
+        'png': 'image/png',
+        'webp': 'image/webp'}
+
+# chart_type of the inline preview, 'png' or 'webp'
+PREVIEW = os.environ.get('PLOT_PREVIEW', 'png')
+
+
+def _serialize_mathtext():
+    'Guard MathTextParser.parse, concurrent parses corrupt each other'
+    parse = mathtext.MathTextParser.parse
+    if getattr(parse, 'serialized', False):
+        return
+    lock = threading.RLock()
+
+    def locked_parse(self, *args, **kwargs):
+        with lock:
+            return parse(self, *args, **kwargs)
+    locked_parse.serialized = True
+    mathtext.MathTextParser.parse = locked_parse
+
+
+_serialize_mathtext()
+
+
+class StyleLock(object):
+    """
+    Reader/writer lock for rcParams. Renders with the installed style share
+    it, a render with its own style waits for them and holds it alone.
+    """
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._shared = 0
+        self._exclusive = False
+
+    @contextmanager
+    def shared(self):
+        with self._cond:
+            while self._exclusive:
+                self._cond.wait()
+            self._shared += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._shared -= 1
+                self._cond.notify_all()
+
+    @contextmanager
+    def exclusive(self):
+        with self._cond:
+            while self._exclusive or self._shared:
+                self._cond.wait()
+            self._exclusive = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._exclusive = False
+                self._cond.notify_all()
+
+
+style_lock = StyleLock()
+_installed = None
+
+
+def style_rc(style='ticks', font='Arial', context='talk', font_scale=1.2):
+    'rcParams equivalent to sns.set(...) with SVG text kept as text'
+    rc = {}
+    rc.update(sns.axes_style(style, rc={'font.family': font}))
+    rc.update(sns.plotting_context(context, font_scale))
+    rc['axes.prop_cycle'] = cycler('color', sns.color_palette('deep'))
+    rc['svg.fonttype'] = 'none'
+    return rc
+
+
+def install_style(**style):
+    'Make style the process wide default, call before serving requests'
+    global _installed
+    style = dict(STYLE, **style)
+    with style_lock.exclusive():
+        matplotlib.rcParams.update(style_rc(**style))
+        _installed = style
+
+
+@contextmanager
+def style_context(**style):
+    'Render inside this so the figure sees the requested style'
+    style = dict(STYLE, **style)
+    if style == _installed:
+        with style_lock.shared():
+            yield
+    else:
+        with style_lock.exclusive(), matplotlib.rc_context(style_rc(**style)):
+            yield
+
+
+def new_figure(figsize=(6, 6), dpi=None, **kwargs):
+    'A figure with its own Agg canvas, unknown to pyplot'
+    fig = Figure(figsize=figsize, dpi=dpi, **kwargs)
+    FigureCanvasAgg(fig)
+    return fig
+
+
+def mime(chart_type):
+    return MIME[OUTPUTS.get(chart_type, OUTPUTS['png'])[0]]
+
+
+def encode(fig, chart_type='png'):
+    """
+    Encode what the Agg canvas of fig holds for a raster chart_type, as
+    savefig would. The canvas must have been drawn at the output dpi.
+    """
+    type_form, dpi, options = OUTPUTS.get(chart_type, OUTPUTS['png'])
+    outs = BytesIO()
+    with metrics.stage('savefig'):
+        matplotlib.image.imsave(outs, fig.canvas.buffer_rgba(),
+                                format=type_form, origin='upper', dpi=dpi,
+                                **options)
+    outs.seek(0)
+    return outs
+
+
+def elements(artist):
+    'Points, markers or path vertices artist writes to a vector file'
+    if isinstance(artist, Line2D):
+        return len(artist.get_xdata())
+    if isinstance(artist, Collection):
+        return max(len(artist.get_offsets()),
+                   sum(len(path.vertices) for path in artist.get_paths()))
+    if isinstance(artist, Patch):
+        return len(artist.get_path().vertices)
+    return 0
+
+
+def rasterize(fig, limit=RASTER_ELEMENTS):
+    """
+    Rasterize the data artists of fig with more than limit elements, which
+    leaves text, ticks, spines and light curves as vectors. Returns how many
+    were rasterized.
+    """
+    count = 0
+    for ax in fig.axes:
+        frame = set(ax.spines.values())
+        frame.add(ax.patch)
+        for artist in ax.get_children():
+            if artist not in frame and elements(artist) > limit:
+                artist.set_rasterized(True)
+                count += 1
+    return count
+
+
+def save_figure(fig, chart_type='png'):
+    """
+    Draw fig and encode it for chart_type. Returns the BytesIO rewound to
+    the start: bottle streams it to the client as a file and previews
+    base64 encode its getbuffer(), so the image is never copied whole.
+    Raster formats are drawn once at the output dpi and the canvas buffer
+    encoded as savefig would. Vector formats are drawn by savefig with heavy
+    artists rasterized, and 422 if over VECTOR_MAX_MB regardless.
+    """
+    type_form, dpi, options = OUTPUTS.get(chart_type, OUTPUTS['png'])
+    metrics.label(format=chart_type)
+    if type_form in RASTER:
+        with metrics.stage('draw'):
+            fig.set_dpi(dpi)
+            fig.canvas.draw()
+        return encode(fig, chart_type)
+    for limit in (RASTER_ELEMENTS, 0):
+        rasterize(fig, limit)
+        outs = BytesIO()
+        with metrics.stage('savefig'):
+            fig.savefig(outs, dpi=dpi, format=type_form, **options)
+        if outs.tell() <= VECTOR_MAX_MB * 2**20:
+            outs.seek(0)
+            return outs
+    raise HTTPError(422, 'The %s would be larger than %g MB even with its '
+                    'data drawn as an image, download the PNG instead.' %
+                    (type_form.upper(), VECTOR_MAX_MB))
+
+
+install_style()
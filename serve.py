@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prefork production server for the plotter, standard library only.
+
+    python serve.py --host 0.0.0.0 --port 8080 --workers 4
+
+The parent imports the app and warms up every plot (PLOT_PRELOAD and
+PLOT_WARMUP default to eager here), moves what it allocated out of the
+garbage collector's way with gc.freeze() and forks the workers, which share
+those pages copy on write.
+
+The parent alone accepts connections and passes each to a worker over a
+Unix socket, always the same worker for the same client address (or the
+first X-Forwarded-For address with --forwarded behind a proxy): stored
+datasets, async jobs and live series are kept per process, so the requests
+that follow a preview have to reach the worker that made it. A worker
+serves every connection on a thread of its own.
+
+After --max-requests requests (plus up to a tenth more at random, so the
+workers do not all go at once) or once its resident set passes
+--max-rss-mb, a worker asks to retire, as soon as every async job it holds
+has been polled, abandoned or has expired (jobs.pending()). The parent
+forks its replacement, sends it the connections from then on and closes
+the old worker's socket; the old worker finishes what it was sent and
+exits. The listening socket is never left unserved, so no request is
+dropped. The worker's stored datasets and live CE series go with it: their
+handles then ask for the data again or answer 404. SIGHUP retires every worker
+the same way, SIGTERM and SIGINT stop accepting, let the workers finish and
+exit.
+"""
+from __future__ import division, print_function
+
+import argparse
+import gc
+import os
+import random
+import re
+import select
+import selectors
+import signal
+import socket
+import sys
+import threading
+import time
+import zlib
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler
+
+WORKERS = int(os.environ.get('PLOT_SERVE_WORKERS', os.cpu_count() or 1))
+MAX_REQUESTS = int(os.environ.get('PLOT_MAX_REQUESTS', 1000))
+MAX_RSS_MB = float(os.environ.get('PLOT_MAX_RSS_MB', 1024))
+JITTER = 0.1
+# how long the parent waits for a request's first bytes to read its
+# X-Forwarded-For header, before routing by the peer address instead
+PEEK_WAIT = 0.01
+# seconds between checks for async jobs left to poll before retiring
+RETIRE_POLL = 1
+FORWARDED_FOR = re.compile(rb'\r\nX-Forwarded-For:[ \t]*([^,\r]+)', re.I)
+
+
+class Server(ThreadingMixIn, WSGIServer):
+    'Serves the connections the parent passes, one thread each'
+    daemon_threads = False
+    # server_close() waits for the requests in flight
+    block_on_close = True
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class Worker(object):
+    'A forked worker process and the parent end of its Unix socket'
+    def __init__(self, pid, channel):
+        self.pid = pid
+        self.channel = channel
+
+
+def affinity(conn, addr, forwarded):
+    'The client address that picks the worker of a connection'
+    if forwarded and select.select([conn], [], [], PEEK_WAIT)[0]:
+        try:
+            match = FORWARDED_FOR.search(conn.recv(8192, socket.MSG_PEEK))
+        except OSError:
+            match = None
+        if match:
+            return match.group(1).strip()
+    return addr[0].encode()
+
+
+def serve(channel, server, app, max_requests, max_rss):
+    'The loop of a worker, until the parent closes its socket'
+    from plots import jobs, memory
+    for signum in (signal.SIGINT, signal.SIGTERM, signal.SIGHUP):
+        # the parent stops the worker by closing its socket
+        signal.signal(signum, signal.SIG_IGN)
+    limit = max_requests + random.randint(0, int(max_requests*JITTER))
+    served = [0]
+    retiring = [False]
+
+    def retire():
+        # a client polling a job has to find it here
+        while jobs.pending():
+            time.sleep(RETIRE_POLL)
+        try:
+            channel.send(b'r')
+        except OSError:
+            pass
+
+    def counted(environ, start_response):
+        try:
+            return app(environ, start_response)
+        finally:
+            served[0] += 1
+            if not retiring[0] and (0 < limit <= served[0] or
+                                    0 < max_rss < memory.rss()):
+                retiring[0] = True
+                threading.Thread(target=retire, name='retire',
+                                 daemon=True).start()
+
+    server.set_app(counted)
+    while True:
+        try:
+            msg, fds, _, _ = socket.recv_fds(channel, 1, 1)
+        except OSError:
+            break
+        if not msg:
+            break
+        for fd in fds:
+            conn = socket.socket(fileno=fd)
+            try:
+                addr = conn.getpeername()
+            except OSError:
+                conn.close()
+                continue
+            server.process_request(conn, addr)
+    server.server_close()
+
+
+def spawn(listener, server, app, args, inherited):
+    """
+    Fork a worker, the parent gets its Worker. The child closes the sockets
+    in inherited, which are the parent's to use or close.
+    """
+    parent_end, child_end = socket.socketpair(socket.AF_UNIX,
+                                              socket.SOCK_STREAM)
+    pid = os.fork()
+    if pid:
+        child_end.close()
+        return Worker(pid, parent_end)
+    code = 0
+    try:
+        listener.close()
+        parent_end.close()
+        for sock in inherited:
+            sock.close()
+        serve(child_end, server, app, args.max_requests,
+              args.max_rss_mb * 2**20)
+    except BaseException:
+        import traceback
+        traceback.print_exc()
+        code = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(code)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=WORKERS)
+    parser.add_argument('--max-requests', type=int, default=MAX_REQUESTS,
+                        help='requests before a worker is replaced, 0 never')
+    parser.add_argument('--max-rss-mb', type=float, default=MAX_RSS_MB,
+                        help='resident MB after which a worker is replaced, '
+                        '0 never')
+    parser.add_argument('--forwarded', action='store_true',
+                        help='pick workers by X-Forwarded-For, behind a '
+                        'proxy')
+    parser.add_argument('--quiet', action='store_true',
+                        help='no access log')
+    args = parser.parse_args()
+    workers = max(1, args.workers)
+
+    # import and warm up once, for the workers to share
+    os.environ.setdefault('PLOT_PRELOAD', 'eager')
+    os.environ.setdefault('PLOT_WARMUP', 'eager')
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    sys.path.insert(0, os.getcwd())
+    import bottle
+    import bottle_plot  # noqa: F401, registers the routes
+    app = bottle.default_app()
+
+    handler = QuietHandler if args.quiet else WSGIRequestHandler
+    listener = socket.create_server((args.host, args.port), backlog=128)
+    host, port = listener.getsockname()[:2]
+    # the workers' server only hands connections to handler threads
+    server = Server((host, port), handler, bind_and_activate=False)
+    server.socket.close()
+    server.server_name, server.server_port = socket.getfqdn(host), port
+    server.setup_environ()
+    gc.collect()
+    gc.freeze()
+
+    state = {'stop': False, 'reload': False}
+
+    def stop(signum, frame):
+        state['stop'] = True
+
+    def reload(signum, frame):
+        state['reload'] = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGHUP, reload)
+
+    slots = []
+    retired = []
+    events = selectors.DefaultSelector()
+    events.register(listener, selectors.EVENT_READ)
+
+    def start(conn=None):
+        inherited = [w.channel for w in slots]
+        if conn is not None:
+            # a client's connection must close when the parent closes it
+            inherited.append(conn)
+        worker = spawn(listener, server, app, args, inherited)
+        events.register(worker.channel, selectors.EVENT_READ, worker)
+        return worker
+
+    def replace(i, conn=None):
+        'Fork a replacement of slots[i] and let the old worker finish'
+        old = slots[i]
+        slots[i] = start(conn)
+        events.unregister(old.channel)
+        old.channel.close()
+        retired.append(old)
+
+    def reap():
+        while retired:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if not pid:
+                return
+            retired[:] = [w for w in retired if w.pid != pid]
+
+    for _ in range(workers):
+        slots.append(start())
+    print('Serving on http://%s:%i with %i workers' % (host, port, workers))
+    sys.stdout.flush()
+    while not state['stop']:
+        if state['reload']:
+            state['reload'] = False
+            for i in range(len(slots)):
+                replace(i)
+        for key, _ in events.select(timeout=0.5):
+            if key.fileobj is listener:
+                try:
+                    conn, addr = listener.accept()
+                except OSError:
+                    continue
+                with conn:
+                    key = affinity(conn, addr, args.forwarded)
+                    i = zlib.crc32(key) % len(slots)
+                    try:
+                        socket.send_fds(slots[i].channel, [b'c'],
+                                        [conn.fileno()])
+                    except OSError:
+                        replace(i, conn)
+                        socket.send_fds(slots[i].channel, [b'c'],
+                                        [conn.fileno()])
+            else:
+                # b'r' asks to retire, nothing at all means the worker died
+                i = slots.index(key.data)
+                try:
+                    key.fileobj.recv(1)
+                except OSError:
+                    pass
+                replace(i)
+        reap()
+
+    listener.close()
+    for worker in slots:
+        worker.channel.close()
+    retired.extend(slots)
+    del slots[:]
+    while retired:
+        try:
+            pid, _ = os.waitpid(-1, 0)
+        except ChildProcessError:
+            break
+        retired[:] = [w for w in retired if w.pid != pid]
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
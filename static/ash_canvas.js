@@ -0,0 +1,162 @@
+/*
+ * Draws the ASH preview on a canvas from the geometry the server embeds as
+ * ash_geometry (see geometry() in plots/ash_plot/ash_api.py), laid out the
+ * way ash_png draws it with matplotlib. Changing the colors or the label in
+ * the form redraws it without asking the server again.
+ */
+(function () {
+    'use strict';
+
+    var FONT = "Arial, 'Liberation Sans', 'Helvetica', sans-serif";
+    var INK = '#262626';
+    var STEPS = [1, 2, 2.5, 5, 10];
+
+    // tick spacing like matplotlib's MaxNLocator
+    function ticks(lo, hi, most) {
+        var raw = (hi - lo) / most;
+        var mag = Math.pow(10, Math.floor(Math.log(raw) / Math.LN10));
+        var step = mag * 10;
+        for (var i = 0; i < STEPS.length; i++) {
+            if (STEPS[i] * mag >= raw) {
+                step = STEPS[i] * mag;
+                break;
+            }
+        }
+        var out = [];
+        for (var t = Math.ceil(lo / step) * step; t <= hi + step * 1e-9; t += step) {
+            out.push(Math.abs(t) < step * 1e-9 ? 0 : t);
+        }
+        return {values: out, step: step};
+    }
+
+    function label(value, step) {
+        var digits = Math.max(0, -Math.floor(Math.log(step) / Math.LN10 + 1e-9));
+        if (step === 2.5 * Math.pow(10, -digits)) {
+            digits += 1;
+        }
+        return value.toFixed(Math.min(digits, 10)).replace('-', '−');
+    }
+
+    function draw(canvas, g, color, fillColor, xlabel) {
+        var ratio = window.devicePixelRatio || 1;
+        var W = 600, H = 600;
+        canvas.width = W * ratio;
+        canvas.height = H * ratio;
+        canvas.style.width = W + 'px';
+        canvas.style.height = H + 'px';
+        var ctx = canvas.getContext('2d');
+        ctx.setTransform(ratio, 0, 0, ratio, 0, 0);
+
+        var left = 22, right = W - 22, top = H * 0.05;
+        var bottom = H - (xlabel ? 80 : 52);
+        var ymax = g.ymax, ymin = -ymax * 0.15;
+        function X(x) {
+            return left + (x - g.xmin) / (g.xmax - g.xmin) * (right - left);
+        }
+        function Y(y) {
+            return bottom - (y - ymin) / (ymax - ymin) * (bottom - top);
+        }
+
+        ctx.fillStyle = '#fff';
+        ctx.fillRect(0, 0, W, H);
+        ctx.save();
+        ctx.beginPath();
+        ctx.rect(left, top, right - left, bottom - top);
+        ctx.clip();
+
+        // every shifted histogram at 1/shift_num opacity
+        ctx.fillStyle = fillColor;
+        ctx.globalAlpha = 1 / g.shift_num;
+        var y0 = Y(0);
+        for (var s = 0; s < g.shift_num; s++) {
+            var start = g.hist_min + s * g.shift;
+            ctx.beginPath();
+            for (var b = 0; b < g.bins; b++) {
+                var h = g.infill[s * g.bins + b];
+                if (h > 0) {
+                    var x0 = X(start + b * g.bin_width);
+                    var x1 = X(start + (b + 1) * g.bin_width);
+                    ctx.rect(x0, Y(h), x1 - x0, y0 - Y(h));
+                }
+            }
+            ctx.fill();
+        }
+        ctx.globalAlpha = 1;
+
+        // density
+        ctx.strokeStyle = color;
+        ctx.lineWidth = 2.8;
+        ctx.lineJoin = 'round';
+        ctx.beginPath();
+        for (var i = 0; i < g.mesh.length; i++) {
+            ctx[i ? 'lineTo' : 'moveTo'](X(g.mesh[i]), Y(g.den[i]));
+        }
+        ctx.stroke();
+
+        // rug
+        var rug = Y(-(g.ymax - g.ymin) * 0.07);
+        ctx.lineWidth = 2.8;
+        ctx.lineCap = 'butt';
+        ctx.beginPath();
+        for (var r = 0; r < g.rug.length; r++) {
+            var x = Math.round(X(g.rug[r]));
+            ctx.moveTo(x, rug - 14);
+            ctx.lineTo(x, rug + 14);
+        }
+        ctx.stroke();
+
+        // statistics
+        ctx.fillStyle = color;
+        ctx.font = '22px ' + FONT;
+        ctx.textAlign = 'left';
+        ctx.textBaseline = 'top';
+        var lines = g.stats.split('\n');
+        for (var l = 0; l < lines.length; l++) {
+            ctx.fillText(lines[l], left + 0.04 * (right - left),
+                         top + 0.04 * (bottom - top) + l * 26);
+        }
+        ctx.restore();
+
+        // frame, x ticks and labels
+        ctx.strokeStyle = INK;
+        ctx.lineWidth = 1.5;
+        ctx.strokeRect(left, top, right - left, bottom - top);
+        var t = ticks(g.xmin, g.xmax, 6);
+        ctx.fillStyle = INK;
+        ctx.font = '16px ' + FONT;
+        ctx.textAlign = 'center';
+        ctx.textBaseline = 'top';
+        ctx.beginPath();
+        for (var k = 0; k < t.values.length; k++) {
+            var tx = Math.round(X(t.values[k])) + 0.5;
+            ctx.moveTo(tx, bottom);
+            ctx.lineTo(tx, bottom + 7);
+            ctx.fillText(label(t.values[k], t.step), tx, bottom + 11);
+        }
+        ctx.stroke();
+        if (xlabel) {
+            ctx.font = '17px ' + FONT;
+            ctx.fillText(xlabel, (left + right) / 2, bottom + 40);
+        }
+    }
+
+    var canvas = document.getElementById('ash_canvas');
+    var g = window.ash_geometry;
+    if (!canvas || !g) {
+        return;
+    }
+    function input(id, fallback) {
+        var el = document.getElementById(id);
+        return el ? el : {value: fallback, addEventListener: function () {}};
+    }
+    var color = input('color', g.color);
+    var fill = input('fill_color', g.fill_color);
+    var xlabel = input('xlabel', g.xlabel);
+    function redraw() {
+        draw(canvas, g, color.value, fill.value, xlabel.value);
+    }
+    color.addEventListener('input', redraw);
+    fill.addEventListener('input', redraw);
+    xlabel.addEventListener('input', redraw);
+    draw(canvas, g, g.color, g.fill_color, g.xlabel);
+})();
@@ -0,0 +1,63 @@
+/*
+ * Swaps a quick sketch of a plot for the full render once it is ready. The
+ * image with id "progressive" carries the render job to poll as data-poll
+ * (see jobs.background() in plots/jobs.py); the job answers 202 while it
+ * runs and the image when done. A job that is gone (404, e.g. its server
+ * worker was replaced) is made up for by posting the form named by
+ * data-form again with "full" set, for a plain render without the sketch.
+ */
+(function () {
+    'use strict';
+
+    var img = document.getElementById('progressive');
+    var note = document.getElementById('progressive_note');
+    var form = img && document.getElementById(img.getAttribute('data-form'));
+
+    function done(text) {
+        if (note) {
+            if (text) {
+                note.textContent = text;
+            } else {
+                note.parentNode.removeChild(note);
+            }
+        }
+    }
+
+    function rerender() {
+        var full = document.createElement('input');
+        full.type = 'hidden';
+        full.name = 'full';
+        full.value = '1';
+        form.appendChild(full);
+        done('The full plot is being drawn again...');
+        form.submit();
+    }
+
+    function poll() {
+        fetch(img.getAttribute('data-poll'), {cache: 'no-store'}).then(function (reply) {
+            if (reply.status === 202) {
+                var wait = parseFloat(reply.headers.get('Retry-After')) || 1;
+                setTimeout(poll, wait * 1000);
+                return;
+            }
+            if (reply.status === 404 && form) {
+                rerender();
+                return;
+            }
+            if (!reply.ok) {
+                done('The full plot could not be drawn, the downloads still can.');
+                return;
+            }
+            return reply.blob().then(function (blob) {
+                img.src = URL.createObjectURL(blob);
+                done();
+            });
+        }).catch(function () {
+            done('The full plot could not be fetched, the downloads still can.');
+        });
+    }
+
+    if (img && window.fetch) {
+        poll();
+    }
+}());
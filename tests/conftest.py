@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+import io
+import os
+import sys
+from urllib.parse import urlencode
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+import matplotlib
+matplotlib.use('Agg')
+
+import pytest
+
+
+@pytest.fixture(scope='session')
+def app():
+    import bottle
+    import bottle_plot  # noqa: F401, registers the routes
+    # header.tpl is found from the top directory, wherever pytest runs
+    bottle.TEMPLATE_PATH.append(root)
+    return bottle.default_app()
+
+
+@pytest.fixture
+def post(app):
+    'post(path, form) to the app, returns (status code, headers, body)'
+    def post(path, form):
+        body = urlencode(form).encode()
+        environ = {'REQUEST_METHOD': 'POST', 'PATH_INFO': path,
+                   'QUERY_STRING': '', 'SCRIPT_NAME': '',
+                   'CONTENT_TYPE': 'application/x-www-form-urlencoded',
+                   'CONTENT_LENGTH': str(len(body)),
+                   'wsgi.input': io.BytesIO(body), 'wsgi.errors': sys.stderr,
+                   'wsgi.url_scheme': 'http', 'SERVER_NAME': 'localhost',
+                   'SERVER_PORT': '80'}
+        reply = {}
+
+        def start_response(status, headers, exc_info=None):
+            reply['status'], reply['headers'] = int(status[:3]), dict(headers)
+        chunks = app(environ, start_response)
+        data = b''.join(c if isinstance(c, bytes) else c.encode() for c in chunks)
+        if hasattr(chunks, 'close'):
+            chunks.close()
+        return reply['status'], reply['headers'], data.decode('utf-8', 'replace')
+    return post
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+binning counts what np.histogram does, on any number of threads.
+"""
+import numpy as np
+import pytest
+
+from plots.ash_plot.ASH import binning
+
+
+@pytest.fixture(autouse=True)
+def small_chunks(monkeypatch):
+    # so a few thousand points are split between the threads
+    monkeypatch.setattr(binning, 'MIN_CHUNK', 256)
+    monkeypatch.setattr(binning, 'BLOCK', 100)
+
+
+def samples():
+    rng = np.random.default_rng(3)
+    yield rng.normal(size=5000)
+    # every point on an edge
+    yield np.repeat(np.arange(11.), 300)/10
+    yield np.r_[rng.standard_cauchy(3000), 1e300, -1e300]
+
+
+@pytest.mark.parametrize('threads', [1, 3])
+@pytest.mark.parametrize('density', [False, True])
+def test_histogram(threads, density):
+    for data in samples():
+        for bins, range_ in ((10, (0, 1)), (37, (-2.5, 1.3)), (5, (1, 1))):
+            counts, edges = binning.histogram(data, bins, range_, density, threads)
+            expected, expected_edges = np.histogram(data, bins, range_, density=density)
+            np.testing.assert_array_equal(edges, expected_edges)
+            np.testing.assert_allclose(counts, expected, rtol=1e-12)
+
+
+def test_histogram_empty():
+    counts, _ = binning.histogram([], 4, (0, 1))
+    np.testing.assert_array_equal(counts, np.zeros(4))
+
+
+@pytest.mark.parametrize('threads', [1, 3])
+def test_shifted(threads):
+    MIN, bin_width, bins, shift_num = -3.2, 0.4, 17, 8
+    SHIFT = bin_width/shift_num
+    MAX = MIN + (bins+1)*bin_width
+    for data in samples():
+        counts = binning.shifted(data, MIN, MAX, SHIFT, bin_width, bins, shift_num, threads=threads)
+        for i, row in enumerate(counts):
+            range_ = (MIN+i*SHIFT, MAX+i*SHIFT-bin_width)
+            np.testing.assert_array_equal(row, np.histogram(data, bins, range_)[0])
+
+
+@pytest.mark.parametrize('threads', [1, 3])
+def test_between(threads):
+    for data in samples():
+        edges = np.unique(np.r_[np.quantile(data, np.linspace(0, 1, 20)), 0.5])
+        expected = np.bincount(np.searchsorted(edges, data, side='right'), minlength=len(edges)+1)
+        np.testing.assert_array_equal(binning.between(data, edges, threads), expected)
+    np.testing.assert_array_equal(binning.between([], [0., 1.]), np.zeros(3))
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+ChunkedAsh gives the ash of the data in memory, however small its chunks.
+"""
+import numpy as np
+import pytest
+
+from plots.ash_plot.ASH import ash as ash_module
+from plots.ash_plot.ASH import chunked
+from plots.ash_plot.ASH.ash import ash
+from plots.ash_plot.ASH.chunked import ChunkedAsh
+
+
+@pytest.fixture
+def data():
+    return np.random.default_rng(2).normal(size=20000)
+
+
+def assert_same_ash(obj, expected):
+    assert obj.bin_num == expected.bin_num
+    np.testing.assert_allclose(obj.ash_mesh, expected.ash_mesh, atol=1e-9*expected.bin_width)
+    np.testing.assert_allclose(obj.ash_den, expected.ash_den, rtol=1e-9)
+    for name in ('mean', 'sigma', 'unc', 'bin_width'):
+        assert getattr(obj, name) == pytest.approx(getattr(expected, name), rel=1e-9)
+    # binned on the fine bins, so close rather than equal
+    kde_den = np.interp(expected.kde_mesh, obj.kde_mesh, obj.kde_den)
+    np.testing.assert_allclose(kde_den, expected.kde_den, atol=1e-2*expected.kde_den.max())
+
+
+@pytest.mark.parametrize('memory_mb', [0.05, 256])
+def test_bin_num(data, tmp_path, memory_mb):
+    np.save(tmp_path / 'data.npy', data)
+    obj = ChunkedAsh(str(tmp_path / 'data.npy'), bin_num=60, memory_mb=memory_mb)
+    assert_same_ash(obj, ash(data, bin_num=60))
+
+
+@pytest.mark.parametrize('memory_mb', [0.05, 256])
+def test_scott(data, tmp_path, memory_mb):
+    np.save(tmp_path / 'data.npy', data)
+    obj = ChunkedAsh(str(tmp_path / 'data.npy'), memory_mb=memory_mb)
+    assert_same_ash(obj, ash(data, force_scott=True))
+
+
+def test_raw_file(data, tmp_path):
+    data.astype('<f4').tofile(tmp_path / 'data.f32')
+    obj = ChunkedAsh(str(tmp_path / 'data.f32'), bin_num=60, dtype='<f4', memory_mb=0.05)
+    assert_same_ash(obj, ash(data.astype('<f4').astype(float), bin_num=60))
+
+
+def test_sparse(data, tmp_path, monkeypatch):
+    np.save(tmp_path / 'data.npy', data)
+    monkeypatch.setattr(ash_module, 'MESH_LIMIT', 0)
+    monkeypatch.setattr(chunked, 'MESH_LIMIT', 0)
+    obj = ChunkedAsh(str(tmp_path / 'data.npy'), bin_num=60, memory_mb=0.05)
+    expected = ash(data, bin_num=60)
+    assert obj.sparse is not None and expected.sparse is not None
+    assert_same_ash(obj, expected)
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+"""
+Plots rendered on a thread pool match the same plots rendered serially byte
+for byte. benchmarks/concurrent_render.py runs the same check on every plot
+at load.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from plots import form_valid as fv
+from plots.ash_plot.ash_plot import ash_png
+from plots.ce_plot.ce_plot import ce_png, battery_data, cycle_data
+from plots.example_plot.example_plot import make_plot, example_data
+
+
+def renders():
+    ash_data = np.random.default_rng(0).normal(size=500)
+    ce_x, ce_y = fv.data_split(cycle_data), fv.data_split(battery_data)
+    ex_data = fv.data_split(example_data)
+    for color in ('#4C72B0', '#D95319'):
+        yield ash_png, (ash_data, 'x', 'png', color, '#92B2E7')
+        yield ce_png, (ce_x, ce_y, 'Cycle', 'CE', 'png', color)
+        yield make_plot, (ex_data, ex_data, 'x', 'y', 'png', color)
+
+
+def test_threaded_renders_match_serial():
+    work = list(renders())*3
+    serial = [func(*args).getvalue() for func, args in work]
+    with ThreadPoolExecutor(4) as pool:
+        futures = [pool.submit(func, *args) for func, args in work]
+        threaded = [future.result().getvalue() for future in futures]
+    assert threaded == serial
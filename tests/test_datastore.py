@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+The stored dataset round trip of every plot form: the first post stores
+the data and hands back a handle with the data fields blank, and later
+posts of the handle alone plot, download and survive an invalid field.
+"""
+import re
+
+import pytest
+
+from plots import datastore
+from plots.ce_plot.ce_multi import table_data
+
+values = '\n'.join('%.2f' % (i % 7 + i*0.01) for i in range(60))
+cycles = '\n'.join(str(i) for i in range(60))
+PLOTS = [('/ash', {'data': values, 'xlabel': 'x', 'color': '#4C72B0',
+                   'fill_color': '#92B2E7'}, ('data',), 'color'),
+         ('/ce', {'x_data': cycles, 'y_data': values, 'x_label': 'Cycle',
+                  'y_label': 'CE', 'color': '#4C72B0'},
+          ('x_data', 'y_data'), 'color'),
+         ('/example', {'x_data': cycles, 'y_data': values, 'x_label': 'x',
+                       'y_label': 'y', 'color': '#4C72B0'},
+          ('x_data', 'y_data'), 'color'),
+         ('/ce_multi', {'table': table_data, 'x_label': 'Cycle',
+                        'y_label': 'CE', 'cmap': 'viridis'},
+          ('table',), 'cmap')]
+
+
+def textarea(page, name):
+    return re.search(r'<textarea[^>]*name="%s"[^>]*>' % name, page).group(0)
+
+
+def handle(page):
+    return re.search(r'name="dataset" value="(\w*)"', page).group(1)
+
+
+def stored(form, fields, dataset):
+    return dict(form, dataset=dataset, **dict((name, '') for name in fields))
+
+
+@pytest.mark.parametrize('path, form, fields, style', PLOTS)
+def test_round_trip(post, path, form, fields, style):
+    status, _, page = post(path, dict(form, filled='good'))
+    assert status == 200 and 'base64,' in page
+    dataset = handle(page)
+    assert dataset
+    for name in fields:
+        # a browser would refuse to submit a blank required field
+        assert 'required' not in textarea(page, name)
+        assert 'sent before' in textarea(page, name)
+
+    status, _, page = post(path, stored(dict(form, filled='good'), fields, dataset))
+    assert status == 200 and 'base64,' in page and handle(page) == dataset
+
+    status, headers, _ = post(path, stored(dict(form, filled='good', png_download='1'),
+                                           fields, dataset))
+    assert status == 200 and headers['Content-Type'] == 'image/png'
+
+
+@pytest.mark.parametrize('path, form, fields, style', PLOTS)
+def test_invalid_field_keeps_handle(post, path, form, fields, style):
+    dataset = handle(post(path, dict(form, filled='good'))[2])
+    status, _, page = post(path, stored(dict(form, filled='good', **{style: 'nonsense'}),
+                                        fields, dataset))
+    assert status == 200 and 'base64,' not in page
+    assert handle(page) == dataset
+    assert 'required' not in textarea(page, fields[0])
+
+
+@pytest.mark.parametrize('path, form, fields, style', PLOTS)
+def test_expired_handle(post, path, form, fields, style):
+    status, _, page = post(path, stored(dict(form, filled='good'), fields, '0'*64))
+    assert status == 200 and 'base64,' not in page
+    assert datastore.EXPIRED in page
+    assert 'required' in textarea(page, fields[0])
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""
+The memory accounting of PLOT_MEMORY=on does not report a plot request as
+a leak when the same request again finds the caches warm.
+"""
+import tracemalloc
+
+import numpy as np
+import pytest
+
+from plots import memory
+
+
+@pytest.fixture
+def accounting(app, monkeypatch):
+    monkeypatch.setattr(memory, 'ENABLED', True)
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    # plugins are applied again, memory's now wrapping the plot routes
+    app.reset()
+    yield
+    app.reset()
+    if started:
+        tracemalloc.stop()
+
+
+def test_repeated_ash_is_not_a_leak(accounting, post):
+    data = '\n'.join('%.6f' % v for v in np.random.default_rng(5).normal(size=200))
+    form = {'filled': 'good', 'data': data, 'xlabel': 'x', 'color': '#4C72B0',
+            'fill_color': '#92B2E7'}
+    # the first pays for imports and fills the caches
+    assert post('/ash', form)[0] == 200
+    requests, leaks, kept = (memory._totals['requests'], memory._totals['leaks'],
+                             memory._totals['net_bytes'])
+    for _ in range(2):
+        assert post('/ash', form)[0] == 200
+    assert memory._totals['requests'] == requests + 2
+    assert memory._totals['leaks'] == leaks
+    assert memory._totals['net_bytes'] - kept < 2*memory.LEAK_BYTES
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+"""
+Work timed outside a request, warm-up and speculative renders, is recorded
+under the same switch as the request timers.
+"""
+import time
+
+import pytest
+
+from plots import metrics
+
+
+@pytest.fixture
+def auto(monkeypatch):
+    monkeypatch.setattr(metrics, 'MODE', 'auto')
+    monkeypatch.setattr(metrics, '_last_scrape', [0])
+    monkeypatch.setattr(metrics, '_histograms', {})
+
+
+def timed_stage():
+    with metrics.stage('kde'):
+        pass
+
+
+def test_detached_off_until_scraped(auto):
+    metrics.detached('warmup').run(timed_stage)
+    assert metrics._histograms == {}
+
+
+def test_detached_after_scrape(auto):
+    metrics._last_scrape[0] = time.time()
+    metrics.detached('warmup').run(timed_stage)
+    assert list(metrics._histograms) == [('kde', 'warmup', '', '')]
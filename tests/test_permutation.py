@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+The permutation KS and Anderson-Darling tests give scipy's statistics, with
+or without quantile cells, and a KS p-value near the exact one.
+"""
+import warnings
+
+import numpy as np
+import pytest
+from scipy import stats
+
+from plots.ash_plot.ASH import permutation
+
+
+@pytest.fixture
+def samples():
+    rng = np.random.default_rng(4)
+    return [rng.normal(0, 1, 30), rng.normal(0.6, 1, 40), rng.normal(0.2, 1, 25)]
+
+
+def anderson_ksamp(samples):
+    with warnings.catch_warnings():
+        # scipy caps its own p-value, only the statistic is compared
+        warnings.simplefilter('ignore')
+        return stats.anderson_ksamp(samples).statistic
+
+
+@pytest.mark.parametrize('decimals', [None, 1])
+def test_two_samples(samples, decimals):
+    a, b = samples[:2] if decimals is None else [np.round(s, decimals) for s in samples[:2]]
+    result = permutation.compare([a, b], 5000)
+    assert result['exact']
+    assert result['ks'] == pytest.approx(stats.ks_2samp(a, b).statistic, rel=1e-12)
+    assert result['ad'] == pytest.approx(anderson_ksamp([a, b]), rel=1e-12)
+    if decimals is None:
+        assert result['ks_p'] == pytest.approx(stats.ks_2samp(a, b, method='exact').pvalue, abs=0.02)
+
+
+def test_three_samples(samples):
+    result = permutation.compare(samples, 500)
+    assert result['exact'] and result['groups'] == 3
+    assert result['ad'] == pytest.approx(anderson_ksamp(samples), rel=1e-12)
+
+
+def test_fine_cells(samples):
+    result = permutation.compare(samples[:2], 500, bins=16)
+    assert not result['exact'] and result['cells'] <= 16
+    assert 0 < result['ks_p'] <= 1 and 0 < result['ad_p'] <= 1
+    # the statistics stay exact, only the p-values are over the cells
+    assert result['ks'] == pytest.approx(stats.ks_2samp(*samples[:2]).statistic, rel=1e-12)
+    assert result['ad'] == pytest.approx(anderson_ksamp(samples[:2]), rel=1e-12)
+    assert result['ks_cells'] <= result['ks']
+
+
+def test_threads(samples):
+    assert permutation.compare(samples, 1000, threads=1) == permutation.compare(samples, 1000, threads=3)
+
+
+@pytest.mark.parametrize('threads', [1, 3])
+def test_check_stops(samples, threads):
+    calls = []
+
+    def check():
+        calls.append(None)
+        if len(calls) == 3:
+            raise RuntimeError('budget spent')
+    with pytest.raises(RuntimeError):
+        permutation.compare(samples, 100*permutation.CHUNK, threads=threads, check=check)
+    assert len(calls) == 3
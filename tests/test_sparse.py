@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""
+SparseBins gives the density and statistics of the dense ash.
+"""
+import numpy as np
+import pytest
+
+from plots.ash_plot.ASH import ash as ash_module
+from plots.ash_plot.ASH import binning
+from plots.ash_plot.ASH.ash import ash
+from plots.ash_plot.ASH.sparse import SparseBins
+
+
+@pytest.fixture
+def data():
+    return np.random.default_rng(1).normal(size=2000)
+
+
+def sparse_bins(obj):
+    return SparseBins.from_data(obj.data, obj.MIN, obj.SHIFT, obj.shift_num, obj.bin_num)
+
+
+def test_density_matches_dense_mesh(data):
+    dense = ash(data, bin_num=40)
+    bins = sparse_bins(dense)
+    den = bins.den(np.arange(bins.N))/(dense.shift_num*len(data)*dense.bin_width)
+    np.testing.assert_allclose(den[den > 0], dense.ash_den, rtol=1e-9)
+
+
+def test_hists_match_shifted(data):
+    dense = ash(data, bin_num=40)
+    counts = binning.shifted(data, dense.MIN, dense.MAX, dense.SHIFT, dense.bin_width,
+                             dense.bin_num+1, dense.shift_num)
+    np.testing.assert_array_equal(sparse_bins(dense).hists(dense.bin_num+1), counts)
+
+
+def test_sparse_ash_statistics(data, monkeypatch):
+    dense = ash(data, bin_num=40)
+    monkeypatch.setattr(ash_module, 'MESH_LIMIT', 0)
+    sparse = ash(data, bin_num=40)
+    assert dense.sparse is None and sparse.sparse is not None
+    for name in ('mean', 'sigma', 'unc'):
+        assert getattr(sparse, name) == pytest.approx(getattr(dense, name), rel=1e-9, abs=1e-12)